@@ -0,0 +1,433 @@
+# colaborativo/actor.py
+# Escritor único por diagrama activo.
+#
+# Cada diagrama caliente lo posee un RoomActor: una tarea asyncio que es la
+# única que toca su estado y procesa los comandos (aplicar ops, leer
+# snapshot, ...) en orden desde una cola. No hay locks de fila en Postgres:
+# el orden lo da la cola y la BD solo recibe los volcados por lotes.
+#
+# Con Redis, un lease (SET NX PX) garantiza que un solo proceso sea dueño de
+# cada sala. Los demás procesos usan un RemoteRoom que reenvía los comandos
+# al canal del dueño por el channel layer. Si el dueño no logra renovar su
+# lease, su actor se detiene (falla los comandos en cola con OwnerUnavailable)
+# antes de que otro proceso pueda tomar la sala; uq_diagram_seq queda como
+# última defensa ante dos escritores.
+import asyncio
+import logging
+import os
+import uuid
+from collections import deque
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from . import metrics, store
+from .graph import IndexedDiagram
+from .rebase import RebaseConflict, rebase_op
+
+logger = logging.getLogger(__name__)
+
+
+class OwnerUnavailable(Exception):
+    """El dueño remoto de la sala no respondió (o perdió el lease)."""
+
+
+# ---- Lease en Redis
+_redis = None
+
+_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+  return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+  return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def leases_enabled() -> bool:
+    return bool(getattr(settings, "REDIS_URL", None))
+
+
+def _redis_client():
+    global _redis
+    if _redis is None:
+        import redis.asyncio
+
+        _redis = redis.asyncio.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _redis
+
+
+def _lease_key(key: str) -> str:
+    return f"diagram-lease:{key}"
+
+
+async def try_lease(key: str, owner: str) -> bool:
+    return bool(
+        await _redis_client().set(
+            _lease_key(key), owner, nx=True, px=settings.DIAGRAM_LEASE_TTL_MS
+        )
+    )
+
+
+async def lease_owner(key: str):
+    return await _redis_client().get(_lease_key(key))
+
+
+async def renew_lease(key: str, owner: str) -> bool:
+    return bool(
+        await _redis_client().eval(
+            _RENEW_SCRIPT, 1, _lease_key(key), owner, settings.DIAGRAM_LEASE_TTL_MS
+        )
+    )
+
+
+async def drop_lease(key: str, owner: str) -> None:
+    await _redis_client().eval(_RELEASE_SCRIPT, 1, _lease_key(key), owner)
+
+
+# ---- Actor local
+_INTERNAL = ("lost", "requeue", "checkpointed")  # comandos que nadie espera
+
+
+def _fail(cmd: str, fut, key: str) -> None:
+    if fut.done():
+        return
+    if cmd in _INTERNAL:
+        fut.set_result(None)
+    else:
+        fut.set_exception(OwnerUnavailable(key))
+
+
+@database_sync_to_async
+def _load(key: str):
+    d = store.get_diagram_by_key(key)
+    replayed = []
+    snapshot, version = store.load_state(d, replayed)
+    return d.pk, snapshot, version, d.snapshot_version, replayed
+
+
+class RoomActor:
+    def __init__(
+        self, key: str, diagram_id, snapshot: dict, version: int, checkpoint_version: int,
+        replayed: list = (),
+    ):
+        self.key = key
+        self.diagram_id = diagram_id
+        # estado indexado; la forma {nodes, links} se arma solo al pedirla
+        self.graph = IndexedDiagram.from_snapshot(snapshot)
+        self._snapshot = None
+        self.version = version
+        self.checkpoint_version = checkpoint_version
+        self.pending = []  # [(seq, user_id, op)] aún no persistidas
+        # últimas ops aplicadas, para responder sync/conflict sin tocar BD;
+        # cubre siempre a pending, que nunca pasa de DIAGRAM_FLUSH_OPS
+        if replayed and replayed[-1]["version"] != version:
+            replayed = ()  # el anillo tiene que terminar en version, sin huecos
+        self.recent = deque(
+            replayed, maxlen=max(settings.DIAGRAM_SYNC_MAX_GAP, settings.DIAGRAM_FLUSH_OPS)
+        )  # arranca con la cola del log que se reprodujo al cargar
+        self.queue = asyncio.Queue()
+        self.task = None
+        self.flush_task = None
+        self.channel = None  # canal para comandos de otros procesos (con lease)
+        self.side_tasks = []
+        self.lost = False  # perdió el lease: ya no acepta comandos
+        self.on_lost = None
+
+    @classmethod
+    async def open(cls, key: str, channel: str = None, on_lost=None) -> "RoomActor":
+        actor = cls(key, *await _load(key))
+        actor.task = asyncio.create_task(actor._run())
+        if channel is not None:
+            actor.channel = channel
+            actor.on_lost = on_lost
+            actor.side_tasks = [
+                asyncio.create_task(actor._serve_remote()),
+                asyncio.create_task(actor._renew()),
+            ]
+        return actor
+
+    async def call(self, cmd: str, *args):
+        if self.lost:
+            raise OwnerUnavailable(self.key)
+        fut = asyncio.get_running_loop().create_future()
+        await self.queue.put((cmd, args, fut))
+        return await fut
+
+    async def close(self) -> None:
+        for t in self.side_tasks:
+            t.cancel()
+        if self.lost:
+            return  # ya se detuvo al perder el lease
+        await self.call("stop")
+        await self.task
+        if self.channel is not None:
+            await drop_lease(self.key, self.channel)
+
+    # -- bucle del actor: único escritor del estado
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        interval = settings.DIAGRAM_FLUSH_INTERVAL
+        next_flush = loop.time() + interval
+        while True:
+            try:
+                cmd, args, fut = await asyncio.wait_for(
+                    self.queue.get(), timeout=max(0, next_flush - loop.time())
+                )
+            except asyncio.TimeoutError:
+                self._start_flush()
+                next_flush = loop.time() + interval
+                continue
+
+            if self.lost:
+                # lo que quedó en cola antes del aviso tampoco se aplica
+                _fail(cmd, fut, self.key)
+                await self._stop_lost()
+                return
+
+            if cmd == "stop":
+                # volcado final antes de soltar la sala
+                if self.flush_task is not None:
+                    await asyncio.gather(self.flush_task, return_exceptions=True)
+                self._start_flush()
+                if self.flush_task is not None:
+                    await asyncio.gather(self.flush_task, return_exceptions=True)
+                while not self.queue.empty():
+                    cmd, args, _ = self.queue.get_nowait()
+                    if cmd in ("requeue", "checkpointed"):
+                        getattr(self, f"_do_{cmd}")(*args)
+                if self.pending:
+                    logger.error(
+                        "Diagrama %s cerrado con %d ops sin volcar", self.key, len(self.pending)
+                    )
+                fut.set_result(None)
+                return
+
+            try:
+                fut.set_result(getattr(self, f"_do_{cmd}")(*args))
+            except Exception as e:
+                fut.set_exception(e)
+            if len(self.pending) >= settings.DIAGRAM_FLUSH_OPS:
+                self._start_flush()
+
+    async def _stop_lost(self) -> None:
+        # Otro proceso puede tener ya la sala: no se aplica nada más. Lo que
+        # estaba en vuelo se deja terminar; lo pendiente no se escribe, porque
+        # el nuevo dueño cargó la BD sin esas ops y chocaría con sus seq.
+        if self.flush_task is not None:
+            await asyncio.gather(self.flush_task, return_exceptions=True)
+        while not self.queue.empty():
+            cmd, _, fut = self.queue.get_nowait()
+            _fail(cmd, fut, self.key)
+        if self.pending:
+            logger.error(
+                "Diagrama %s: lease perdido con %d ops sin volcar", self.key, len(self.pending)
+            )
+        metrics.incr("actor.lease_lost")
+
+    def _lose_lease(self) -> None:
+        if self.lost:
+            return
+        logger.error("Se perdió el lease del diagrama %s; se detiene el actor", self.key)
+        self.lost = True
+        for t in self.side_tasks:
+            if t is not asyncio.current_task():
+                t.cancel()
+        self.queue.put_nowait(("lost", (), asyncio.get_running_loop().create_future()))
+        if self.on_lost is not None:
+            self.on_lost(self)
+
+    def _start_flush(self) -> None:
+        if not self.pending or (self.flush_task is not None and not self.flush_task.done()):
+            return
+        batch, self.pending = self.pending, []
+        snapshot = None
+        if store.checkpoint_due(self.version, self.checkpoint_version):
+            snapshot = self.snapshot()
+        self.flush_task = asyncio.create_task(self._persist(batch, self.version, snapshot))
+
+    async def _persist(self, batch: list, version: int, snapshot) -> None:
+        try:
+            await database_sync_to_async(store.persist_batch)(
+                self.diagram_id, batch, version, snapshot
+            )
+        except Exception:
+            logger.exception("Error volcando el diagrama %s", self.key)
+            # se reintenta en el próximo ciclo; lo reencola el propio actor
+            self.queue.put_nowait(("requeue", (batch,), asyncio.get_running_loop().create_future()))
+            return
+        if snapshot is not None:
+            self.queue.put_nowait(("checkpointed", (version,), asyncio.get_running_loop().create_future()))
+
+    def snapshot(self) -> dict:
+        # to_snapshot arma dicts nuevos: las ops siguientes no lo alteran, así
+        # que se reutiliza hasta el próximo cambio
+        if self._snapshot is None:
+            self._snapshot = self.graph.to_snapshot()
+        return self._snapshot
+
+    # -- comandos (síncronos: corren dentro del bucle del actor)
+    def _do_requeue(self, batch: list) -> None:
+        self.pending[:0] = batch
+
+    def _do_checkpointed(self, version: int) -> None:
+        self.checkpoint_version = max(self.checkpoint_version, version)
+
+    def _do_snapshot(self) -> dict:
+        return {
+            "diagramId": str(self.diagram_id),
+            "version": self.version,
+            "snapshot": self.snapshot(),
+        }
+
+    def _recent_since(self, since: int):
+        """Ops en memoria posteriores a since, o None si el anillo no llega."""
+        if since == self.version:
+            return []
+        if self.recent and self.recent[0]["version"] <= since + 1:
+            return [e for e in self.recent if e["version"] > since]
+        return None
+
+    def _merge_older(self, since: int, older: list):
+        """Ops de BD (seq > since) + anillo, si juntas cubren since..version sin huecos."""
+        first = self.recent[0]["version"] if self.recent else self.version + 1
+        ops = [e for e in older if e["version"] < first] + [
+            e for e in self.recent if e["version"] > since
+        ]
+        if [e["version"] for e in ops] == list(range(since + 1, self.version + 1)):
+            return ops
+        return None
+
+    def _do_catch_up(self, since) -> dict:
+        if not store.gap_ok(since, self.version):
+            return {"version": self.version, "snapshot": self.snapshot()}
+        ops = self._recent_since(since)
+        if ops is not None:
+            return {"version": self.version, "ops": ops}
+        # el tramo más viejo ya está en BD: lo completa quien llamó
+        return {"needDb": True, "diagramId": str(self.diagram_id), "recent": list(self.recent)}
+
+    def _do_apply_many(self, base_version, ops: list, user_id, older: list = None) -> dict:
+        if base_version != self.version:
+            # lote viejo: se intenta rebasar sobre lo confirmado desde baseVersion
+            missing = None
+            if store.gap_ok(base_version, self.version):
+                missing = self._recent_since(base_version)
+                if missing is None and older is not None:
+                    missing = self._merge_older(base_version, older)
+                if missing is None and older is None:
+                    # el anillo no llega (p. ej. actor recién abierto): quien
+                    # llamó trae ese tramo de BD y reintenta con older
+                    return {"status": "needDb", "diagramId": str(self.diagram_id)}
+            if missing is None:
+                return {
+                    "status": "conflict",
+                    "currentVersion": self.version,
+                    "snapshot": self.snapshot(),
+                }
+            try:
+                committed = [m["op"] for m in missing]
+                ops = [rebase_op(op, committed) for op in ops]
+            except RebaseConflict:
+                return {"status": "conflict", "currentVersion": self.version, "ops": missing}
+
+        first = self.version + 1
+        applied = []
+        self._snapshot = None
+        for op in ops:
+            self.graph.apply(op)
+            self.version += 1
+            self.pending.append((self.version, user_id, op))
+            entry = {"version": self.version, "op": op, "userId": user_id}
+            self.recent.append(entry)
+            applied.append(entry)
+        metrics.incr("actor.ops", len(applied))
+        return {"status": "ok", "fromVersion": first, "version": self.version, "ops": applied}
+
+    # -- tareas laterales cuando hay lease
+    async def _serve_remote(self) -> None:
+        layer = get_channel_layer()
+        while True:
+            msg = await layer.receive(self.channel)
+            try:
+                reply = {"type": "actor.reply", "result": await self.call(msg["cmd"], *msg["args"])}
+            except ValueError as e:
+                reply = {"type": "actor.reply", "error": str(e)}
+            except Exception:
+                logger.exception("Error atendiendo comando remoto en %s", self.key)
+                reply = {"type": "actor.reply", "error": "internal"}
+            await layer.send(msg["reply"], reply)
+
+    async def _renew(self) -> None:
+        loop = asyncio.get_running_loop()
+        ttl = settings.DIAGRAM_LEASE_TTL_MS / 1000
+        renewed = loop.time()
+        while True:
+            await asyncio.sleep(ttl / 3)
+            try:
+                ok = await renew_lease(self.key, self.channel)
+            except Exception:
+                logger.exception("Error renovando el lease de %s", self.key)
+                # sin Redis no se sabe; pasado el TTL el lease ya venció seguro
+                ok = loop.time() - renewed < ttl
+            else:
+                renewed = loop.time() if ok else renewed
+            if not ok:
+                self._lose_lease()
+                return
+
+
+# ---- Proxy hacia el dueño en otro proceso
+class RemoteRoom:
+    def __init__(self, key: str, owner_channel: str):
+        self.key = key
+        self.owner_channel = owner_channel
+
+    async def call(self, cmd: str, *args):
+        layer = get_channel_layer()
+        reply = await layer.new_channel("actor-reply.")
+        metrics.incr("actor.remote_calls")
+        await layer.send(
+            self.owner_channel,
+            {"type": "actor.call", "cmd": cmd, "args": list(args), "reply": reply},
+        )
+        try:
+            msg = await asyncio.wait_for(
+                layer.receive(reply), timeout=settings.DIAGRAM_REMOTE_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            raise OwnerUnavailable(self.key)
+        if "error" in msg:
+            raise ValueError(msg["error"])
+        return msg["result"]
+
+    async def close(self) -> None:
+        pass
+
+
+async def open_room(key: str, on_lost=None):
+    """
+    Actor local si este proceso es (o pasa a ser) el dueño; si no, proxy.
+    on_lost(actor) se llama si el actor local pierde el lease y se detiene.
+    """
+    if not leases_enabled():
+        return await RoomActor.open(key)
+
+    layer = get_channel_layer()
+    while True:
+        channel = await layer.new_channel(f"actor.{os.getpid()}.{uuid.uuid4().hex[:8]}.")
+        if await try_lease(key, channel):
+            try:
+                return await RoomActor.open(key, channel, on_lost)
+            except Exception:
+                await drop_lease(key, channel)
+                raise
+        owner = await lease_owner(key)
+        if owner is not None:
+            return RemoteRoom(key, owner)
+        # el lease expiró entre SET y GET: se reintenta
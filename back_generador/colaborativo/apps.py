@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ColaborativoConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'colaborativo'
+
+    def ready(self):
+        # registra las señales que invalidan los cachés de auth y de diagramas
+        from . import jwt_middleware, store  # noqa: F401
@@ -2,13 +2,19 @@
 import json
 import re
 import uuid
+from contextlib import aclosing
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.db import transaction
 from django.contrib.auth.models import AnonymousUser
-from .models import Diagram, Operation
-from asgiref.sync import sync_to_async
-from gemini_api.services import process_diagram_with_gemini
+from .models import Diagram
+from gemini_api.services import aprocess_diagram_with_gemini, astream_diagram_updates
+from . import hot_state, presence, wire
+from .actor import OwnerUnavailable
+from .drag import DragCoalescer
+from .store import append_op, append_ops, catch_up, load_state
+from .store import get_diagram_by_key as _get_or_create_diagram_by_key
 
 
 def _safe_group_name(diagram_key: str) -> str:
@@ -22,53 +28,95 @@ class DiagramConsumer(AsyncJsonWebsocketConsumer):
         self.diagram_key = self.scope["url_route"]["kwargs"]["diagram_id"]
         self.group = _safe_group_name(self.diagram_key)
         self.user = self.scope.get("user") or AnonymousUser()
+        self.hot = False
+        self.member_id = uuid.uuid4().hex[:12]  # una entrada de roster por socket
+        self.drag = None
+        if settings.DIAGRAM_DRAG_RATE_HZ > 0:
+            self.drag = DragCoalescer(self._send_drag_batch, settings.DIAGRAM_DRAG_RATE_HZ)
 
+        self.fmt, subprotocol = wire.negotiate(self.scope)
         await self.channel_layer.group_add(self.group, self.channel_name)
-        await self.accept()
+        await self.accept(subprotocol=subprotocol)
 
-        await self.channel_layer.group_send(
-            self.group,
-            {
-                "type": "evt.presence",
-                "userId": getattr(self.user, "id", None),
-                "state": "join",
-            },
-        )
+        if hot_state.enabled():
+            try:
+                await hot_state.acquire(self.diagram_key)
+            except ValueError:
+                await self.close(code=4404)
+                return
+            self.hot = True
+
+        # entra al roster; el join se difunde en el próximo tick de presencia
+        presence.join(self.group, self.member_id, getattr(self.user, "id", None))
 
     async def disconnect(self, code):
+        if self.drag is not None:
+            await self.drag.close()
+        if self.hot:
+            await hot_state.release(self.diagram_key)
         await self.channel_layer.group_discard(self.group, self.channel_name)
-        await self.channel_layer.group_send(
-            self.group,
-            {
-                "type": "evt.presence",
-                "userId": getattr(self.user, "id", None),
-                "state": "leave",
-            },
-        )
+        presence.leave(self.group, self.member_id)
 
     async def receive_json(self, msg):
+        try:
+            await self._handle(msg)
+        except OwnerUnavailable:
+            # la sala cambia de dueño; una escritura pudo haberse aplicado o no:
+            # el cliente hace sync y recién entonces reenvía lo que falte
+            await self.send_json(
+                {"evt": "error", "message": "Sala no disponible, reintenta", "retry": True, "sync": True}
+            )
+
+    async def _handle(self, msg):
         cmd = msg.get("cmd")
+        presence.touch(self.group, self.member_id, getattr(self.user, "id", None))  # cualquier mensaje cuenta como heartbeat
 
         if cmd == "init":
             snap = await self._get_or_create_snapshot()
-            await self.send_json({"evt": "snapshot", **snap})
+            await self.send_json(
+                {
+                    "evt": "snapshot",
+                    **snap,
+                    "memberId": self.member_id,
+                    "roster": await presence.roster(self.group),
+                }
+            )
+
+        elif cmd == "heartbeat":
+            pass
+
+        elif cmd == "presence":
+            cursor = msg.get("cursor")
+            if isinstance(cursor, dict):
+                cursor = {"x": int(cursor["x"]), "y": int(cursor["y"])}
+            selection = msg.get("selection")
+            if isinstance(selection, list):
+                selection = [str(i) for i in selection[: settings.PRESENCE_MAX_SELECTION]]
+            presence.update(
+                self.group, self.member_id, getattr(self.user, "id", None),
+                cursor=cursor, selection=selection,
+            )
 
         elif cmd == "drag":
-            await self.channel_layer.group_send(
-                self.group,
+            pos = {"x": int(msg["pos"]["x"]), "y": int(msg["pos"]["y"])}
+            if self.drag is not None:
+                self.drag.push(msg["id"], pos)  # se emite en el próximo tick
+                return
+            await self._broadcast(
+                "drag",
                 {
-                    "type": "evt.drag",
                     "userId": getattr(self.user, "id", None),
                     "id": msg["id"],
-                    "pos": {"x": int(msg["pos"]["x"]), "y": int(msg["pos"]["y"])},
+                    "pos": pos,
                 },
             )
 
         elif cmd == "drag_end":
-            await self.channel_layer.group_send(
-                self.group,
+            if self.drag is not None:
+                self.drag.discard(msg["id"])
+            await self._broadcast(
+                "drag_end",
                 {
-                    "type": "evt.drag_end",
                     "userId": getattr(self.user, "id", None),
                     "id": msg["id"],
                     "pos": {"x": int(msg["pos"]["x"]), "y": int(msg["pos"]["y"])},
@@ -76,25 +124,39 @@ class DiagramConsumer(AsyncJsonWebsocketConsumer):
             )
 
         elif cmd == "op":
-            res = await self._apply_op(msg.get("baseVersion"), msg.get("op"))
+            try:
+                res = await self._apply_op(msg.get("baseVersion"), msg.get("op"))
+            except ValueError as e:
+                await self.send_json({"evt": "error", "message": str(e)})
+                return
             if res["status"] == "ok":
-                await self.channel_layer.group_send(
-                    self.group,
+                await self._broadcast(
+                    "op",
                     {
-                        "type": "evt.op",
                         "version": res["version"],
                         "op": res["op"],
                         "userId": getattr(self.user, "id", None),
                     },
                 )
             else:
-                await self.send_json(
-                    {
-                        "evt": "conflict",
-                        "currentVersion": res["currentVersion"],
-                        "snapshot": res["snapshot"],
-                    }
-                )
+                await self._send_conflict(res)
+
+        elif cmd == "ops":
+            # Lote (pegar, multiselección): una transacción y un solo broadcast
+            ops = msg.get("ops")
+            if not isinstance(ops, list) or not ops:
+                await self.send_json({"evt": "error", "message": "Falta ops"})
+                return
+            await self._commit_ops(msg.get("baseVersion"), ops)
+
+        elif cmd == "sync":
+            # Reanudar desde una versión: solo las ops faltantes
+            since = msg.get("sinceVersion")
+            delta = await self._catch_up(since)
+            if "ops" in delta:
+                await self.send_json({"evt": "ops", "fromVersion": since + 1, "sync": True, **delta})
+            else:
+                await self.send_json({"evt": "snapshot", **delta})
 
         elif cmd == "ai_update":
             prompt = msg.get("prompt")
@@ -104,39 +166,19 @@ class DiagramConsumer(AsyncJsonWebsocketConsumer):
 
             snap = await self._get_or_create_snapshot()
 
-            # Llamar a Gemini sin bloquear el loop
-            result = await sync_to_async(process_diagram_with_gemini)(
-                prompt, snap["snapshot"]
-            )
+            if msg.get("stream", settings.GEMINI_STREAM_UPDATES):
+                await self._ai_update_stream(prompt, snap)
+                return
+
+            # Cliente asyncio nativo: no ocupa el hilo de los helpers de BD
+            result = await aprocess_diagram_with_gemini(prompt, snap["snapshot"])
 
             if "error" in result:
                 await self.send_json({"evt": "error", "message": result["error"]})
                 return
 
-            if "updates" in result:
-                current_version = snap["version"]
-                for op in result["updates"]:
-                    res = await self._apply_op(current_version, op)
-                    if res["status"] == "ok":
-                        current_version = res["version"]  # 👈 actualizar versión
-                        await self.channel_layer.group_send(
-                            self.group,
-                            {
-                                "type": "evt.op",
-                                "version": res["version"],
-                                "op": res["op"],
-                                "userId": getattr(self.user, "id", None),
-                            },
-                        )
-                    else:
-                        await self.send_json(
-                            {
-                                "evt": "conflict",
-                                "currentVersion": res["currentVersion"],
-                                "snapshot": res["snapshot"],
-                            }
-                        )
-                        break  # sal del bucle si hay conflicto
+            if result.get("updates"):
+                await self._commit_ops(snap["version"], result["updates"])
 
     @staticmethod
     def _replace_snapshot(new_snapshot: dict):
@@ -146,124 +188,146 @@ class DiagramConsumer(AsyncJsonWebsocketConsumer):
             d.version += 1
             d.save(update_fields=["snapshot", "version", "updated_at"])
 
-    # ---- Eventos del grupo -> socket
-    async def evt_drag(self, event):
-        await self.send_json(
-            {"evt": "drag", **{k: v for k, v in event.items() if k != "type"}}
+    async def _send_drag_batch(self, items: list):
+        await self._broadcast(
+            "drag_batch",
+            {
+                "userId": getattr(self.user, "id", None),
+                "items": items,
+            },
         )
 
-    async def evt_drag_end(self, event):
-        await self.send_json(
-            {"evt": "drag_end", **{k: v for k, v in event.items() if k != "type"}}
-        )
+    # ---- Formato del socket
+    async def receive(self, text_data=None, bytes_data=None, **kwargs):
+        if bytes_data is not None and self.fmt == wire.MSGPACK:
+            await self.receive_json(wire.unpack(bytes_data), **kwargs)
+        else:
+            await super().receive(text_data, bytes_data, **kwargs)
 
-    async def evt_op(self, event):
-        await self.send_json(
-            {"evt": "op", **{k: v for k, v in event.items() if k != "type"}}
+    async def send_json(self, content, close=False):
+        if self.fmt == wire.MSGPACK:
+            await self.send(bytes_data=wire.pack(content), close=close)
+        else:
+            await super().send_json(content, close)
+
+    async def _broadcast(self, evt: str, payload: dict):
+        await self.channel_layer.group_send(self.group, wire.group_event(evt, payload))
+
+    # ---- Eventos del grupo -> socket
+    async def evt_frame(self, event):
+        # frame ya serializado por quien emitió: sin copias ni json por socket
+        if self.fmt == wire.MSGPACK:
+            await self.send(bytes_data=wire.frame_bytes(event))
+        else:
+            await self.send(text_data=event[wire.JSON])
+
+    async def evt_snapshot(self, event):
+        await self.send_json({"evt": "snapshot", "snapshot": event["snapshot"]})
+
+    async def _ai_update_stream(self, prompt: str, snap: dict):
+        # Cada op se aplica y se difunde apenas Gemini la termina de generar
+        version = snap["version"]
+        applied = 0
+        await self.send_json({"evt": "ai_progress", "status": "started"})
+        try:
+            async with aclosing(
+                astream_diagram_updates(prompt, snap["snapshot"])
+            ) as updates:
+                async for op in updates:
+                    try:
+                        res = await self._apply_op(version, op)
+                    except ValueError as e:
+                        await self.send_json({"evt": "error", "message": str(e)})
+                        continue
+                    if res["status"] != "ok":
+                        await self._send_conflict(res)
+                        break
+                    version = res["version"]
+                    applied += 1
+                    await self._broadcast(
+                        "op",
+                        {
+                            "version": res["version"],
+                            "op": res["op"],
+                            "userId": getattr(self.user, "id", None),
+                        },
+                    )
+                    await self.send_json(
+                        {"evt": "ai_progress", "status": "applying", "applied": applied, "version": version}
+                    )
+        except Exception as e:
+            await self.send_json({"evt": "error", "message": str(e)})
+        await self.send_json({"evt": "ai_progress", "status": "done", "applied": applied})
+
+    async def _commit_ops(self, base_version, ops: list):
+        try:
+            res = await self._apply_ops(base_version, ops)
+        except ValueError as e:
+            await self.send_json({"evt": "error", "message": str(e)})
+            return
+        if res["status"] != "ok":
+            await self._send_conflict(res)
+            return
+        await self._broadcast(
+            "ops",
+            {
+                "fromVersion": res["fromVersion"],
+                "version": res["version"],
+                "ops": res["ops"],
+                "userId": getattr(self.user, "id", None),
+            },
         )
 
-    async def evt_presence(self, event):
+    async def _send_conflict(self, res: dict):
+        # Trae las ops que le faltan al cliente, o el snapshot si son demasiadas
         await self.send_json(
-            {"evt": "presence", **{k: v for k, v in event.items() if k != "type"}}
+            {"evt": "conflict", **{k: v for k, v in res.items() if k != "status"}}
         )
 
-    async def evt_snapshot(self, event):
-        await self.send_json({"evt": "snapshot", "snapshot": event["snapshot"]})
+    # ---- Helpers de estado (memoria o BD)
+    async def _get_or_create_snapshot(self):
+        if self.hot:
+            return await hot_state.get_snapshot(self.diagram_key)
+        return await self._get_snapshot_db()
+
+    async def _catch_up(self, since):
+        if self.hot:
+            return await hot_state.catch_up(self.diagram_key, since)
+        return await self._catch_up_db(since)
+
+    async def _apply_op(self, base_version, op: dict):
+        if self.hot:
+            return await hot_state.apply(
+                self.diagram_key, base_version, op, getattr(self.user, "id", None)
+            )
+        return await self._apply_op_db(base_version, op)
+
+    async def _apply_ops(self, base_version, ops: list):
+        if self.hot:
+            return await hot_state.apply_many(
+                self.diagram_key, base_version, ops, getattr(self.user, "id", None)
+            )
+        return await self._apply_ops_db(base_version, ops)
 
     # ---- Helpers DB
     @database_sync_to_async
-    def _get_or_create_snapshot(self):
+    def _get_snapshot_db(self):
         d = _get_or_create_diagram_by_key(self.diagram_key)
-        return {"diagramId": str(d.id), "version": d.version, "snapshot": d.snapshot}
+        snapshot, version = load_state(d)
+        return {"diagramId": str(d.id), "version": version, "snapshot": snapshot}
 
     @database_sync_to_async
-    def _apply_op(self, base_version, op: dict):
-        with transaction.atomic():
-            d = _get_or_create_diagram_by_key(self.diagram_key)
-            d = Diagram.objects.select_for_update().get(pk=d.pk)
-
-            if base_version != d.version:
-                return {
-                    "status": "conflict",
-                    "currentVersion": d.version,
-                    "snapshot": d.snapshot,
-                }
+    def _catch_up_db(self, since):
+        return catch_up(_get_or_create_diagram_by_key(self.diagram_key), since)
 
-            d.snapshot = apply_custom_op(d.snapshot, op)
-            d.version += 1
-            d.save(update_fields=["snapshot", "version", "updated_at"])
+    @database_sync_to_async
+    def _apply_op_db(self, base_version, op: dict):
+        return append_op(
+            self.diagram_key, base_version, op, getattr(self.user, "id", None)
+        )
 
-            Operation.objects.create(
-                diagram=d,
-                seq=d.version,
-                user=getattr(self.user, "id", None),
-                op_type=op.get("type", "custom"),
-                payload=op,
-            )
-            return {"status": "ok", "version": d.version, "op": op}
-
-
-# Helpers
-def _get_or_create_diagram_by_key(key: str) -> Diagram:
-    key_str = str(key)
-    try:
-        # ✅ Si es un UUID válido, buscamos directamente por PK
-        uuid_obj = uuid.UUID(key_str)
-        return Diagram.objects.get(pk=uuid_obj)
-    except ValueError:
-        # ❌ No es un UUID → no aceptamos como válido
-        raise ValueError(f"Invalid diagram_id: {key_str}")
-    except Diagram.DoesNotExist:
-        # ❌ El UUID es válido pero no existe en BD
-        raise ValueError(f"Diagram with id {key_str} does not exist")
-
-
-def apply_custom_op(snapshot: dict, op: dict) -> dict:
-    t = op.get("type")
-    nodes = snapshot.setdefault("nodes", {})
-    links = snapshot.setdefault("links", {})
-
-    if t == "node.add":
-        nid = op["id"]
-        nodes[nid] = {"id": nid, **op.get("data", {})}
-        return snapshot
-
-    if t == "node.update":
-        nid = op["id"]
-        patch = op.get("patch", {})
-        if nid in nodes:
-            nodes[nid].update(patch)
-        return snapshot
-
-    if t == "node.remove":
-        nid = op["id"]
-        nodes.pop(nid, None)
-        return snapshot
-
-    if t == "link.add":
-        lid = op["id"]
-        links[lid] = {"id": lid, **op.get("data", {})}
-        return snapshot
-
-    if t == "link.remove":
-        lid = op["id"]
-        links.pop(lid, None)
-        return snapshot
-
-    if t == "relationship.add":
-        lid = op["id"]
-        links[lid] = {
-            "id": lid,
-            "sourceId": op["data"]["sourceId"],
-            "targetId": op["data"]["targetId"],
-            "type": op["data"]["type"],
-            "cardinality": op["data"].get("cardinality", {}),
-        }
-        return snapshot
-
-    if t == "relationship.remove":
-        lid = op["id"]
-        links.pop(lid, None)
-        return snapshot
-
-        return snapshot
+    @database_sync_to_async
+    def _apply_ops_db(self, base_version, ops: list):
+        return append_ops(
+            self.diagram_key, base_version, ops, getattr(self.user, "id", None)
+        )
@@ -0,0 +1,51 @@
+# colaborativo/drag.py
+# Coalescencia de drags: de cada node id solo importa la última posición.
+#
+# Un cliente arrastrando manda ~60 msgs/s; en vez de reenviar cada uno al
+# grupo se guarda la última posición por node y se emite un único
+# evt.drag_batch a DIAGRAM_DRAG_RATE_HZ.
+import asyncio
+import logging
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class DragCoalescer:
+    def __init__(self, flush_cb, rate_hz: float):
+        self.flush_cb = flush_cb  # async (items: list[dict]) -> None
+        self.interval = 1.0 / rate_hz
+        self.latest = {}  # node id -> pos
+        self.task = None
+
+    def push(self, node_id, pos: dict) -> None:
+        metrics.incr("drag.in")
+        self.latest[node_id] = pos
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    def discard(self, node_id) -> None:
+        # drag_end manda la posición final: lo pendiente quedaría atrasado
+        self.latest.pop(node_id, None)
+
+    async def flush(self) -> None:
+        if not self.latest:
+            return
+        batch, self.latest = self.latest, {}
+        metrics.incr("drag.out")
+        await self.flush_cb([{"id": nid, "pos": pos} for nid, pos in batch.items()])
+
+    async def close(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+        await self.flush()
+
+    async def _run(self) -> None:
+        # el tick vive mientras haya drags; al quedar ocioso termina
+        while self.latest:
+            await asyncio.sleep(self.interval)
+            metrics.incr("drag.ticks")
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Error emitiendo drag_batch")
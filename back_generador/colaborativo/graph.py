@@ -0,0 +1,148 @@
+# colaborativo/graph.py
+# Diagrama en memoria con índice de adyacencia (node → links incidentes).
+#
+# El snapshot {nodes, links} es un dict anidado: encontrar los links de un
+# node exige recorrer todos. Aquí cada node y link es un registro con
+# __slots__ y se mantiene `incident`, así node.remove borra en cascada sus
+# links y las consultas de vecindario cuestan O(grado). Aplica las mismas
+# ops que ops.apply_custom_op, con el mismo resultado, y se convierte desde y
+# hacia la forma JSON de siempre.
+_LINK_KEYS = ("sourceId", "targetId")
+
+
+class NodeRec:
+    # attrs puede traer su propio "id": como en apply_custom_op, ese es el que
+    # se exporta (la clave del dict sigue siendo el id de la op)
+    __slots__ = ("id", "attrs")
+
+    def __init__(self, nid: str, attrs: dict):
+        self.id = nid
+        self.attrs = attrs
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, **self.attrs}
+
+
+class LinkRec:
+    __slots__ = ("id", "source", "target", "attrs")
+
+    def __init__(self, lid: str, source, target, attrs: dict):
+        self.id = lid
+        self.source = source
+        self.target = target
+        self.attrs = attrs
+
+    def to_dict(self) -> dict:
+        out = {"id": self.id}
+        if self.source is not None:
+            out["sourceId"] = self.source
+        if self.target is not None:
+            out["targetId"] = self.target
+        out.update(self.attrs)
+        return out
+
+
+class IndexedDiagram:
+    __slots__ = ("nodes", "links", "incident")
+
+    def __init__(self):
+        self.nodes: dict[str, NodeRec] = {}
+        self.links: dict[str, LinkRec] = {}
+        self.incident: dict[str, set] = {}  # node_id -> {link_id}
+
+    # ---- Conversión desde/hacia {nodes, links}
+    @classmethod
+    def from_snapshot(cls, snapshot: dict) -> "IndexedDiagram":
+        g = cls()
+        for nid, node in ((snapshot or {}).get("nodes") or {}).items():
+            g.nodes[nid] = NodeRec(nid, {k: v for k, v in node.items() if k != "id" or v != nid})
+        for lid, link in ((snapshot or {}).get("links") or {}).items():
+            g._add_link(lid, link)
+        return g
+
+    def to_snapshot(self) -> dict:
+        """Dicts nuevos: lo que se devuelve no cambia con las ops siguientes."""
+        return {
+            "nodes": {nid: n.to_dict() for nid, n in self.nodes.items()},
+            "links": {lid: l.to_dict() for lid, l in self.links.items()},
+        }
+
+    # ---- Índice
+    def _add_link(self, lid: str, data: dict) -> None:
+        if lid in self.links:
+            self._remove_link(lid)
+        rec = LinkRec(
+            lid,
+            data.get("sourceId"),
+            data.get("targetId"),
+            # un "id" en data pisa al de la op, igual que en apply_custom_op
+            {k: v for k, v in data.items() if k not in _LINK_KEYS and (k != "id" or v != lid)},
+        )
+        self.links[lid] = rec
+        for end in (rec.source, rec.target):
+            if end is not None:
+                self.incident.setdefault(end, set()).add(lid)
+
+    def _remove_link(self, lid: str):
+        rec = self.links.pop(lid, None)
+        if rec is None:
+            return None
+        for end in (rec.source, rec.target):
+            ids = self.incident.get(end)
+            if ids is not None:
+                ids.discard(lid)
+                if not ids:
+                    del self.incident[end]
+        return rec
+
+    def remove_node(self, nid: str) -> list[str]:
+        """Quita el node y sus links; devuelve los ids de links borrados."""
+        self.nodes.pop(nid, None)
+        removed = list(self.incident.get(nid, ()))
+        for lid in removed:
+            self._remove_link(lid)
+        return removed
+
+    # ---- Consultas O(grado)
+    def links_of(self, nid: str) -> list[LinkRec]:
+        return [self.links[lid] for lid in self.incident.get(nid, ())]
+
+    def neighbours(self, nid: str) -> set:
+        out = set()
+        for lid in self.incident.get(nid, ()):
+            rec = self.links[lid]
+            out.add(rec.target if rec.source == nid else rec.source)
+        return out
+
+    # ---- Ops (misma semántica que ops.apply_custom_op)
+    def apply(self, op: dict) -> "IndexedDiagram":
+        t = op.get("type")
+
+        if t == "node.add":
+            self.nodes[op["id"]] = NodeRec(op["id"], dict(op.get("data", {})))
+        elif t == "node.update":
+            node = self.nodes.get(op["id"])
+            if node is not None:
+                node.attrs.update(op.get("patch", {}))
+        elif t == "node.remove":
+            self.remove_node(op["id"])
+        elif t == "link.add":
+            self._add_link(op["id"], op.get("data", {}))
+        elif t == "relationship.add":
+            data = op["data"]
+            self._add_link(
+                op["id"],
+                {
+                    "sourceId": data["sourceId"],
+                    "targetId": data["targetId"],
+                    "type": data["type"],
+                    "cardinality": data.get("cardinality", {}),
+                },
+            )
+        elif t in ("link.remove", "relationship.remove"):
+            self._remove_link(op["id"])
+        # tipo desconocido: sin cambios
+        return self
+
+    def __len__(self):
+        return len(self.nodes)
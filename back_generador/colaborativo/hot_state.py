@@ -0,0 +1,161 @@
+# colaborativo/hot_state.py
+# Estado "caliente" de diagramas activos en memoria del proceso.
+#
+# Con DIAGRAM_HOT_STATE=1 el snapshot y la versión autoritativos de cada
+# diagrama abierto los posee un actor (ver actor.py): una tarea asyncio que
+# aplica las ops en orden desde su cola, sin select_for_update. Las ops se
+# vuelcan a BD en lotes (write-behind) cada DIAGRAM_FLUSH_INTERVAL segundos o
+# al juntar DIAGRAM_FLUSH_OPS ops, y el snapshot solo se escribe como
+# checkpoint cada DIAGRAM_CHECKPOINT_EVERY ops. Al cargar un diagrama se hace
+# replay del log de Operation, así que lo ya volcado sobrevive a una caída del
+# proceso; lo que quedaba pendiente en memoria (como máximo un lote) se pierde.
+#
+# Con Redis, el actor vive solo en el proceso que tiene el lease de la sala;
+# el resto reenvía los comandos al dueño.
+import asyncio
+import logging
+from channels.db import database_sync_to_async
+from django.conf import settings
+from . import store
+from .actor import OwnerUnavailable, open_room
+from .ops import validate_op
+
+logger = logging.getLogger(__name__)
+
+
+def enabled() -> bool:
+    return getattr(settings, "DIAGRAM_HOT_STATE", False)
+
+
+class _Entry:
+    def __init__(self):
+        self.room = None  # RoomActor o RemoteRoom
+        self.refs = 0
+        self.lock = asyncio.Lock()  # solo para abrir/cerrar esta sala
+
+
+_rooms: dict[str, _Entry] = {}
+
+
+def _entry(key: str) -> _Entry:
+    entry = _rooms.get(key)
+    if entry is None:
+        entry = _rooms[key] = _Entry()
+    return entry
+
+
+def _lost(key: str, room) -> None:
+    # El actor perdió el lease y se detuvo: se saca del registro para que el
+    # próximo comando reabra la sala (proxy al nuevo dueño o actor nuevo)
+    entry = _rooms.get(key)
+    if entry is not None and entry.room is room:
+        entry.room = None
+
+
+async def _open(key: str):
+    return await open_room(key, on_lost=lambda room: _lost(key, room))
+
+
+async def acquire(key: str) -> None:
+    """Abre (o reutiliza) la sala y suma una referencia."""
+    entry = _entry(key)
+    async with entry.lock:
+        if entry.room is None:
+            entry.room = await _open(key)
+        entry.refs += 1
+
+
+async def release(key: str) -> None:
+    """Resta una referencia; con la última se vuelca y se suelta la sala."""
+    entry = _rooms.get(key)
+    if entry is None:
+        return
+    async with entry.lock:
+        entry.refs -= 1
+        if entry.refs > 0:
+            return
+        if entry.room is None:
+            # se detuvo al perder el lease: no hay nada que volcar
+            if _rooms.get(key) is entry:
+                _rooms.pop(key)
+            return
+        room, entry.room = entry.room, None
+        # Se vuelca con el lock tomado: si alguien se reconecta mientras
+        # tanto, espera y recarga de BD un estado ya completo.
+        try:
+            await room.close()
+        finally:
+            if _rooms.get(key) is entry and entry.refs == 0:
+                _rooms.pop(key)
+
+
+async def _room(entry: _Entry, key: str, stale=None):
+    """La sala de la entrada; se reabre si no hay o si sigue siendo `stale`."""
+    async with entry.lock:
+        if entry.room is None or entry.room is stale:
+            entry.room = await _open(key)
+        return entry.room
+
+
+async def _call(key: str, cmd: str, *args, retry: bool = True):
+    entry = _rooms[key]
+    room = entry.room or await _room(entry, key)
+    # Si el dueño murió, su lease sigue vigente hasta DIAGRAM_LEASE_TTL_MS: se
+    # reintenta (cada intento espera DIAGRAM_REMOTE_TIMEOUT) hasta poder tomarla
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.DIAGRAM_LEASE_TTL_MS / 1000 + settings.DIAGRAM_REMOTE_TIMEOUT
+    while True:
+        try:
+            return await room.call(cmd, *args)
+        except OwnerUnavailable:
+            if not retry:
+                # Una escritura no se reenvía: un dueño lento pero vivo puede
+                # haberla aplicado igual. Se suelta la sala para que el próximo
+                # comando la reabra, y el cliente hace sync antes de reenviar.
+                _lost(key, room)
+                raise
+            if loop.time() >= deadline:
+                raise
+            logger.warning("Dueño de %s sin respuesta; reabriendo la sala", key)
+            room = await _room(entry, key, stale=room)
+
+
+async def get_snapshot(key: str) -> dict:
+    return await _call(key, "snapshot")
+
+
+async def catch_up(key: str, since) -> dict:
+    """Equivalente en memoria de store.catch_up (respuesta a cmd "sync")."""
+    res = await _call(key, "catch_up", since)
+    if not res.get("needDb"):
+        return res
+
+    # El tramo más viejo ya está volcado: se completa con el log de BD
+    recent = res["recent"]
+    older = await database_sync_to_async(store.ops_since)(res["diagramId"], since)
+    first = recent[0]["version"] if recent else since + 1
+    ops = [e for e in older if e["version"] < first] + recent
+    if [e["version"] for e in ops] == list(range(since + 1, since + 1 + len(ops))):
+        return {"version": ops[-1]["version"] if ops else since, "ops": ops}
+    snap = await get_snapshot(key)
+    return {"version": snap["version"], "snapshot": snap["snapshot"]}
+
+
+async def apply(key: str, base_version, op: dict, user_id) -> dict:
+    res = await apply_many(key, base_version, [op], user_id)
+    if res["status"] != "ok":
+        return res
+    return {"status": "ok", "version": res["version"], "op": res["ops"][0]["op"]}
+
+
+async def apply_many(key: str, base_version, ops: list[dict], user_id) -> dict:
+    """Aplica un lote de ops de forma atómica (todas o ninguna)."""
+    for op in ops:
+        validate_op(op)
+    res = await _call(key, "apply_many", base_version, ops, user_id, retry=False)
+    if res["status"] == "needDb":
+        # rebase sobre ops que ya no están en memoria: se leen del log (el
+        # actor no aplicó nada, así que repetir el comando es seguro)
+        older = await database_sync_to_async(store.ops_since)(res["diagramId"], base_version)
+        res = await _call(key, "apply_many", base_version, ops, user_id, older, retry=False)
+    return res
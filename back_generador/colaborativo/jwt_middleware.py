@@ -1,37 +1,114 @@
-# chat_app/jwt_middleware.py
+# colaborativo/jwt_middleware.py
+# Autenticación JWT de websockets por ?token=... (estilo Channels 4).
+#
+# Validar la firma es CPU pura; lo caro era ir a la BD por el usuario en cada
+# connect. Ahora el par token → usuario se guarda en un TTLCache acotado, así
+# una tormenta de reconexiones tras un deploy no golpea la tabla de usuarios.
+# Una entrada se descarta al vencer el token, al cambiar o borrarse el
+# usuario (señales) o con revoke_token(). Con WS_AUTH_FROM_CLAIMS=1 ni
+# siquiera hay consulta: se arma un TokenUser con los claims del token.
+import threading
+import time
 from urllib.parse import parse_qs
+from cachetools import TTLCache
+from channels.auth import AuthMiddlewareStack
 from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+from rest_framework_simplejwt.models import TokenUser
+from . import metrics
+
+_cache = TTLCache(maxsize=settings.WS_AUTH_CACHE_SIZE, ttl=settings.WS_AUTH_CACHE_TTL)
+_by_user: dict = {}  # user_id -> {tokens}, para desalojar por usuario
+_lock = threading.Lock()  # las señales llegan desde hilos sync
+
+
+def _remember(token: str, user, exp: float) -> None:
+    with _lock:
+        _cache[token] = (user, exp)
+        # de paso se olvidan los tokens del usuario que el TTLCache ya soltó
+        tokens = {t for t in _by_user.get(user.pk, ()) if t in _cache}
+        tokens.add(token)
+        _by_user[user.pk] = tokens
+
+
+def _lookup(token: str):
+    with _lock:
+        item = _cache.get(token)
+        if item is None:
+            return None
+        user, exp = item
+        if exp <= time.time():
+            # el token venció antes que la entrada del caché
+            _cache.pop(token, None)
+            return None
+        return user
+
+
+def revoke_token(token: str) -> None:
+    with _lock:
+        item = _cache.pop(token, None)
+        if item is not None:
+            _by_user.get(item[0].pk, set()).discard(token)
+
+
+def evict_user(user_id) -> None:
+    with _lock:
+        for token in _by_user.pop(user_id, set()):
+            _cache.pop(token, None)
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def _user_changed(sender, instance, **kwargs):
+    # password, is_active, borrado...: el próximo connect revalida contra BD
+    evict_user(instance.pk)
+
 
 @database_sync_to_async
-def _get_user_from_token(token: str):
+def _load_user(jwt_auth: JWTAuthentication, validated):
+    return jwt_auth.get_user(validated)
+
+
+async def get_user_for_token(token: str):
+    user = _lookup(token)
+    if user is not None:
+        metrics.incr("ws.auth.cache_hit")
+        return user
+
+    jwt_auth = JWTAuthentication()
     try:
-        jwt_auth = JWTAuthentication()
         validated = jwt_auth.get_validated_token(token)
-        return jwt_auth.get_user(validated)
-    except Exception:
+        if settings.WS_AUTH_FROM_CLAIMS:
+            user = TokenUser(validated)
+        else:
+            user = await _load_user(jwt_auth, validated)
+    except (InvalidToken, TokenError, AuthenticationFailed):
+        metrics.incr("ws.auth.rejected")
         return AnonymousUser()
 
-class QueryStringJWTAuthMiddleware:
-    def __init__(self, inner):
-        self.inner = inner
+    metrics.incr("ws.auth.cache_miss")
+    _remember(token, user, float(validated.get("exp", time.time())))
+    return user
 
-    def __call__(self, scope):
-        return QueryStringJWTAuthInstance(scope, self.inner)
 
-class QueryStringJWTAuthInstance:
-    def __init__(self, scope, inner):
-        self.scope = scope
-        self.inner = inner
-
-    async def __call__(self, receive, send):
-        qs = parse_qs(self.scope.get("query_string", b"").decode())
+class QueryStringJWTAuthMiddleware(BaseMiddleware):
+    async def __call__(self, scope, receive, send):
+        qs = parse_qs(scope.get("query_string", b"").decode())
         token = (qs.get("token") or [None])[0]
-        self.scope["user"] = await _get_user_from_token(token) if token else AnonymousUser()
-        inner = self.inner(self.scope)
-        return await inner(receive, send)
+        if token:
+            start = time.perf_counter()
+            scope = dict(scope, user=await get_user_for_token(token))
+            metrics.observe("ws.auth", time.perf_counter() - start)
+        return await super().__call__(scope, receive, send)
+
 
 def QueryStringJWTAuthMiddlewareStack(inner):
-    # (Opcional) aquí podrías envolver con AuthMiddlewareStack si quieres soporte cookie+sesión además de JWT
-    return QueryStringJWTAuthMiddleware(inner)
+    # sesión/cookie primero; si viene ?token=..., el JWT manda
+    return AuthMiddlewareStack(QueryStringJWTAuthMiddleware(inner))
@@ -0,0 +1,77 @@
+# colaborativo/management/commands/bench_fanout.py
+# CPU de serialización por op según el tamaño de la sala.
+#
+# Compara el fan-out anterior (cada socket copiaba el evento y lo pasaba a
+# JSON) con el actual (frame serializado una vez al emitir y reenviado tal
+# cual por evt_frame). Con el actual el costo por op queda plano.
+#
+#   python manage.py bench_fanout --sizes 1 10 50 200 --ops 2000
+import asyncio
+import json
+import time
+from django.core.management.base import BaseCommand
+from colaborativo import wire
+from colaborativo.consumers import DiagramConsumer
+
+
+def _sample_op(i: int) -> dict:
+    return {
+        "version": i,
+        "op": {
+            "type": "node.update",
+            "id": f"node-{i % 40}",
+            "patch": {"name": f"Clase{i}", "attributes": [{"name": "id", "type": "int"}]},
+        },
+        "userId": 7,
+    }
+
+
+class Command(BaseCommand):
+    help = "Mide la CPU de serialización por op al difundir a salas de distinto tamaño."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 50, 200])
+        parser.add_argument("--ops", type=int, default=2000)
+        parser.add_argument("--fmt", choices=[wire.JSON, wire.MSGPACK], default=wire.JSON)
+
+    def handle(self, *args, **opts):
+        self.stdout.write(f"{'sockets':>8} {'antes µs/op':>12} {'ahora µs/op':>12}")
+        for size in opts["sizes"]:
+            before = asyncio.run(self._legacy(size, opts["ops"]))
+            after = asyncio.run(self._encode_once(size, opts["ops"], opts["fmt"]))
+            self.stdout.write(f"{size:>8} {before:>12.1f} {after:>12.1f}")
+
+    async def _legacy(self, size: int, ops: int) -> float:
+        sink = []
+
+        async def send_json(content):
+            sink.append(json.dumps(content))
+
+        start = time.process_time()
+        for i in range(ops):
+            event = {"type": "evt.op", **_sample_op(i)}
+            for _ in range(size):
+                await send_json({"evt": "op", **{k: v for k, v in event.items() if k != "type"}})
+            sink.clear()
+        return 1e6 * (time.process_time() - start) / ops
+
+    async def _encode_once(self, size: int, ops: int, fmt: str) -> float:
+        sink = []
+
+        async def send(text_data=None, bytes_data=None, close=False):
+            sink.append(text_data if text_data is not None else bytes_data)
+
+        consumers = []
+        for _ in range(size):
+            c = DiagramConsumer()
+            c.fmt = fmt
+            c.send = send
+            consumers.append(c)
+
+        start = time.process_time()
+        for i in range(ops):
+            event = wire.group_event("op", _sample_op(i), binary=fmt == wire.MSGPACK)
+            for c in consumers:
+                await c.evt_frame(event)
+            sink.clear()
+        return 1e6 * (time.process_time() - start) / ops
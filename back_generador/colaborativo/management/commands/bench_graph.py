@@ -0,0 +1,84 @@
+# colaborativo/management/commands/bench_graph.py
+# node.remove en cascada y consultas de vecindario: dict plano vs. IndexedDiagram.
+#
+#   python manage.py bench_graph --nodes 10000 --degree 3 --removes 500
+import copy
+import random
+import time
+from django.core.management.base import BaseCommand
+from colaborativo.graph import IndexedDiagram
+from colaborativo.ops import apply_custom_op
+
+
+def _build(nodes: int, degree: int, seed: int) -> dict:
+    rnd = random.Random(seed)
+    snapshot = {"nodes": {}, "links": {}}
+    for i in range(nodes):
+        snapshot["nodes"][f"n{i}"] = {
+            "id": f"n{i}",
+            "name": f"Clase{i}",
+            "attributes": [{"name": "id", "type": "int"}],
+            "position": {"x": i % 100 * 200, "y": i // 100 * 150},
+        }
+    for j in range(nodes * degree // 2):
+        lid = f"l{j}"
+        snapshot["links"][lid] = {
+            "id": lid,
+            "sourceId": f"n{rnd.randrange(nodes)}",
+            "targetId": f"n{rnd.randrange(nodes)}",
+            "kind": "association",
+        }
+    return snapshot
+
+
+class Command(BaseCommand):
+    help = "Compara node.remove y vecindarios sobre el dict plano y el diagrama indexado."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--nodes", type=int, default=10000)
+        parser.add_argument("--degree", type=int, default=3, help="links promedio por node")
+        parser.add_argument("--removes", type=int, default=500)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **opts):
+        base = _build(opts["nodes"], opts["degree"], opts["seed"])
+        victims = random.Random(opts["seed"]).sample(list(base["nodes"]), opts["removes"])
+        ops = [{"type": "node.remove", "id": nid} for nid in victims]
+        self.stdout.write(f"{len(base['nodes'])} nodes, {len(base['links'])} links")
+
+        start = time.perf_counter()
+        graph = IndexedDiagram.from_snapshot(base)
+        self.stdout.write(f"indexar:               {1000 * (time.perf_counter() - start):9.1f} ms")
+
+        plain = copy.deepcopy(base)
+        start = time.perf_counter()
+        for op in ops:
+            apply_custom_op(plain, op)
+        t_plain = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for op in ops:
+            graph.apply(op)
+        t_graph = time.perf_counter() - start
+
+        self.stdout.write(f"node.remove dict:      {1e6 * t_plain / len(ops):9.1f} µs/op")
+        self.stdout.write(f"node.remove indexado:  {1e6 * t_graph / len(ops):9.1f} µs/op")
+
+        alive = list(graph.nodes)[: opts["removes"]]
+        start = time.perf_counter()
+        for nid in alive:
+            {
+                link["targetId"] if link["sourceId"] == nid else link["sourceId"]
+                for link in plain["links"].values()
+                if nid in (link["sourceId"], link["targetId"])
+            }
+        t_plain = time.perf_counter() - start
+        start = time.perf_counter()
+        for nid in alive:
+            graph.neighbours(nid)
+        t_graph = time.perf_counter() - start
+        self.stdout.write(f"vecinos dict:          {1e6 * t_plain / len(alive):9.1f} µs/consulta")
+        self.stdout.write(f"vecinos indexado:      {1e6 * t_graph / len(alive):9.1f} µs/consulta")
+
+        same = graph.to_snapshot() == plain
+        self.stdout.write(self.style.SUCCESS("mismo resultado") if same else self.style.ERROR("¡difieren!"))
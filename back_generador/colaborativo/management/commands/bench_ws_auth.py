@@ -0,0 +1,46 @@
+# colaborativo/management/commands/bench_ws_auth.py
+# Latencia de autenticación por connect: sin caché (como antes, una consulta
+# por socket), con caché tibio y armando el usuario solo con los claims.
+#
+#   python manage.py bench_ws_auth --username admin --connects 500
+import asyncio
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from colaborativo import jwt_middleware
+
+
+class Command(BaseCommand):
+    help = "Mide la latencia de autenticar websockets con y sin el caché de tokens."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--username", required=True)
+        parser.add_argument("--connects", type=int, default=500)
+
+    def handle(self, *args, **opts):
+        try:
+            user = get_user_model().objects.get(username=opts["username"])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No existe el usuario {opts['username']}")
+        token = str(AccessToken.for_user(user))
+        n = opts["connects"]
+
+        cold = asyncio.run(self._run(token, n, clear=True))
+        warm = asyncio.run(self._run(token, n, clear=False))
+        with override_settings(WS_AUTH_FROM_CLAIMS=True):
+            claims = asyncio.run(self._run(token, n, clear=True))
+
+        self.stdout.write(f"sin caché (consulta por connect): {cold:8.3f} ms/connect")
+        self.stdout.write(f"caché tibio:                      {warm:8.3f} ms/connect")
+        self.stdout.write(f"solo claims (sin BD):             {claims:8.3f} ms/connect")
+
+    async def _run(self, token: str, n: int, clear: bool) -> float:
+        await jwt_middleware.get_user_for_token(token)  # calienta imports/conexión
+        start = time.perf_counter()
+        for _ in range(n):
+            if clear:
+                jwt_middleware.revoke_token(token)
+            await jwt_middleware.get_user_for_token(token)
+        return 1000 * (time.perf_counter() - start) / n
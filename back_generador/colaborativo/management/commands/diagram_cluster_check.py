@@ -0,0 +1,215 @@
+# colaborativo/management/commands/diagram_cluster_check.py
+# Arnés local multi-proceso: levanta N workers daphne sobre el mismo Redis,
+# conecta clientes a una misma sala repartidos entre ellos y comprueba que
+# todos ven las mismas ops en el mismo orden, el mismo snapshot final y los
+# eventos de presencia de los demás.
+#
+#   REDIS_URL=redis://localhost:6379/0 python manage.py diagram_cluster_check --workers 3
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+import uuid
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from colaborativo.models import Diagram
+from colaborativo.sharding import HashRing
+
+
+def _wait_port(port: int, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with socket.socket() as s:
+            if s.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.2)
+    raise CommandError(f"El worker en :{port} no arrancó")
+
+
+class Client:
+    def __init__(self, idx: int, port: int, key: str):
+        self.idx = idx
+        self.url = f"ws://127.0.0.1:{port}/ws/diagram/{key}/"
+        self.version = 0
+        self.seen = []  # [(version, op id)] en el orden recibido
+        self.members = set()  # roster visto: init + presence_diff
+        self.acked = set()
+        self.last_error = None
+        self.changed = asyncio.Event()
+
+    async def connect(self):
+        import websockets
+
+        self.ws = await websockets.connect(self.url)
+        await self.ws.send(json.dumps({"cmd": "init"}))
+        while True:
+            msg = json.loads(await self.ws.recv())
+            if msg.get("evt") == "snapshot":
+                self.version = msg["version"]
+                self.start = msg["version"]
+                self.member_id = msg.get("memberId")
+                self.members = {m["id"] for m in msg.get("roster", [])}
+                break
+        self.reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        async for raw in self.ws:
+            msg = json.loads(raw)
+            evt = msg.get("evt")
+            if evt == "op":
+                self._record(msg["version"], msg["op"])
+            elif evt == "ops":
+                for e in msg["ops"]:
+                    self._record(e["version"], e["op"])
+            elif evt == "presence_diff":
+                self.members |= {m["id"] for m in msg["upsert"]}
+                self.members -= set(msg["remove"])
+            elif evt in ("conflict", "error"):
+                self.last_error = msg
+            self.changed.set()
+
+    def _record(self, version: int, op: dict):
+        self.seen.append((version, op.get("id")))
+        self.version = max(self.version, version)
+        self.acked.add(op.get("id"))
+
+    async def run_ops(self, count: int):
+        for n in range(count):
+            oid = f"c{self.idx}-n{n}"
+            while oid not in self.acked:
+                self.last_error = None
+                self.changed.clear()
+                await self.ws.send(json.dumps({
+                    "cmd": "op",
+                    "baseVersion": self.version,
+                    "op": {"type": "node.add", "id": oid, "data": {"name": oid}},
+                }))
+                while oid not in self.acked and self.last_error is None:
+                    await asyncio.wait_for(self.changed.wait(), timeout=10)
+                    self.changed.clear()
+                if self.last_error and self.last_error.get("evt") == "error":
+                    raise CommandError(f"Cliente {self.idx}: {self.last_error}")
+                # en conflicto se reintenta con la versión que ya se conoce
+
+
+class Command(BaseCommand):
+    help = "Comprueba consistencia de ops y presencia entre varios workers ASGI."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=3)
+        parser.add_argument("--clients", type=int, default=6)
+        parser.add_argument("--ops", type=int, default=30, help="ops por cliente")
+        parser.add_argument("--base-port", type=int, default=8101)
+        parser.add_argument(
+            "--cross",
+            action="store_true",
+            help="repartir clientes entre todos los workers (sin afinidad)",
+        )
+
+    def handle(self, *args, **opts):
+        if not settings.REDIS_URL:
+            raise CommandError("Se necesita REDIS_URL (channel layer y leases compartidos)")
+
+        n = opts["workers"]
+        ports = [opts["base_port"] + i for i in range(n)]
+        diagram = Diagram.objects.create(name=f"cluster-check-{uuid.uuid4().hex[:6]}")
+        key = str(diagram.id)
+
+        procs = []
+        try:
+            for i, port in enumerate(ports):
+                env = {**os.environ, "WORKER_ID": str(i), "DIAGRAM_WORKERS": str(n)}
+                procs.append(subprocess.Popen(
+                    [sys.executable, "-m", "daphne", "-p", str(port), "diagramador.asgi:application"],
+                    env=env,
+                    stdout=subprocess.DEVNULL,
+                ))
+            for port in ports:
+                _wait_port(port, timeout=30)
+
+            owner = HashRing(range(n)).node_for(key)
+            if opts["cross"]:
+                targets = [ports[c % n] for c in range(opts["clients"])]
+            else:
+                targets = [ports[owner]] * opts["clients"]
+            self.stdout.write(f"Sala {key}: worker afín {owner}, clientes en {sorted(set(targets))}")
+
+            asyncio.run(self._check(key, targets, opts["ops"]))
+            self._print_metrics(ports)
+        finally:
+            for p in procs:
+                p.terminate()
+            for p in procs:
+                p.wait(timeout=10)
+            diagram.delete()
+
+    async def _check(self, key: str, targets: list, ops: int):
+        clients = [Client(i, port, key) for i, port in enumerate(targets)]
+        for c in clients:
+            await c.connect()
+        await asyncio.sleep(1)  # que lleguen los últimos presence_diff
+        everyone = {c.member_id for c in clients}
+
+        start = time.perf_counter()
+        await asyncio.gather(*(c.run_ops(ops) for c in clients))
+        elapsed = time.perf_counter() - start
+
+        total = clients[0].start + ops * len(clients)
+        deadline = time.monotonic() + 10
+        while any(c.version < total for c in clients) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+        errors = []
+        reference = sorted(clients[0].seen)
+        expected = list(range(clients[0].start + 1, total + 1))
+        if [v for v, _ in reference] != expected:
+            errors.append("las versiones del cliente 0 no son contiguas")
+        for c in clients:
+            if sorted(c.seen) != reference:
+                errors.append(f"el cliente {c.idx} vio otra secuencia de ops")
+            if c.members != everyone:
+                errors.append(f"el cliente {c.idx} ve {len(c.members)} de {len(everyone)} miembros")
+
+        # snapshot final pedido a cada worker por un socket nuevo
+        import websockets
+
+        node_sets = set()
+        for port in sorted(set(targets)):
+            async with websockets.connect(f"ws://127.0.0.1:{port}/ws/diagram/{key}/") as ws:
+                await ws.send(json.dumps({"cmd": "init"}))
+                while True:
+                    msg = json.loads(await asyncio.wait_for(ws.recv(), timeout=10))
+                    if msg.get("evt") == "snapshot":
+                        break
+            if msg["version"] != total:
+                errors.append(f"worker :{port} reporta versión {msg['version']} != {total}")
+            node_sets.add(frozenset(msg["snapshot"].get("nodes", {})))
+        if len(node_sets) != 1 or len(next(iter(node_sets))) != ops * len(clients):
+            errors.append("los snapshots finales no coinciden")
+
+        for c in clients:
+            c.reader.cancel()
+            await c.ws.close()
+
+        rate = ops * len(clients) / elapsed if elapsed else 0
+        self.stdout.write(f"{ops * len(clients)} ops en {elapsed:.2f}s ({rate:.0f} ops/s)")
+        if errors:
+            raise CommandError("; ".join(errors))
+        self.stdout.write(self.style.SUCCESS("OK: ops y presencia consistentes entre workers"))
+
+    def _print_metrics(self, ports: list):
+        for port in ports:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/api/rooms/metrics/", timeout=5) as r:
+                    data = json.load(r)
+            except OSError:
+                continue
+            counters = data.get("counters", {})
+            self.stdout.write(
+                f"worker {data.get('worker')}: "
+                f"remote_calls={counters.get('actor.remote_calls', 0)}"
+            )
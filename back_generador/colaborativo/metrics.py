@@ -0,0 +1,29 @@
+# colaborativo/metrics.py
+# Contadores y tiempos en memoria del proceso (se consultan en /api/rooms/metrics/).
+from collections import Counter
+
+_counters = Counter()
+_timings = {}
+
+
+def incr(name: str, n: int = 1) -> None:
+    _counters[name] += n
+
+
+def observe(name: str, seconds: float) -> None:
+    t = _timings.setdefault(name, {"count": 0, "sum": 0.0, "max": 0.0})
+    t["count"] += 1
+    t["sum"] += seconds
+    t["max"] = max(t["max"], seconds)
+
+
+def snapshot() -> dict:
+    timings = {
+        name: {
+            "count": t["count"],
+            "avg_ms": round(1000 * t["sum"] / t["count"], 3) if t["count"] else 0,
+            "max_ms": round(1000 * t["max"], 3),
+        }
+        for name, t in _timings.items()
+    }
+    return {"counters": dict(_counters), "timings": timings}
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.14 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+def forwards(apps, schema_editor):
+    # Hasta ahora el snapshot se reescribía en cada op: corresponde a version
+    Diagram = apps.get_model("colaborativo", "Diagram")
+    Diagram.objects.update(snapshot_version=models.F("version"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('colaborativo', '0003_alter_diagram_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='diagram',
+            name='snapshot_version',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+    ]
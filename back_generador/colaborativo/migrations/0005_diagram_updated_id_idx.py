@@ -0,0 +1,17 @@
+# Generated by Django 5.0.14 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('colaborativo', '0004_diagram_snapshot_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='diagram',
+            index=models.Index(fields=['-updated_at', '-id'], name='diagram_updated_id_idx'),
+        ),
+    ]
@@ -21,10 +21,15 @@ class Message(models.Model):
 class Diagram(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=120, unique=True)   # 👈 sin default
-    snapshot = models.JSONField(default=dict)
+    snapshot = models.JSONField(default=dict)  # checkpoint, no necesariamente el estado actual
+    snapshot_version = models.IntegerField(default=0)  # versión a la que corresponde snapshot
     version = models.IntegerField(default=0)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # paginación keyset del listado (más recientes primero)
+        indexes = [models.Index(fields=["-updated_at", "-id"], name="diagram_updated_id_idx")]
+
 class Operation(models.Model):
     diagram = models.ForeignKey(Diagram, on_delete=models.CASCADE, related_name="ops")
     seq = models.IntegerField()  # coincide con version tras aplicar
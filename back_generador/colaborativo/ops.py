@@ -0,0 +1,81 @@
+# colaborativo/ops.py
+# Aplicación pura de operaciones sobre el snapshot {nodes, links} (sin BD).
+
+_NEEDS_ID = {
+    "node.add", "node.update", "node.remove",
+    "link.add", "link.remove", "relationship.add", "relationship.remove",
+}
+
+
+def validate_op(op) -> None:
+    """
+    Lanza ValueError si la op haría fallar a apply_custom_op. Se valida
+    antes de escribir en el log, que luego se reproduce tal cual.
+    """
+    if not isinstance(op, dict) or not isinstance(op.get("type"), str):
+        raise ValueError("Op inválida: falta type")
+    t = op["type"]
+    if t in _NEEDS_ID and "id" not in op:
+        raise ValueError(f"Op {t} sin id")
+    if not isinstance(op.get("data", {}), dict) or not isinstance(op.get("patch", {}), dict):
+        raise ValueError(f"Op {t}: data/patch deben ser objetos")
+    if t == "relationship.add":
+        data = op.get("data", {})
+        missing = [k for k in ("sourceId", "targetId", "type") if k not in data]
+        if missing:
+            raise ValueError(f"Op {t} sin {', '.join(missing)}")
+
+
+def apply_custom_op(snapshot: dict, op: dict) -> dict:
+    t = op.get("type")
+    nodes = snapshot.setdefault("nodes", {})
+    links = snapshot.setdefault("links", {})
+
+    if t == "node.add":
+        nid = op["id"]
+        nodes[nid] = {"id": nid, **op.get("data", {})}
+        return snapshot
+
+    if t == "node.update":
+        nid = op["id"]
+        patch = op.get("patch", {})
+        if nid in nodes:
+            nodes[nid].update(patch)
+        return snapshot
+
+    if t == "node.remove":
+        nid = op["id"]
+        nodes.pop(nid, None)
+        # sin links colgando (mismo resultado que graph.IndexedDiagram)
+        for lid in [l for l, link in links.items() if nid in (link.get("sourceId"), link.get("targetId"))]:
+            del links[lid]
+        return snapshot
+
+    if t == "link.add":
+        lid = op["id"]
+        links[lid] = {"id": lid, **op.get("data", {})}
+        return snapshot
+
+    if t == "link.remove":
+        lid = op["id"]
+        links.pop(lid, None)
+        return snapshot
+
+    if t == "relationship.add":
+        lid = op["id"]
+        links[lid] = {
+            "id": lid,
+            "sourceId": op["data"]["sourceId"],
+            "targetId": op["data"]["targetId"],
+            "type": op["data"]["type"],
+            "cardinality": op["data"].get("cardinality", {}),
+        }
+        return snapshot
+
+    if t == "relationship.remove":
+        lid = op["id"]
+        links.pop(lid, None)
+        return snapshot
+
+    # Tipo desconocido: el snapshot queda intacto
+    return snapshot
@@ -0,0 +1,192 @@
+# colaborativo/presence.py
+# Roster de presencia por sala: quién está, su cursor y su selección.
+#
+# Cada conexión es un miembro (un usuario puede tener varias pestañas). Los
+# cambios se marcan como pendientes y una tarea por sala los difunde como un
+# único evt "presence_diff" cada PRESENCE_TICK segundos: por más que entren y
+# salgan sockets o se muevan cursores, cada proceso manda como mucho un
+# evento por tick y sala al channel layer. Un miembro sin heartbeat en
+# PRESENCE_TTL segundos se da por ido (sockets colgados sin disconnect); si
+# su socket vuelve a hablar, touch/update lo hacen entrar de nuevo.
+#
+# Con PRESENCE_BACKEND=redis el roster se refleja en un hash por sala, así
+# "init" devuelve también los miembros conectados a otros workers.
+import asyncio
+import json
+import logging
+import time
+from channels.layers import get_channel_layer
+from django.conf import settings
+from . import metrics, wire
+
+logger = logging.getLogger(__name__)
+
+_redis = None
+
+
+def _use_redis() -> bool:
+    return settings.PRESENCE_BACKEND == "redis" and bool(settings.REDIS_URL)
+
+
+def _redis_client():
+    global _redis
+    if _redis is None:
+        import redis.asyncio
+
+        _redis = redis.asyncio.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _redis
+
+
+def _hash_key(group: str) -> str:
+    return f"presence:{group}"
+
+
+def _public(member: dict) -> dict:
+    # forma compacta para el cliente: sin ts ni campos vacíos
+    return {k: v for k, v in member.items() if k != "ts" and v is not None}
+
+
+class PresenceRoom:
+    def __init__(self, group: str):
+        self.group = group
+        self.members = {}  # member_id -> {id, userId, cursor, selection, ts}
+        self.dirty = set()
+        self.removed = set()
+        self.ticker = None
+        self.synced_at = 0.0  # último refresco del hash en Redis
+
+    def mark(self, member_id: str) -> None:
+        self.dirty.add(member_id)
+        self.removed.discard(member_id)
+        if self.ticker is None or self.ticker.done():
+            self.ticker = asyncio.create_task(self._tick_loop())
+
+    def drop(self, member_id: str) -> None:
+        if self.members.pop(member_id, None) is not None:
+            self.dirty.discard(member_id)
+            self.removed.add(member_id)
+            if self.ticker is None or self.ticker.done():
+                self.ticker = asyncio.create_task(self._tick_loop())
+
+    def _expire(self) -> None:
+        limit = time.time() - settings.PRESENCE_TTL
+        for mid in [m for m, s in self.members.items() if s["ts"] < limit]:
+            metrics.incr("presence.expired")
+            self.drop(mid)
+
+    async def _tick_loop(self) -> None:
+        # vive mientras haya miembros locales o cambios por difundir
+        while True:
+            await asyncio.sleep(settings.PRESENCE_TICK)
+            self._expire()
+            try:
+                if self.dirty or self.removed:
+                    await self._flush()
+                if _use_redis() and time.time() - self.synced_at > settings.PRESENCE_TTL / 3:
+                    await self._sync_redis()
+            except Exception:
+                logger.exception("Error difundiendo presencia de %s", self.group)
+            if not self.members and not self.dirty and not self.removed:
+                if _rooms.get(self.group) is self:
+                    _rooms.pop(self.group)
+                return
+
+    async def _flush(self) -> None:
+        upsert = [_public(self.members[m]) for m in self.dirty if m in self.members]
+        remove = list(self.removed)
+        self.dirty.clear()
+        self.removed.clear()
+
+        if _use_redis() and remove:
+            await _redis_client().hdel(_hash_key(self.group), *remove)
+        if _use_redis() and upsert:
+            await self._sync_redis()
+
+        metrics.incr("presence.diffs")
+        await get_channel_layer().group_send(
+            self.group, wire.group_event("presence_diff", {"upsert": upsert, "remove": remove})
+        )
+
+    async def _sync_redis(self) -> None:
+        # los heartbeats solo tocan memoria: aquí se refleja el ts en Redis
+        self.synced_at = time.time()
+        if not self.members:
+            return
+        key = _hash_key(self.group)
+        pipe = _redis_client().pipeline()
+        pipe.hset(key, mapping={mid: json.dumps(m) for mid, m in self.members.items()})
+        pipe.expire(key, int(settings.PRESENCE_TTL * 2))
+        await pipe.execute()
+
+
+_rooms: dict[str, PresenceRoom] = {}
+
+
+def _room(group: str) -> PresenceRoom:
+    room = _rooms.get(group)
+    if room is None:
+        room = _rooms[group] = PresenceRoom(group)
+    return room
+
+
+def join(group: str, member_id: str, user_id) -> None:
+    room = _room(group)
+    room.members[member_id] = {
+        "id": member_id,
+        "userId": user_id,
+        "cursor": None,
+        "selection": None,
+        "ts": time.time(),
+    }
+    room.mark(member_id)
+
+
+def _alive(group: str, member_id: str, user_id):
+    """
+    El miembro del roster; si expiró pero su socket sigue mandando mensajes
+    (estuvo callado más de PRESENCE_TTL) vuelve a entrar.
+    """
+    room = _rooms.get(group)
+    member = room.members.get(member_id) if room else None
+    if member is None:
+        metrics.incr("presence.rejoined")
+        join(group, member_id, user_id)
+        room = _rooms[group]
+        member = room.members[member_id]
+    return room, member
+
+
+def update(group: str, member_id: str, user_id, cursor=None, selection=None) -> None:
+    """Cursor y/o selección nuevos; se difunden en el próximo tick."""
+    room, member = _alive(group, member_id, user_id)
+    if cursor is not None:
+        member["cursor"] = cursor
+    if selection is not None:
+        member["selection"] = selection
+    member["ts"] = time.time()
+    room.mark(member_id)
+
+
+def touch(group: str, member_id: str, user_id) -> None:
+    """Heartbeat: renueva el TTL sin generar diff (salvo que haya que re-entrar)."""
+    _, member = _alive(group, member_id, user_id)
+    member["ts"] = time.time()
+
+
+def leave(group: str, member_id: str) -> None:
+    room = _rooms.get(group)
+    if room is not None:
+        room.drop(member_id)
+
+
+async def roster(group: str) -> list[dict]:
+    """Miembros actuales de la sala (de todos los workers con Redis)."""
+    room = _rooms.get(group)
+    members = dict(room.members) if room else {}
+    if _use_redis():
+        limit = time.time() - settings.PRESENCE_TTL
+        for mid, raw in (await _redis_client().hgetall(_hash_key(group))).items():
+            state = json.loads(raw)
+            if mid not in members and state.get("ts", 0) >= limit:
+                members[mid] = state
+    return [_public(m) for m in members.values()]
@@ -0,0 +1,63 @@
+# colaborativo/rebase.py
+# Rebase de una op "vieja" (baseVersion < version actual) sobre las ops que
+# se confirmaron mientras tanto.
+#
+# Las ops direccionan nodos y links por id, así que no hay índices que
+# desplazar como en OT de texto: transformar se reduce a decidir si la op
+# sigue teniendo sentido tras las concurrentes. Si lo tiene se confirma tal
+# cual; si no (conflicto real) se rechaza.
+
+LINK_ADDS = {"link.add", "relationship.add"}
+LINK_REMOVES = {"link.remove", "relationship.remove"}
+
+
+class RebaseConflict(Exception):
+    pass
+
+
+def _endpoints(op: dict) -> tuple:
+    data = op.get("data") or {}
+    return data.get("sourceId"), data.get("targetId")
+
+
+def _check(op: dict, other: dict) -> None:
+    """Lanza RebaseConflict si `op` no conmuta con la ya confirmada `other`."""
+    t, oid = op.get("type"), op.get("id")
+    ot, other_id = other.get("type"), other.get("id")
+
+    if t == "node.add":
+        # mismo id creado por otro → el id ya está ocupado
+        if ot == "node.add" and other_id == oid:
+            raise RebaseConflict(f"node {oid} ya existe")
+
+    elif t == "node.update":
+        if ot in ("node.remove", "node.add") and other_id == oid:
+            raise RebaseConflict(f"node {oid} fue eliminado o reemplazado")
+        if ot == "node.update" and other_id == oid:
+            mine, theirs = op.get("patch") or {}, other.get("patch") or {}
+            clash = [k for k in mine if k in theirs and mine[k] != theirs[k]]
+            if clash:
+                raise RebaseConflict(f"node {oid}: campos en conflicto {clash}")
+
+    elif t in LINK_ADDS:
+        if ot in LINK_ADDS and other_id == oid:
+            raise RebaseConflict(f"link {oid} ya existe")
+        if ot == "node.remove" and other_id in _endpoints(op):
+            raise RebaseConflict(f"link {oid} apunta al node eliminado {other_id}")
+
+    elif t == "node.remove" or t in LINK_REMOVES:
+        # eliminar es idempotente: siempre se puede confirmar
+        pass
+
+    else:
+        raise RebaseConflict(f"tipo de op sin rebase: {t}")
+
+
+def rebase_op(op: dict, committed: list[dict]) -> dict:
+    """
+    Transforma `op` contra las ops `committed` (en orden) y devuelve la op a
+    confirmar sobre la versión actual. Lanza RebaseConflict si no es seguro.
+    """
+    for other in committed:
+        _check(op, other)
+    return op
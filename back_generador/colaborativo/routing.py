@@ -2,8 +2,10 @@
 from django.urls import re_path
 #from colaborativo.consumers import ChatConsumer
 from colaborativo.consumers import DiagramConsumer
+from gemini_api.consumers import FixtureJobConsumer
 
 websocket_urlpatterns = [
     #re_path(r"^ws/chat/(?P<room_name>[\w-]+)/$", ChatConsumer.as_asgi()),
     re_path(r"^ws/diagram/(?P<diagram_id>[\w-]+)/$", DiagramConsumer.as_asgi()),
+    re_path(r"^ws/fixtures/jobs/(?P<job_id>[0-9a-f]+)/$", FixtureJobConsumer.as_asgi()),
 ]
@@ -1,7 +1,27 @@
 from rest_framework import serializers
 from .models import Diagram
+from .store import load_state
 
 class RoomSerializer(serializers.ModelSerializer):
     class Meta:
         model = Diagram
         fields = ("id", "name", "version", "updated_at", "snapshot")
+
+    def to_representation(self, instance):
+        # snapshot en BD es solo el último checkpoint: se completa con el log
+        data = super().to_representation(instance)
+        data["snapshot"], data["version"] = load_state(instance)
+        return data
+
+    def update(self, instance, validated_data):
+        if "snapshot" in validated_data:
+            # un snapshot escrito a mano pasa a ser el checkpoint vigente
+            instance.snapshot_version = instance.version
+        return super().update(instance, validated_data)
+
+
+class RoomListSerializer(serializers.ModelSerializer):
+    """Solo metadatos: el snapshot se pide a detalle_room."""
+    class Meta:
+        model = Diagram
+        fields = ("id", "name", "version", "updated_at")
@@ -0,0 +1,35 @@
+# colaborativo/sharding.py
+# Afinidad sala → worker por hashing consistente.
+#
+# En producción la afinidad la hace nginx (hash $route_key consistent, ver
+# deploy/nginx.conf) con su propio ketama: este anillo NO reproduce sus
+# puntos, así que no sirve para adivinar a qué réplica mandó nginx un socket.
+# Lo usa el arnés local (manage.py diagram_cluster_check), que conecta
+# directo a cada puerto, para elegir el worker afín de una sala. Al agregar
+# o quitar un worker solo se mueven ~1/N salas.
+#
+# Las salas que igual terminan en otro worker se ven en actor.remote_calls
+# (llamadas reenviadas al dueño del lease), no en una comparación de hashes.
+import bisect
+import hashlib
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    def __init__(self, nodes, vnodes: int = 160):
+        self.nodes = list(nodes)
+        points = sorted(
+            (_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes)
+        )
+        self._keys = [h for h, _ in points]
+        self._nodes = [n for _, n in points]
+
+    def node_for(self, key: str):
+        if not self._keys:
+            raise ValueError("Anillo vacío")
+        i = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._nodes[i]
+
@@ -0,0 +1,215 @@
+# colaborativo/store.py
+# Helpers síncronos de persistencia para diagramas y su log de operaciones.
+import threading
+import uuid
+from cachetools import TTLCache
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from .models import Diagram, Operation
+from .ops import apply_custom_op, validate_op
+from .rebase import RebaseConflict, rebase_op
+
+
+def get_diagram_by_key(key: str) -> Diagram:
+    key_str = str(key)
+    try:
+        # ✅ Si es un UUID válido, buscamos directamente por PK
+        uuid_obj = uuid.UUID(key_str)
+        return Diagram.objects.get(pk=uuid_obj)
+    except ValueError:
+        # ❌ No es un UUID → no aceptamos como válido
+        raise ValueError(f"Invalid diagram_id: {key_str}")
+    except Diagram.DoesNotExist:
+        # ❌ El UUID es válido pero no existe en BD
+        raise ValueError(f"Diagram with id {key_str} does not exist")
+
+
+# clave del socket → pk del diagrama existente, por proceso. Se invalida con
+# las señales de Diagram (actualizar_room/eliminar_room) y, para cambios hechos
+# en otros procesos, por TTL; además la consulta con lock lo corrige sola.
+_pk_cache = TTLCache(maxsize=settings.DIAGRAM_META_CACHE_SIZE, ttl=settings.DIAGRAM_META_CACHE_TTL)
+_pk_lock = threading.Lock()
+
+
+def diagram_pk(key: str):
+    """pk del diagrama de `key` sin ir a la BD si ya se vio hace poco."""
+    try:
+        norm = str(uuid.UUID(str(key)))
+    except ValueError:
+        raise ValueError(f"Invalid diagram_id: {key}")
+    with _pk_lock:
+        pk = _pk_cache.get(norm)
+    if pk is None:
+        pk = get_diagram_by_key(norm).pk
+        with _pk_lock:
+            _pk_cache[norm] = pk
+    return pk
+
+
+def invalidate_diagram(pk) -> None:
+    with _pk_lock:
+        _pk_cache.pop(str(pk), None)
+
+
+# campos que toca cada op: guardarlos no cambia la existencia del diagrama
+_OP_FIELDS = {"version", "updated_at", "snapshot", "snapshot_version"}
+
+
+@receiver(post_save, sender=Diagram)
+def _diagram_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= _OP_FIELDS:
+        return
+    invalidate_diagram(instance.pk)
+
+
+@receiver(post_delete, sender=Diagram)
+def _diagram_deleted(sender, instance, **kwargs):
+    invalidate_diagram(instance.pk)
+
+
+def checkpoint_due(version: int, snapshot_version: int) -> bool:
+    return version - snapshot_version >= settings.DIAGRAM_CHECKPOINT_EVERY
+
+
+def load_state(d: Diagram, replayed: list = None) -> tuple[dict, int]:
+    """
+    Reconstruye el estado actual: último checkpoint (d.snapshot) + replay de
+    las operaciones del log posteriores a d.snapshot_version. Si se pasa
+    `replayed`, se le agregan esas ops con la forma de ops_since.
+    """
+    snapshot = d.snapshot or {}
+    version = d.snapshot_version
+    tail = (
+        Operation.objects.filter(diagram_id=d.pk, seq__gt=version)
+        .order_by("seq")
+        .values_list("seq", "payload", "user_id")
+    )
+    for seq, payload, uid in tail:
+        snapshot = apply_custom_op(snapshot, payload)
+        version = seq
+        if replayed is not None:
+            replayed.append({"version": seq, "op": payload, "userId": uid})
+    return snapshot, max(version, d.version)
+
+
+def ops_since(diagram_id, since: int) -> list[dict]:
+    """Ops del log con seq > since, en orden (usa el índice (diagram, -seq))."""
+    rows = (
+        Operation.objects.filter(diagram_id=diagram_id, seq__gt=since)
+        .order_by("seq")
+        .values_list("seq", "payload", "user_id")
+    )
+    return [{"version": seq, "op": payload, "userId": uid} for seq, payload, uid in rows]
+
+
+def gap_ok(since, current: int) -> bool:
+    """True si al cliente en `since` le basta con las ops que le faltan."""
+    return (
+        isinstance(since, int)
+        and 0 <= current - since <= settings.DIAGRAM_SYNC_MAX_GAP
+    )
+
+
+def catch_up(d: Diagram, since) -> dict:
+    """
+    Lo que le falta a un cliente que está en `since`: las ops posteriores o,
+    si el hueco supera DIAGRAM_SYNC_MAX_GAP, el snapshot completo.
+    """
+    if gap_ok(since, d.version):
+        return {"version": d.version, "ops": ops_since(d.pk, since)}
+    snapshot, version = load_state(d)
+    return {"version": version, "snapshot": snapshot}
+
+
+def append_op(key: str, base_version, op: dict, user_id) -> dict:
+    res = append_ops(key, base_version, [op], user_id)
+    if res["status"] != "ok":
+        return res
+    return {"status": "ok", "version": res["version"], "op": res["ops"][0]["op"]}
+
+
+def append_ops(key: str, base_version, ops: list[dict], user_id) -> dict:
+    """
+    Agrega un lote de ops al log (append-only) en una sola transacción: o se
+    confirman todas o ninguna. El snapshot solo se reescribe cuando toca
+    checkpoint, cada DIAGRAM_CHECKPOINT_EVERY ops. Un lote basado en una
+    versión vieja se rebasa y solo se rechaza si hay conflicto real.
+    """
+    for op in ops:
+        validate_op(op)
+
+    pk = diagram_pk(key)
+    with transaction.atomic():
+        # única consulta antes del insert: la fila con lock
+        try:
+            d = (
+                Diagram.objects.select_for_update()
+                .only("id", "version", "snapshot_version")
+                .get(pk=pk)
+            )
+        except Diagram.DoesNotExist:
+            invalidate_diagram(pk)  # borrado en otro proceso
+            raise ValueError(f"Diagram with id {key} does not exist")
+
+        if base_version != d.version:
+            # lote viejo: se intenta rebasar sobre lo confirmado desde baseVersion
+            if not gap_ok(base_version, d.version):
+                snapshot, version = load_state(d)
+                return {"status": "conflict", "currentVersion": version, "snapshot": snapshot}
+            missing = ops_since(d.pk, base_version)
+            try:
+                committed = [m["op"] for m in missing]
+                ops = [rebase_op(op, committed) for op in ops]
+            except RebaseConflict:
+                return {"status": "conflict", "currentVersion": d.version, "ops": missing}
+
+        first = d.version + 1
+        batch = [(first + i, user_id, op) for i, op in enumerate(ops)]
+        _bulk_insert_ops(d.pk, batch)
+        d.version += len(ops)
+
+        fields = ["version", "updated_at"]
+        if checkpoint_due(d.version, d.snapshot_version):
+            # el replay ya incluye las ops recién insertadas
+            d.snapshot, _ = load_state(d)
+            d.snapshot_version = d.version
+            fields += ["snapshot", "snapshot_version"]
+        d.save(update_fields=fields)
+        return {
+            "status": "ok",
+            "fromVersion": first,
+            "version": d.version,
+            "ops": [{"version": seq, "op": op, "userId": uid} for seq, uid, op in batch],
+        }
+
+
+def _bulk_insert_ops(diagram_id, batch: list) -> None:
+    Operation.objects.bulk_create(
+        [
+            Operation(
+                diagram_id=diagram_id,
+                seq=seq,
+                user_id=user_id,
+                op_type=op.get("type", "custom"),
+                payload=op,
+            )
+            for seq, user_id, op in batch
+        ]
+    )
+
+
+def persist_batch(diagram_id, batch: list, version: int, snapshot: dict = None) -> None:
+    """
+    Vuelca un lote de operaciones [(seq, user_id, op), ...] con un solo bulk
+    insert. Si se pasa snapshot, además se guarda como checkpoint en version.
+    """
+    with transaction.atomic():
+        _bulk_insert_ops(diagram_id, batch)
+        # .update() no dispara auto_now → actualizamos updated_at a mano
+        fields = {"version": version, "updated_at": timezone.now()}
+        if snapshot is not None:
+            fields.update(snapshot=snapshot, snapshot_version=version)
+        Diagram.objects.filter(pk=diagram_id).update(**fields)
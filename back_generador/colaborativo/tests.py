@@ -1,3 +1,358 @@
-from django.test import TestCase
+import copy
+import random
 
-# Create your tests here.
+from django.db import IntegrityError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from . import presence, store
+from .graph import IndexedDiagram
+from .models import Diagram, Operation
+from .ops import apply_custom_op
+from .rebase import RebaseConflict, _check, rebase_op
+
+
+def _node_add(nid: str) -> dict:
+    return {"type": "node.add", "id": nid, "data": {"id": nid, "name": nid}}
+
+
+# TransactionTestCase: sin el atomic externo de TestCase, así los SAVEPOINT
+# no se cuentan y assertNumQueries ve solo las consultas de append_ops
+class AppendOpsQueriesTests(TransactionTestCase):
+    def setUp(self):
+        store._pk_cache.clear()
+        self.diagram = Diagram.objects.create(name="consultas")
+        self.key = str(self.diagram.pk)
+
+    def test_one_locked_select_one_insert_one_update_with_warm_cache(self):
+        store.diagram_pk(self.key)  # caché caliente
+        with self.assertNumQueries(3):  # SELECT ... FOR UPDATE, INSERT, UPDATE
+            res = store.append_ops(self.key, 0, [_node_add("a"), _node_add("b")], None)
+        self.assertEqual(res["status"], "ok")
+        self.assertEqual(res["version"], 2)
+        self.assertEqual(Operation.objects.filter(diagram=self.diagram).count(), 2)
+
+    def test_cold_cache_adds_one_lookup(self):
+        with self.assertNumQueries(4):
+            store.append_ops(self.key, 0, [_node_add("a")], None)
+
+    def test_deleted_diagram_is_evicted(self):
+        store.diagram_pk(self.key)
+        Diagram.objects.filter(pk=self.diagram.pk).delete()  # sin señales, como otro proceso
+        with self.assertRaises(ValueError):
+            store.append_ops(self.key, 0, [_node_add("a")], None)
+        self.assertNotIn(self.key, store._pk_cache)
+
+
+class AppendOpsAtomicTests(TestCase):
+    def setUp(self):
+        store._pk_cache.clear()
+        self.diagram = Diagram.objects.create(name="atómico")
+        self.key = str(self.diagram.pk)
+        store.append_ops(self.key, 0, [_node_add("a")], None)
+
+    def _assert_unchanged(self):
+        self.diagram.refresh_from_db()
+        self.assertEqual(self.diagram.version, 1)
+        self.assertEqual(
+            list(Operation.objects.filter(diagram=self.diagram).values_list("seq", flat=True)), [1]
+        )
+
+    def test_invalid_op_in_the_middle_rejects_the_whole_batch(self):
+        batch = [_node_add("b"), {"type": "node.update", "patch": {}}, _node_add("c")]  # sin id
+        with self.assertRaises(ValueError):
+            store.append_ops(self.key, 1, batch, None)
+        self._assert_unchanged()
+
+    def test_failed_insert_rolls_back_the_batch(self):
+        # una fila ajena ocupa el seq 3: el bulk insert choca con uq_diagram_seq
+        Operation.objects.create(diagram=self.diagram, seq=3, op_type="node.add", payload=_node_add("x"))
+        with self.assertRaises(IntegrityError):
+            store.append_ops(self.key, 1, [_node_add("b"), _node_add("c")], None)
+        self.diagram.refresh_from_db()
+        self.assertEqual(self.diagram.version, 1)
+        self.assertEqual(
+            list(Operation.objects.filter(diagram=self.diagram).order_by("seq").values_list("seq", flat=True)),
+            [1, 3],
+        )
+
+
+class DiagramPkCacheSignalTests(TestCase):
+    def setUp(self):
+        store._pk_cache.clear()
+        self.diagram = Diagram.objects.create(name="señales")
+        self.key = str(self.diagram.pk)
+        store.diagram_pk(self.key)
+
+    def test_op_field_save_keeps_entry(self):
+        self.diagram.version = 5
+        self.diagram.save(update_fields=["version", "updated_at"])
+        self.assertIn(self.key, store._pk_cache)
+
+    def test_post_save_evicts(self):
+        self.diagram.name = "renombrado"
+        self.diagram.save()
+        self.assertNotIn(self.key, store._pk_cache)
+
+    def test_post_delete_evicts(self):
+        self.diagram.delete()
+        self.assertNotIn(self.key, store._pk_cache)
+        with self.assertRaises(ValueError):
+            store.diagram_pk(self.key)
+
+
+def _replay(diagram) -> dict:
+    """Estado por replay completo del log, sin checkpoint."""
+    snapshot = {}
+    for payload in Operation.objects.filter(diagram=diagram).order_by("seq").values_list("payload", flat=True):
+        snapshot = apply_custom_op(snapshot, payload)
+    return snapshot
+
+
+@override_settings(DIAGRAM_CHECKPOINT_EVERY=5)
+class CheckpointReplayTests(TestCase):
+    def setUp(self):
+        store._pk_cache.clear()
+        self.diagram = Diagram.objects.create(name="checkpoints")
+        self.key = str(self.diagram.pk)
+
+    def _append(self, n: int):
+        for i in range(n):
+            version = Diagram.objects.get(pk=self.diagram.pk).version
+            op = _node_add(f"n{i}") if i % 3 else {"type": "node.update", "id": "n1", "patch": {"name": f"v{i}"}}
+            self.assertEqual(store.append_ops(self.key, version, [op], None)["status"], "ok")
+
+    def test_load_state_matches_full_replay(self):
+        self._append(12)  # checkpoints en 5 y 10, más dos ops de cola
+        d = Diagram.objects.get(pk=self.diagram.pk)
+        self.assertEqual(d.version, 12)
+        self.assertEqual(d.snapshot_version, 10)
+        snapshot, version = store.load_state(d)
+        self.assertEqual(version, 12)
+        self.assertEqual(snapshot, _replay(d))
+
+    def test_checkpoint_holds_state_at_its_version(self):
+        self._append(7)
+        d = Diagram.objects.get(pk=self.diagram.pk)
+        self.assertEqual(d.snapshot_version, 5)
+        expected = {}
+        for payload in Operation.objects.filter(diagram=d, seq__lte=5).order_by("seq").values_list("payload", flat=True):
+            expected = apply_custom_op(expected, payload)
+        self.assertEqual(d.snapshot, expected)
+
+    def test_replayed_tail_is_reported(self):
+        self._append(7)
+        replayed = []
+        store.load_state(Diagram.objects.get(pk=self.diagram.pk), replayed)
+        self.assertEqual([e["version"] for e in replayed], [6, 7])
+
+
+class SnapshotVersionBackfillTests(TransactionTestCase):
+    before = [("colaborativo", "0003_alter_diagram_name")]
+    after = [("colaborativo", "0004_diagram_snapshot_version")]
+
+    def _migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        self._migrate(executor.loader.graph.leaf_nodes())
+
+    def test_existing_snapshot_is_a_checkpoint_at_version(self):
+        old = self._migrate(self.before).get_model("colaborativo", "Diagram")
+        pk = old.objects.create(name="previa", version=7, snapshot={"nodes": {}, "links": {}}).pk
+        new = self._migrate(self.after).get_model("colaborativo", "Diagram")
+        self.assertEqual(new.objects.get(pk=pk).snapshot_version, 7)
+
+
+@override_settings(DIAGRAM_SYNC_MAX_GAP=3)
+class CatchUpTests(TestCase):
+    def setUp(self):
+        store._pk_cache.clear()
+        self.diagram = Diagram.objects.create(name="sync")
+        store.append_ops(str(self.diagram.pk), 0, [_node_add(f"n{i}") for i in range(5)], None)
+        self.diagram.refresh_from_db()
+
+    def test_gap_at_the_limit_returns_ops(self):
+        res = store.catch_up(self.diagram, 2)
+        self.assertEqual(res["version"], 5)
+        self.assertEqual([e["version"] for e in res["ops"]], [3, 4, 5])
+        self.assertEqual(res["ops"][0]["op"]["id"], "n2")
+        self.assertNotIn("snapshot", res)
+
+    def test_no_gap_returns_no_ops(self):
+        self.assertEqual(store.catch_up(self.diagram, 5), {"version": 5, "ops": []})
+
+    def test_gap_over_the_limit_returns_snapshot(self):
+        res = store.catch_up(self.diagram, 1)
+        self.assertEqual(res["version"], 5)
+        self.assertEqual(set(res["snapshot"]["nodes"]), {f"n{i}" for i in range(5)})
+        self.assertNotIn("ops", res)
+
+    def test_without_since_returns_snapshot(self):
+        res = store.catch_up(self.diagram, None)
+        self.assertEqual(res["version"], 5)
+        self.assertIn("snapshot", res)
+
+    def test_gap_ok(self):
+        self.assertTrue(store.gap_ok(2, 5))
+        self.assertTrue(store.gap_ok(5, 5))
+        self.assertFalse(store.gap_ok(1, 5))
+        self.assertFalse(store.gap_ok(6, 5))  # cliente "adelantado": snapshot
+        self.assertFalse(store.gap_ok(None, 5))
+        self.assertFalse(store.gap_ok("3", 5))
+
+
+class RebaseCheckTests(SimpleTestCase):
+    # (op, ya confirmada, ¿conmuta?)
+    CASES = [
+        ({"type": "node.add", "id": "a"}, {"type": "node.add", "id": "b"}, True),
+        ({"type": "node.add", "id": "a"}, {"type": "node.add", "id": "a"}, False),
+        ({"type": "node.update", "id": "a", "patch": {"x": 1}}, {"type": "node.update", "id": "b", "patch": {"x": 2}}, True),
+        ({"type": "node.update", "id": "a", "patch": {"x": 1}}, {"type": "node.update", "id": "a", "patch": {"y": 2}}, True),
+        ({"type": "node.update", "id": "a", "patch": {"x": 1}}, {"type": "node.update", "id": "a", "patch": {"x": 1}}, True),
+        ({"type": "node.update", "id": "a", "patch": {"x": 1}}, {"type": "node.update", "id": "a", "patch": {"x": 2}}, False),
+        ({"type": "node.update", "id": "a", "patch": {"x": 1}}, {"type": "node.remove", "id": "a"}, False),
+        ({"type": "node.update", "id": "a", "patch": {"x": 1}}, {"type": "node.add", "id": "a"}, False),
+        ({"type": "link.add", "id": "l", "data": {"sourceId": "a", "targetId": "b"}}, {"type": "node.remove", "id": "c"}, True),
+        ({"type": "link.add", "id": "l", "data": {"sourceId": "a", "targetId": "b"}}, {"type": "node.remove", "id": "b"}, False),
+        ({"type": "link.add", "id": "l", "data": {"sourceId": "a", "targetId": "b"}}, {"type": "relationship.add", "id": "l"}, False),
+        ({"type": "relationship.add", "id": "l", "data": {}}, {"type": "link.add", "id": "m"}, True),
+        ({"type": "node.remove", "id": "a"}, {"type": "node.update", "id": "a", "patch": {"x": 1}}, True),
+        ({"type": "node.remove", "id": "a"}, {"type": "node.remove", "id": "a"}, True),
+        ({"type": "link.remove", "id": "l"}, {"type": "link.remove", "id": "l"}, True),
+        ({"type": "relationship.remove", "id": "l"}, {"type": "node.remove", "id": "a"}, True),
+        ({"type": "otra.cosa", "id": "a"}, {"type": "node.add", "id": "b"}, False),
+    ]
+
+    def test_accept_reject_table(self):
+        for op, other, ok in self.CASES:
+            with self.subTest(op=op, other=other):
+                if ok:
+                    _check(op, other)
+                else:
+                    with self.assertRaises(RebaseConflict):
+                        _check(op, other)
+
+    def test_rebase_checks_every_committed_op(self):
+        op = {"type": "node.update", "id": "a", "patch": {"x": 1}}
+        self.assertIs(rebase_op(op, [{"type": "node.add", "id": "b"}]), op)
+        with self.assertRaises(RebaseConflict):
+            rebase_op(op, [{"type": "node.add", "id": "b"}, {"type": "node.remove", "id": "a"}])
+
+
+class PresenceRejoinTests(SimpleTestCase):
+    group = "diagram.pruebas-presencia"
+
+    def tearDown(self):
+        room = presence._rooms.pop(self.group, None)
+        if room is not None and room.ticker is not None:
+            room.ticker.cancel()
+
+    def _expire(self, member_id):
+        room = presence._rooms[self.group]
+        room.members[member_id]["ts"] = 0  # más viejo que PRESENCE_TTL
+        room._expire()
+        self.assertNotIn(member_id, room.members)
+
+    async def test_touch_rejoins_expired_member(self):
+        presence.join(self.group, "m1", 7)
+        self._expire("m1")
+        presence.touch(self.group, "m1", 7)
+        room = presence._rooms[self.group]
+        self.assertEqual(room.members["m1"]["userId"], 7)
+        self.assertIn("m1", room.dirty)  # se vuelve a anunciar como upsert
+        self.assertNotIn("m1", room.removed)
+
+    async def test_update_rejoins_expired_member(self):
+        presence.join(self.group, "m1", 7)
+        self._expire("m1")
+        presence.update(self.group, "m1", 7, cursor={"x": 1, "y": 2})
+        self.assertEqual(presence._rooms[self.group].members["m1"]["cursor"], {"x": 1, "y": 2})
+
+
+def _random_op(rnd: random.Random, i: int) -> dict:
+    # ids de un espacio chico para que haya colisiones, updates y cascadas
+    nid = f"n{rnd.randrange(60)}"
+    lid = f"l{rnd.randrange(120)}"
+    ends = {"sourceId": f"n{rnd.randrange(60)}", "targetId": f"n{rnd.randrange(60)}"}
+    kind = rnd.choice(
+        ["node.add", "node.add", "node.update", "node.remove", "link.add", "link.add",
+         "link.remove", "relationship.add", "relationship.remove", "otra.cosa"]
+    )
+    # a veces data trae su propio id (igual o distinto al de la op): lo pisa
+    own_id = rnd.choice([{}, {}, {"id": nid}, {"id": f"otro{i}"}])
+    if kind == "node.add":
+        return {"type": kind, "id": nid, "data": {"name": f"C{i}", "position": {"x": i, "y": -i}, **own_id}}
+    if kind == "node.update":
+        return {"type": kind, "id": nid, "patch": {rnd.choice(["name", "color", "position"]): i}}
+    if kind == "link.add":
+        return {"type": kind, "id": lid, "data": {**ends, "kind": "association", **own_id}}
+    if kind == "relationship.add":
+        data = {**ends, "type": rnd.choice(["composition", "aggregation"])}
+        if rnd.random() < 0.5:
+            data["cardinality"] = {"source": "1", "target": "*"}
+        return {"type": kind, "id": lid, "data": data}
+    return {"type": kind, "id": lid if "link" in kind or "relationship" in kind else nid}
+
+
+class IndexedDiagramEquivalenceTests(SimpleTestCase):
+    def test_matches_apply_custom_op_on_random_ops(self):
+        rnd = random.Random(20240501)
+        plain = {"nodes": {}, "links": {}}
+        graph = IndexedDiagram.from_snapshot(plain)
+        for i in range(5000):
+            op = _random_op(rnd, i)
+            apply_custom_op(plain, copy.deepcopy(op))
+            graph.apply(op)
+            if i % 250 == 0:
+                self.assertEqual(graph.to_snapshot(), plain, f"difieren tras la op {i}: {op}")
+        self.assertEqual(graph.to_snapshot(), plain)
+        # el índice no guarda links de más
+        self.assertEqual(
+            {lid for ids in graph.incident.values() for lid in ids}, set(graph.links)
+        )
+
+    def test_data_id_overrides_the_op_id_in_both(self):
+        ops = [
+            {"type": "node.add", "id": "n1", "data": {"id": "x1", "name": "A"}},
+            {"type": "link.add", "id": "l1", "data": {"id": "y1", "sourceId": "n1", "targetId": "n1"}},
+        ]
+        plain = {"nodes": {}, "links": {}}
+        graph = IndexedDiagram()
+        for op in ops:
+            apply_custom_op(plain, copy.deepcopy(op))
+            graph.apply(op)
+        self.assertEqual(plain["links"]["l1"]["id"], "y1")
+        self.assertEqual(graph.to_snapshot(), plain)
+        self.assertEqual(IndexedDiagram.from_snapshot(copy.deepcopy(plain)).to_snapshot(), plain)
+
+    def test_round_trip_from_snapshot(self):
+        rnd = random.Random(7)
+        plain = {"nodes": {}, "links": {}}
+        for i in range(500):
+            apply_custom_op(plain, _random_op(rnd, i))
+        graph = IndexedDiagram.from_snapshot(copy.deepcopy(plain))
+        self.assertEqual(graph.to_snapshot(), plain)
+
+
+class ListarRoomsLimitTests(TestCase):
+    def test_limit_below_one_is_rejected(self):
+        Diagram.objects.create(name="una")
+        for limit in ("0", "-1", "-5", "x"):
+            with self.subTest(limit=limit):
+                res = self.client.get("/api/rooms/listar/", {"limit": limit})
+                self.assertEqual(res.status_code, 400)
+                self.assertEqual(res.json(), {"error": "limit inválido"})
+
+    def test_limit_pages_with_next(self):
+        for i in range(3):
+            Diagram.objects.create(name=f"sala {i}")
+        first = self.client.get("/api/rooms/listar/", {"limit": "2"}).json()
+        self.assertEqual(len(first["data"]), 2)
+        rest = self.client.get("/api/rooms/listar/", {"limit": "2", "cursor": first["next"]}).json()
+        self.assertEqual(len(rest["data"]), 1)
+        self.assertIsNone(rest["next"])
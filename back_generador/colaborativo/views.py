@@ -1,9 +1,27 @@
+import base64
+import gzip
+import hashlib
+import uuid
+from datetime import datetime
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from rest_framework.renderers import JSONRenderer
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
 from django.shortcuts import get_object_or_404
 from .models import Diagram
-from .serializer import RoomSerializer
+from . import metrics
+from .serializer import RoomListSerializer, RoomSerializer
+
+try:
+    import brotli  # opcional: si no está instalado solo se ofrece gzip
+except ImportError:
+    brotli = None
 
 def _add_ws_url(request, room_data):
     """
@@ -15,12 +33,59 @@ def _add_ws_url(request, room_data):
     return room_data
 
 
+LIST_PAGE_SIZE = 50
+LIST_MAX_PAGE_SIZE = 200
+
+
+def _encode_cursor(room) -> str:
+    raw = f"{room.updated_at.isoformat()}|{room.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor: str):
+    raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+    ts, pk = raw.split("|", 1)
+    return datetime.fromisoformat(ts), uuid.UUID(pk)
+
+
 @api_view(["GET"])
 def listar_rooms(request):
-    rooms = Diagram.objects.all().order_by("-updated_at")
-    serializer = RoomSerializer(rooms, many=True)
-    data = [_add_ws_url(request, r) for r in serializer.data]
-    return Response({"data": data})
+    """
+    Lista paginada (keyset sobre updated_at/id) solo con metadatos.
+    ?limit=N&cursor=<next de la página anterior>. Responde 304 si el
+    If-None-Match coincide con el ETag de la página.
+    """
+    try:
+        limit = min(int(request.GET.get("limit", LIST_PAGE_SIZE)), LIST_MAX_PAGE_SIZE)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        return Response({"error": "limit inválido"}, status=status.HTTP_400_BAD_REQUEST)
+
+    rooms = Diagram.objects.only("id", "name", "version", "updated_at").order_by(
+        "-updated_at", "-id"
+    )
+    cursor = request.GET.get("cursor")
+    if cursor:
+        try:
+            ts, pk = _decode_cursor(cursor)
+        except (ValueError, UnicodeDecodeError):
+            return Response({"error": "cursor inválido"}, status=status.HTTP_400_BAD_REQUEST)
+        rooms = rooms.filter(Q(updated_at__lt=ts) | Q(updated_at=ts, id__lt=pk))
+
+    page = list(rooms[: limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    # ETag de la página: cambia si cambia la versión o el nombre de alguna room
+    fingerprint = ";".join(f"{r.id}:{r.version}:{r.updated_at.timestamp()}" for r in page)
+    etag = quote_etag(hashlib.sha1(f"{cursor}|{limit}|{fingerprint}".encode()).hexdigest())
+    if etag in parse_etags(request.headers.get("If-None-Match", "")):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    data = [_add_ws_url(request, r) for r in RoomListSerializer(page, many=True).data]
+    next_cursor = _encode_cursor(page[-1]) if has_more else None
+    return Response({"data": data, "next": next_cursor}, headers={"ETag": etag})
 
 
 @api_view(["POST"])
@@ -33,11 +98,68 @@ def crear_room(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def _room_validators(room) -> tuple[str, str]:
+    # la versión cambia con cada op; updated_at cubre renombres por REST
+    etag = quote_etag(f"{room.id}-{room.version}-{int(room.updated_at.timestamp() * 1000)}")
+    return etag, http_date(room.updated_at.timestamp())
+
+
+def _compress(raw: bytes) -> dict:
+    bodies = {"identity": raw}
+    if len(raw) >= settings.ROOM_COMPRESS_MIN_BYTES:
+        bodies["gzip"] = gzip.compress(raw, compresslevel=6)
+        if brotli is not None:
+            bodies["br"] = brotli.compress(raw)
+    return bodies
+
+
+def _pick_encoding(request, bodies: dict) -> str:
+    accepted = {
+        token.split(";")[0].strip().lower()
+        for token in request.headers.get("Accept-Encoding", "").split(",")
+    }
+    for encoding in ("br", "gzip"):
+        if encoding in bodies and encoding in accepted:
+            return encoding
+    return "identity"
+
+
 @api_view(["GET"])
 def detalle_room(request, pk):
-    room = get_object_or_404(Diagram, pk=pk)
-    data = _add_ws_url(request, RoomSerializer(room).data)
-    return Response(data)
+    """
+    Detalle con snapshot completo. Soporta GET condicional (ETag por versión
+    y Last-Modified → 304) y entrega el cuerpo comprimido (br/gzip). El JSON
+    ya comprimido se guarda en caché por versión, así que repetir la carga
+    cuesta una consulta indexada de metadatos y nada de re-serializar.
+    """
+    meta = get_object_or_404(Diagram.objects.only("id", "version", "updated_at"), pk=pk)
+    etag, last_modified = _room_validators(meta)
+    validators = {"ETag": etag, "Last-Modified": last_modified, "Cache-Control": "no-cache"}
+
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        not_modified = etag in parse_etags(if_none_match)
+    else:
+        since = parse_http_date_safe(request.headers.get("If-Modified-Since", ""))
+        not_modified = since is not None and int(meta.updated_at.timestamp()) <= since
+    if not_modified:
+        return HttpResponseNotModified(headers=validators)
+
+    key = f"room-body:{etag}:{request.scheme}:{request.get_host()}"
+    bodies = cache.get(key) if settings.ROOM_BODY_CACHE else None
+    if bodies is None:
+        room = Diagram.objects.get(pk=meta.pk)
+        data = _add_ws_url(request, RoomSerializer(room).data)
+        bodies = _compress(JSONRenderer().render(data))
+        if settings.ROOM_BODY_CACHE:
+            cache.set(key, bodies, settings.ROOM_BODY_CACHE_TTL)
+
+    encoding = _pick_encoding(request, bodies)
+    response = HttpResponse(bodies[encoding], content_type="application/json", headers=validators)
+    if encoding != "identity":
+        response["Content-Encoding"] = encoding
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
 
 
 @api_view(["PUT", "PATCH"])
@@ -59,3 +181,11 @@ def eliminar_room(request, pk):
     room = get_object_or_404(Diagram, pk=pk)
     room.delete()
     return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+@api_view(["GET"])
+def metricas(request):
+    """
+    Contadores del proceso (drags entrantes vs. emitidos, ticks, etc.).
+    """
+    return Response({"worker": settings.WORKER_ID, **metrics.snapshot()})
@@ -0,0 +1,59 @@
+# colaborativo/wire.py
+# Formato de los frames del socket de diagramas.
+#
+# Por defecto JSON en frames de texto. Un cliente puede pedir MessagePack en
+# frames binarios con el subprotocolo "diagram.msgpack" (Sec-WebSocket-Protocol)
+# o con ?fmt=msgpack; los eventos y comandos son los mismos en ambos casos.
+# MessagePack se ofrece solo con DIAGRAM_MSGPACK=1: si no, se negocia JSON y
+# los eventos de grupo no cargan el frame binario.
+import json
+from urllib.parse import parse_qs
+import msgpack
+from django.conf import settings
+
+JSON = "json"
+MSGPACK = "msgpack"
+MSGPACK_SUBPROTOCOL = "diagram.msgpack"
+
+
+def negotiate(scope) -> tuple[str, str | None]:
+    """(formato, subprotocolo a aceptar) según lo que pidió el cliente."""
+    if not settings.DIAGRAM_MSGPACK:
+        return JSON, None
+    if MSGPACK_SUBPROTOCOL in (scope.get("subprotocols") or []):
+        return MSGPACK, MSGPACK_SUBPROTOCOL
+    qs = parse_qs((scope.get("query_string") or b"").decode("latin-1"))
+    if qs.get("fmt", [JSON])[0] == MSGPACK:
+        return MSGPACK, None
+    return JSON, None
+
+
+def pack(obj) -> bytes:
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def unpack(data: bytes):
+    return msgpack.unpackb(data, raw=False)
+
+
+def dumps(obj) -> str:
+    return json.dumps(obj, separators=(",", ":"))
+
+
+def group_event(evt: str, payload: dict, binary: bool = None) -> dict:
+    """
+    Evento de grupo con el frame ya serializado: se codifica una vez al emitir
+    y cada consumer reenvía el que le toca sin tocarlo. El frame MessagePack
+    solo se arma si está habilitado (binary=None toma DIAGRAM_MSGPACK).
+    """
+    frame = {"evt": evt, **payload}
+    event = {"type": "evt.frame", JSON: dumps(frame)}
+    if settings.DIAGRAM_MSGPACK if binary is None else binary:
+        event[MSGPACK] = pack(frame)
+    return event
+
+
+def frame_bytes(event: dict) -> bytes:
+    """Frame MessagePack de un evento de grupo (lo arma si el emisor no lo trajo)."""
+    data = event.get(MSGPACK)
+    return data if data is not None else pack(json.loads(event[JSON]))
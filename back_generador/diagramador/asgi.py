@@ -5,7 +5,6 @@ import os
 import django
 from django.core.asgi import get_asgi_application  # ✅ IMPORTACIÓN NECESARIA
 from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "diagramador.settings")
 django.setup()
@@ -17,7 +16,7 @@ from colaborativo.jwt_middleware import QueryStringJWTAuthMiddlewareStack
 
 application = ProtocolTypeRouter({
     "http": get_asgi_application(),  # ✅ ACTIVO AHORA
-    "websocket": AuthMiddlewareStack(
+    "websocket": QueryStringJWTAuthMiddlewareStack(
         URLRouter(websocket_urlpatterns)
     ),
 })
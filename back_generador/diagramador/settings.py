@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+from django.core.exceptions import ImproperlyConfigured
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -31,6 +32,27 @@ ALLOWED_HOSTS = ["*"]
 SECRET_KEY = os.environ.get("DJANGO_SECRET_KEY", "insecure-fallback")
 # 🔑 Google Gemini API Key
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", "")
+GEMINI_TIMEOUT = float(os.environ.get("GEMINI_TIMEOUT", "30"))  # lectura, segundos
+GEMINI_CONNECT_TIMEOUT = float(os.environ.get("GEMINI_CONNECT_TIMEOUT", "10"))
+GEMINI_MAX_CONCURRENCY = int(os.environ.get("GEMINI_MAX_CONCURRENCY", "8"))  # llamadas simultáneas por proceso
+# Caché de respuestas de Gemini por (prompt, diagrama, config): "memory" o "redis" (usa REDIS_URL)
+GEMINI_CACHE_BACKEND = os.environ.get("GEMINI_CACHE_BACKEND", "memory")
+GEMINI_CACHE_TTL = float(os.environ.get("GEMINI_CACHE_TTL", "3600"))  # segundos
+GEMINI_CACHE_MAX_ENTRIES = int(os.environ.get("GEMINI_CACHE_MAX_ENTRIES", "256"))
+# Cómo se manda el diagrama a Gemini: "json" (compacto, sin layout) o "uml" (texto)
+GEMINI_PROMPT_FORMAT = os.environ.get("GEMINI_PROMPT_FORMAT", "json")
+# ai_update aplica las ops a medida que Gemini las genera (el cliente puede pedirlo con "stream")
+GEMINI_STREAM_UPDATES = os.environ.get("GEMINI_STREAM_UPDATES", "0") == "1"
+# Motor de fixtures por defecto: "local" (fixture_synth, con seed) o "gemini" (un registro por respuesta)
+FIXTURE_ENGINE = os.environ.get("FIXTURE_ENGINE", "local")
+FIXTURE_MAX_COUNT = int(os.environ.get("FIXTURE_MAX_COUNT", "100000"))  # filas por clase en respuestas no streaming
+FIXTURE_STREAM_MAX_COUNT = int(os.environ.get("FIXTURE_STREAM_MAX_COUNT", "5000000"))  # en generate-sql/stream/
+# Trabajos de fixtures en segundo plano (POST /api/fixtures/jobs/)
+FIXTURE_JOB_WORKERS = int(os.environ.get("FIXTURE_JOB_WORKERS", "2"))  # hilos generando a la vez
+FIXTURE_JOB_MAX_PENDING = int(os.environ.get("FIXTURE_JOB_MAX_PENDING", "32"))  # en cola + corriendo
+FIXTURE_JOB_RETENTION = float(os.environ.get("FIXTURE_JOB_RETENTION", "600"))  # segundos que se guarda el resultado
+FIXTURE_JOB_MAX_RETAINED = int(os.environ.get("FIXTURE_JOB_MAX_RETAINED", "64"))
+FIXTURE_JOB_PROGRESS_INTERVAL = float(os.environ.get("FIXTURE_JOB_PROGRESS_INTERVAL", "0.5"))  # segundos
 # Application definition
 
 INSTALLED_APPS = [
@@ -128,6 +150,51 @@ else:
         # se debe usar channels redis lo correcto en produccion
         "default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}
     }
+
+# Varios workers ASGI (procesos o nodos) con afinidad sala → worker
+DIAGRAM_WORKERS = int(os.environ.get("DIAGRAM_WORKERS", "1"))
+WORKER_ID = int(os.environ.get("WORKER_ID", "0"))
+if DIAGRAM_WORKERS > 1 and not REDIS_URL:
+    # con InMemoryChannelLayer cada proceso tendría sus propios grupos
+    raise ImproperlyConfigured("DIAGRAM_WORKERS > 1 requiere REDIS_URL")
+
+# Estado "caliente" de diagramas en memoria con volcado diferido a BD
+# Cada diagrama abierto lo posee un actor (un solo escritor, sin locks de fila).
+# Opcional: ante una caída se pueden perder ops ya confirmadas (hasta un volcado)
+# y las lecturas REST ven el estado de la BD, no el vivo
+DIAGRAM_HOT_STATE = os.environ.get("DIAGRAM_HOT_STATE", "0") == "1"
+# Con REDIS_URL: lease de dueño de sala y espera máxima al reenviarle comandos
+DIAGRAM_LEASE_TTL_MS = int(os.environ.get("DIAGRAM_LEASE_TTL_MS", "15000"))
+DIAGRAM_REMOTE_TIMEOUT = float(os.environ.get("DIAGRAM_REMOTE_TIMEOUT", "5"))  # segundos
+DIAGRAM_FLUSH_INTERVAL = float(os.environ.get("DIAGRAM_FLUSH_INTERVAL", "2"))  # segundos
+DIAGRAM_FLUSH_OPS = int(os.environ.get("DIAGRAM_FLUSH_OPS", "50"))
+# El snapshot de Diagram se reescribe como checkpoint cada N ops del log
+DIAGRAM_CHECKPOINT_EVERY = int(os.environ.get("DIAGRAM_CHECKPOINT_EVERY", "100"))
+# sync/conflict mandan solo las ops faltantes hasta este hueco; si no, snapshot
+DIAGRAM_SYNC_MAX_GAP = int(os.environ.get("DIAGRAM_SYNC_MAX_GAP", "200"))
+# Caché por proceso clave → diagrama existente (evita un SELECT por op)
+DIAGRAM_META_CACHE_SIZE = int(os.environ.get("DIAGRAM_META_CACHE_SIZE", "10000"))
+DIAGRAM_META_CACHE_TTL = float(os.environ.get("DIAGRAM_META_CACHE_TTL", "60"))  # segundos
+# Drags coalescidos por node y emitidos como evt.drag_batch a esta frecuencia (0 = sin coalescer)
+DIAGRAM_DRAG_RATE_HZ = float(os.environ.get("DIAGRAM_DRAG_RATE_HZ", "20"))
+# Frames MessagePack en el socket (subprotocolo diagram.msgpack); apagado,
+# solo JSON y cada evento de grupo se serializa una sola vez
+DIAGRAM_MSGPACK = os.environ.get("DIAGRAM_MSGPACK", "0") == "1"
+# Websockets con ?token=<JWT>: caché token → usuario (sin BD en reconexiones)
+WS_AUTH_CACHE_SIZE = int(os.environ.get("WS_AUTH_CACHE_SIZE", "10000"))
+WS_AUTH_CACHE_TTL = float(os.environ.get("WS_AUTH_CACHE_TTL", "300"))  # segundos (y nunca más que el exp)
+# 1 = usuario liviano armado solo con los claims (TokenUser), sin consultar BD
+WS_AUTH_FROM_CLAIMS = os.environ.get("WS_AUTH_FROM_CLAIMS", "0") == "1"
+# Presencia: roster por sala con heartbeats; diffs cada PRESENCE_TICK segundos
+PRESENCE_BACKEND = os.environ.get("PRESENCE_BACKEND", "redis" if REDIS_URL else "memory")
+PRESENCE_TTL = float(os.environ.get("PRESENCE_TTL", "30"))  # segundos sin heartbeat
+PRESENCE_TICK = float(os.environ.get("PRESENCE_TICK", "0.25"))
+PRESENCE_MAX_SELECTION = int(os.environ.get("PRESENCE_MAX_SELECTION", "200"))
+# detalle_room: cuerpos (JSON + gzip/br) precalculados por versión en la caché de Django
+ROOM_BODY_CACHE = os.environ.get("ROOM_BODY_CACHE", "1") == "1"
+ROOM_BODY_CACHE_TTL = int(os.environ.get("ROOM_BODY_CACHE_TTL", "600"))  # segundos
+ROOM_COMPRESS_MIN_BYTES = int(os.environ.get("ROOM_COMPRESS_MIN_BYTES", "1024"))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
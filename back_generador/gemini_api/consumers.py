@@ -0,0 +1,40 @@
+# gemini_api/consumers.py
+# Suscripción al progreso de un trabajo de fixtures (service/jobs.py).
+#
+# Al conectar manda el estado actual; después reenvía cada job.update que
+# el trabajo publica en su grupo. {"cmd": "cancel"} cancela el trabajo.
+# El resultado no viaja por el socket: se pide a GET /api/fixtures/jobs/<id>/.
+from asgiref.sync import sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from .service.jobs import FINISHED, get_queue, group_name
+
+
+class FixtureJobConsumer(AsyncJsonWebsocketConsumer):
+    async def connect(self):
+        self.job_id = self.scope["url_route"]["kwargs"]["job_id"]
+        job = get_queue().get(self.job_id)
+        if job is None:
+            await self.close(code=4404)
+            return
+        self.group = group_name(self.job_id)
+        await self.channel_layer.group_add(self.group, self.channel_name)
+        await self.accept()
+        # estado al suscribirse, por si ya avanzó (o terminó) antes de conectar
+        await self.job_update({"job": job.to_dict()})
+
+    async def disconnect(self, code):
+        if getattr(self, "group", None):
+            await self.channel_layer.group_discard(self.group, self.channel_name)
+
+    async def receive_json(self, msg):
+        if msg.get("cmd") == "cancel":
+            # en un hilo: cancel() difunde con async_to_sync, que no corre en el loop
+            job = await sync_to_async(get_queue().cancel)(self.job_id)
+            if job is not None:
+                await self.job_update({"job": job.to_dict()})
+
+    async def job_update(self, event):
+        job = event["job"]
+        await self.send_json({"evt": "job", **job})
+        if job["status"] in FINISHED:
+            await self.close()
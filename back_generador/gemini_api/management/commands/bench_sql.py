@@ -0,0 +1,84 @@
+# gemini_api/management/commands/bench_sql.py
+# Emisión de SQL para fixtures grandes: un INSERT por fila (como antes) vs.
+# iter_sql con INSERT multi-fila y con COPY.
+#
+#   python manage.py bench_sql --rows 100000
+import random
+import time
+from django.core.management.base import BaseCommand
+from gemini_api.service.sql_emitter import COPY, INSERT, iter_sql
+
+
+def _synthetic(rows: int, seed: int) -> tuple[dict, list, list, list]:
+    """Tres tablas con FKs (composición, agregación y asociación) y sus filas."""
+    rnd = random.Random(seed)
+    n = rows // 3
+    fixtures = {
+        "Cliente": [{"id": i, "nombre": f"Cliente {i}", "email": f"c{i}@mail.com"} for i in range(1, n + 1)],
+        "Pedido": [
+            {"id": i, "fecha": "2024-01-01", "total": round(rnd.random() * 1000, 2), "cliente_id": None}
+            for i in range(1, n + 1)
+        ],
+        "Item": [
+            {"id": i, "descripcion": f"Item {i}", "pedido_id": None, "cliente_id": None}
+            for i in range(1, rows - 2 * n + 1)
+        ],
+    }
+    return {"fixtures": fixtures}, ["item.cliente_id"], ["item.pedido_id"], ["pedido.cliente_id"]
+
+
+def _legacy(fixtures, aggregation, composition, associations):
+    # réplica del emisor anterior: lista de FKs rearmada por columna
+    out = []
+    table_ids = {t.lower(): [r["id"] for r in rows] for t, rows in fixtures["fixtures"].items()}
+    for table, rows in fixtures["fixtures"].items():
+        table_l = table.lower()
+        for row in rows:
+            cols, vals = [], []
+            for k, v in row.items():
+                fk_path = f"{table_l}.{k}"
+                if fk_path in (aggregation + composition + associations) and v is None:
+                    v = random.choice(table_ids[k.replace("_id", "")])
+                cols.append(k)
+                vals.append("NULL" if v is None else f"'{v}'" if isinstance(v, str) else str(v))
+            out.append(f"INSERT INTO {table_l} ({', '.join(cols)}) VALUES ({', '.join(vals)});")
+    return out
+
+
+class Command(BaseCommand):
+    help = "Mide la emisión de SQL de fixtures (INSERT por fila vs. multi-fila vs. COPY)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100_000)
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument(
+            "--extra-relations", type=int, default=30,
+            help="relaciones de otras tablas del esquema (encarecen el emisor anterior)",
+        )
+
+    def handle(self, *args, **opts):
+        fixtures, aggregation, composition, associations = _synthetic(opts["rows"], opts["seed"])
+        associations += [f"otra{i}.cliente_id" for i in range(opts["extra_relations"])]
+        self.stdout.write(f"{opts['rows']} filas en {len(fixtures['fixtures'])} tablas")
+
+        start = time.perf_counter()
+        legacy = _legacy(fixtures, aggregation, composition, associations)
+        self._report("INSERT por fila (antes)", start, len(legacy), sum(map(len, legacy)))
+
+        for fmt in (INSERT, COPY):
+            start = time.perf_counter()
+            count = size = 0
+            for stmt in iter_sql(
+                fixtures, None, aggregation, composition, associations,
+                batch_size=opts["batch_size"], fmt=fmt, seed=opts["seed"],
+            ):
+                count += 1
+                size += len(stmt)
+            self._report(f"iter_sql {fmt}", start, count, size)
+
+    def _report(self, label: str, start: float, statements: int, size: int) -> None:
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"{label:<26} {1000 * elapsed:9.1f} ms  {statements:>7} sentencias  {size / 1e6:7.2f} MB"
+        )
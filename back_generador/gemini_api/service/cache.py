@@ -0,0 +1,182 @@
+# gemini_api/service/cache.py
+# Caché de respuestas de Gemini direccionada por contenido.
+#
+# La clave es un sha256 del JSON canónico de (tipo, prompt, diagrama,
+# generationConfig): el mismo prompt sobre el mismo diagrama devuelve la
+# respuesta guardada en milisegundos. En memoria es LRU + TTL; con
+# GEMINI_CACHE_BACKEND=redis se comparte entre procesos.
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+
+
+def make_key(kind: str, prompt: str, diagram, config: dict) -> str:
+    canonical = json.dumps(
+        {"kind": kind, "prompt": prompt, "diagram": diagram, "config": config},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return "gemini:" + hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class MemoryBackend:
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expira_en, json)
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+        # se guarda serializado: cada hit recibe su propia copia mutable
+        return json.loads(value)
+
+    def set(self, key: str, value) -> None:
+        raw = json.dumps(value)
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, raw)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    async def aget(self, key: str):
+        return self.get(key)
+
+    async def aset(self, key: str, value) -> None:
+        self.set(key, value)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisBackend:
+    def __init__(self, url: str, ttl: float):
+        import redis
+
+        self.ttl = int(ttl)
+        self._sync = redis.Redis.from_url(url)
+        self._url = url
+        self._async = None
+
+    def _aclient(self):
+        if self._async is None:
+            import redis.asyncio
+
+            self._async = redis.asyncio.Redis.from_url(self._url)
+        return self._async
+
+    def get(self, key: str):
+        raw = self._sync.get(key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key: str, value) -> None:
+        self._sync.setex(key, self.ttl, json.dumps(value))
+
+    async def aget(self, key: str):
+        raw = await self._aclient().get(key)
+        return None if raw is None else json.loads(raw)
+
+    async def aset(self, key: str, value) -> None:
+        await self._aclient().setex(key, self.ttl, json.dumps(value))
+
+    def __len__(self):
+        return -1  # no se cuenta en Redis
+
+
+class ResponseCache:
+    """
+    Envoltorio con contadores. Solo se guardan respuestas sin "error" para
+    no fijar fallos transitorios de la API.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.hit_seconds = 0.0
+        self.miss_seconds = 0.0
+
+    def get_or_compute(self, key: str, compute):
+        start = time.perf_counter()
+        value = self.backend.get(key)
+        if value is not None:
+            self._hit(start)
+            return value
+        value = compute()
+        self._miss(start)
+        if "error" not in value:
+            self.backend.set(key, value)
+        return value
+
+    async def aget_or_compute(self, key: str, compute):
+        start = time.perf_counter()
+        value = await self.backend.aget(key)
+        if value is not None:
+            self._hit(start)
+            return value
+        value = await compute()
+        self._miss(start)
+        if "error" not in value:
+            await self.backend.aset(key, value)
+        return value
+
+    async def aget(self, key: str):
+        """Consulta sin calcular (streaming); cuenta solo el hit."""
+        start = time.perf_counter()
+        value = await self.backend.aget(key)
+        if value is not None:
+            self._hit(start)
+        return value
+
+    async def aset_miss(self, key: str, value, start: float) -> None:
+        """Guarda lo calculado tras un aget fallido y cuenta el miss."""
+        self._miss(start)
+        if "error" not in value:
+            await self.backend.aset(key, value)
+
+    def _hit(self, start: float) -> None:
+        self.hits += 1
+        self.hit_seconds += time.perf_counter() - start
+
+    def _miss(self, start: float) -> None:
+        self.misses += 1
+        self.miss_seconds += time.perf_counter() - start
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else 0,
+            "avg_hit_ms": round(1000 * self.hit_seconds / self.hits, 3) if self.hits else 0,
+            "avg_miss_ms": round(1000 * self.miss_seconds / self.misses, 3) if self.misses else 0,
+        }
+
+
+_cache = None
+
+
+def get_cache() -> ResponseCache:
+    global _cache
+    if _cache is None:
+        ttl = settings.GEMINI_CACHE_TTL
+        if settings.GEMINI_CACHE_BACKEND == "redis" and settings.REDIS_URL:
+            backend = RedisBackend(settings.REDIS_URL, ttl)
+        else:
+            backend = MemoryBackend(settings.GEMINI_CACHE_MAX_ENTRIES, ttl)
+        _cache = ResponseCache(backend)
+    return _cache
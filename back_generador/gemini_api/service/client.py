@@ -0,0 +1,120 @@
+# gemini_api/service/client.py
+# Clientes HTTP compartidos (con pool keep-alive) para la API de Gemini.
+#
+# - agenerate(): asyncio nativo, para llamarlo con await desde los consumers.
+#   No pasa por sync_to_async, así que una llamada lenta a Gemini no ocupa el
+#   hilo compartido que usan los helpers database_sync_to_async.
+# - generate(): versión síncrona para las vistas REST, sobre un httpx.Client
+#   reutilizado en vez de un requests.post nuevo por llamada.
+import asyncio
+import json
+import threading
+import httpx
+from django.conf import settings
+
+GEMINI_MODEL_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash"
+GEMINI_API_URL = f"{GEMINI_MODEL_URL}:generateContent"
+GEMINI_STREAM_URL = f"{GEMINI_MODEL_URL}:streamGenerateContent"
+
+
+class GeminiConfigError(Exception):
+    pass
+
+
+def _api_key() -> str:
+    api_key = getattr(settings, "GEMINI_API_KEY", None)
+    if not api_key:
+        raise GeminiConfigError("Falta la API Key de Gemini")
+    return api_key
+
+
+def _timeout(read: float = None) -> httpx.Timeout:
+    return httpx.Timeout(
+        read or settings.GEMINI_TIMEOUT, connect=settings.GEMINI_CONNECT_TIMEOUT
+    )
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.GEMINI_MAX_CONCURRENCY,
+        max_keepalive_connections=settings.GEMINI_MAX_CONCURRENCY,
+        keepalive_expiry=30,
+    )
+
+
+# ---- Async (un cliente y un semáforo por event loop)
+_async_client = None
+_async_loop = None
+_semaphore = None
+
+
+def _get_async_client() -> httpx.AsyncClient:
+    global _async_client, _async_loop, _semaphore
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client.is_closed or _async_loop is not loop:
+        _async_client = httpx.AsyncClient(timeout=_timeout(), limits=_limits())
+        _semaphore = asyncio.Semaphore(settings.GEMINI_MAX_CONCURRENCY)
+        _async_loop = loop
+    return _async_client
+
+
+async def agenerate(payload: dict, read_timeout: float = None) -> dict:
+    """POST :generateContent y devuelve el JSON de la respuesta."""
+    params = {"key": _api_key()}
+    client = _get_async_client()
+    async with _semaphore:
+        resp = await client.post(
+            GEMINI_API_URL, params=params, json=payload, timeout=_timeout(read_timeout)
+        )
+    resp.raise_for_status()
+    return resp.json()
+
+
+async def astream_generate(payload: dict, read_timeout: float = None):
+    """
+    POST :streamGenerateContent (SSE) y va entregando el texto generado a
+    medida que llega, trozo a trozo.
+    """
+    params = {"key": _api_key(), "alt": "sse"}
+    client = _get_async_client()
+    async with _semaphore:
+        async with client.stream(
+            "POST", GEMINI_STREAM_URL, params=params, json=payload,
+            timeout=_timeout(read_timeout),
+        ) as resp:
+            resp.raise_for_status()
+            async for line in resp.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                event = json.loads(line[5:])
+                for cand in event.get("candidates") or []:
+                    for part in (cand.get("content") or {}).get("parts") or []:
+                        if part.get("text"):
+                            yield part["text"]
+
+
+# ---- Sync (un cliente por proceso, httpx.Client es thread-safe)
+_sync_client = None
+_sync_lock = threading.Lock()
+
+
+def _get_sync_client() -> httpx.Client:
+    global _sync_client
+    with _sync_lock:
+        if _sync_client is None or _sync_client.is_closed:
+            _sync_client = httpx.Client(timeout=_timeout(), limits=_limits())
+        return _sync_client
+
+
+def generate(payload: dict, read_timeout: float = None) -> dict:
+    """POST :generateContent (bloqueante) y devuelve el JSON de la respuesta."""
+    params = {"key": _api_key()}
+    resp = _get_sync_client().post(
+        GEMINI_API_URL, params=params, json=payload, timeout=_timeout(read_timeout)
+    )
+    resp.raise_for_status()
+    return resp.json()
+
+
+def candidate_text(result: dict) -> str:
+    return result["candidates"][0]["content"]["parts"][0]["text"]
@@ -0,0 +1,239 @@
+# gemini_api/service/fixture_synth.py
+# Generador local de fixtures: valores ficticios tipados por atributo.
+#
+# En vez de pedirle a Gemini cada registro (lento y acotado por el largo de
+# su respuesta), las filas se generan aquí a partir de las clases y de
+# analyze_relationships (vía SchemaGraph), con un seed para que el resultado
+# sea reproducible. Los ids de cada tabla son rangos, así las FKs se toman
+# de un IdPool sin armar listas y se pueden producir millones de filas.
+# Gemini se usa solo, y de forma opcional, para proponer vocabularios de los
+# atributos de texto una vez por esquema (respuesta cacheada).
+import json
+import random
+import unicodedata
+from bisect import bisect_right
+from datetime import date, timedelta
+from itertools import accumulate
+from .cache import get_cache, make_key
+from .client import candidate_text, generate
+from .gemini_fixtures import extract_json
+from .prompt import compact_json
+from .schema_graph import IdPool, SchemaGraph, attributes, table_name
+from .sql_emitter import SELF
+
+FIRST_NAMES = [
+    "Ana", "Luis", "María", "Carlos", "Lucía", "Jorge", "Sofía", "Diego", "Valeria", "Andrés",
+    "Camila", "Miguel", "Daniela", "José", "Paola", "Fernando", "Gabriela", "Ricardo", "Elena", "Pablo",
+]
+LAST_NAMES = [
+    "Gutiérrez", "Rojas", "Fernández", "Vargas", "Mendoza", "Torres", "Flores", "Pérez", "Suárez", "Castro",
+    "Romero", "Morales", "Herrera", "Ortiz", "Silva", "Navarro", "Rivera", "Guzmán", "Salazar", "Quiroga",
+]
+CITIES = ["Santa Cruz", "La Paz", "Cochabamba", "Sucre", "Tarija", "Oruro", "Potosí", "Trinidad", "Cobija"]
+STREETS = ["Los Pinos", "Las Palmas", "Bolívar", "Sucre", "Monseñor Rivero", "Beni", "Velasco", "Ayacucho"]
+# para emails: sin tildes ni mayúsculas
+_ASCII_FIRST = [unicodedata.normalize("NFKD", n).encode("ascii", "ignore").decode().lower() for n in FIRST_NAMES]
+_ASCII_LAST = [unicodedata.normalize("NFKD", n).encode("ascii", "ignore").decode().lower() for n in LAST_NAMES]
+
+_INT_TYPES = {"int", "integer", "number", "long", "bigint", "short", "smallint"}
+_FLOAT_TYPES = {"float", "double", "decimal", "real", "bigdecimal", "money"}
+_BOOL_TYPES = {"bool", "boolean"}
+_DATE_TYPES = {"date", "datetime", "timestamp", "localdate", "localdatetime"}
+
+_BASE_DATE = date(2020, 1, 1)
+_DATES = [(_BASE_DATE + timedelta(days=d)).isoformat() for d in range(2000)]
+
+# int(random() * n) en vez de randrange/randint: mucho más barato por valor y
+# sigue siendo determinista con el mismo seed
+
+
+def _pick(values: list):
+    n = len(values)
+    return lambda rng, i: values[int(rng.random() * n)]
+
+
+def _between(lo: int, hi: int):
+    span = hi - lo + 1
+    return lambda rng, i: lo + int(rng.random() * span)
+
+
+def _value_gen(name: str, typ: str, vocab: list = None):
+    """Función (rng, índice) → valor, elegida una sola vez por atributo."""
+    n = name.lower()
+    if typ in _BOOL_TYPES:
+        return lambda rng, i: rng.random() < 0.5
+    if typ in _DATE_TYPES or "fecha" in n or n.endswith("date"):
+        return _pick(_DATES)
+    if typ in _INT_TYPES:
+        if "edad" in n or "age" in n:
+            return _between(18, 90)
+        if "cantidad" in n or "stock" in n or "qty" in n:
+            return _between(0, 500)
+        return _between(1, 10_000)
+    if typ in _FLOAT_TYPES or any(k in n for k in ("precio", "price", "monto", "total", "salario", "saldo")):
+        return lambda rng, i: round(1 + rng.random() * 9_999, 2)
+    if vocab:
+        return _pick(vocab)
+    if "email" in n or "correo" in n:
+        return lambda rng, i: f"{_ASCII_FIRST[int(rng.random() * 20)]}.{_ASCII_LAST[int(rng.random() * 20)]}{i}@example.com"
+    if "apellido" in n or "lastname" in n:
+        return _pick(LAST_NAMES)
+    if "nombre" in n or "name" in n:
+        return lambda rng, i: f"{FIRST_NAMES[int(rng.random() * 20)]} {LAST_NAMES[int(rng.random() * 20)]}"
+    if "telefono" in n or "teléfono" in n or "phone" in n or "celular" in n:
+        return lambda rng, i: f"7{int(rng.random() * 10_000_000):07d}"
+    if "ciudad" in n or "city" in n:
+        return _pick(CITIES)
+    if "direccion" in n or "dirección" in n or "address" in n:
+        return lambda rng, i: f"Calle {STREETS[int(rng.random() * len(STREETS))]} #{1 + int(rng.random() * 999)}"
+    return lambda rng, i: f"{name} {i}"
+
+
+class IdRanges:
+    """Rangos de ids concatenados vistos como una secuencia, sin materializarla."""
+
+    __slots__ = ("ranges", "starts")
+
+    def __init__(self, ranges: list):
+        self.ranges = ranges
+        self.starts = list(accumulate((len(r) for r in ranges), initial=0))
+
+    def __len__(self) -> int:
+        return self.starts[-1]
+
+    def __getitem__(self, i: int) -> int:
+        k = bisect_right(self.starts, i) - 1
+        return self.ranges[k][i - self.starts[k]]
+
+    def __iter__(self):
+        for r in self.ranges:
+            yield from r
+
+
+class FixturePlan:
+    """
+    Esquema resuelto una vez: atributos propios con su generador, grafo de
+    dependencias (orden, herencia y FKs) y los ids de cada tabla.
+    """
+
+    def __init__(self, diagram: dict, count: int, vocabularies: dict = None):
+        vocabularies = vocabularies or {}
+        self.graph = SchemaGraph.from_diagram(diagram)
+
+        self.classes = {}  # tabla → nombre de la clase tal cual
+        self.gens = {}  # tabla → [(atributo, generador)]
+        for cls in diagram.get("classes") or []:
+            name = cls.get("name")
+            if not name:
+                continue
+            key = table_name(name)
+            self.classes[key] = name
+            self.gens[key] = [
+                (attr, _value_gen(attr, typ, vocabularies.get(f"{name}.{attr}")))
+                for attr, typ in attributes(cls)
+            ]
+
+        # Herencia JOINED: cada clase toma un tramo propio de ids dentro de su
+        # familia; la tabla de una clase tiene una fila por cada id suyo y de
+        # sus subclases (con solo sus columnas), y la subclase reusa ese id
+        self.count = count
+        own: dict[str, range] = {}
+        next_id = {}
+        for key in self.graph.order:
+            root = self.graph.chain(key)[0]
+            start = next_id.get(root, 1)
+            own[key] = range(start, start + count)
+            next_id[root] = start + count
+        self.ids = {
+            key: IdRanges([own[t] for t in self.graph.subtree(key)])
+            for key in self.graph.order
+        }
+
+    def rows(self, key: str, rng: random.Random):
+        """Filas de la tabla `key`, generadas de a una."""
+        gens = self.gens[key]
+        ids = self.ids[key]
+        fks = []
+        for col, (target, kind) in self.graph.fks.get(key, {}).items():
+            if target not in self.ids:
+                continue
+            if f"{key}.{col}" in self.graph.deferred:
+                pool = None  # cierra un ciclo de agregaciones: NULL
+            else:
+                pool = SELF if target == key else IdPool(self.ids[target], rng)
+            fks.append((col, pool, kind != "aggregation"))
+        for pos, i in enumerate(ids):
+            row = {"id": i}
+            for attr, gen in gens:
+                row[attr] = gen(rng, i)
+            for col, pool, required in fks:
+                # agregación: la parte puede quedar sin todo (~20 %)
+                if pool is None or (not required and rng.random() < 0.2):
+                    row[col] = None
+                elif pool is SELF:
+                    row[col] = IdPool.upto(ids, pos, rng)
+                else:
+                    row[col] = pool.next()
+            yield row
+
+
+def iter_fixtures(diagram: dict, count: int, seed: int = 0, vocabularies: dict = None):
+    """
+    {"fixtures": {Clase: generador de filas}} en orden de inserción, más los
+    ids por tabla; cada tabla usa su propio Random derivado del seed.
+    """
+    plan = FixturePlan(diagram, count, vocabularies)
+    fixtures = {
+        plan.classes[key]: plan.rows(key, random.Random(f"{seed}:{key}"))
+        for key in plan.graph.order
+    }
+    return {"fixtures": fixtures}, plan.ids
+
+
+def synthesize(diagram: dict, count: int = 5, seed: int = 0, vocab: bool = False) -> dict:
+    """Mismo formato que generate_test_data_with_gemini, sin llamar a Gemini por filas."""
+    vocabularies = gemini_vocabularies(diagram) if vocab else None
+    lazy, _ = iter_fixtures(diagram, count, seed, vocabularies)
+    return {"fixtures": {name: list(rows) for name, rows in lazy["fixtures"].items()}}
+
+
+# ---- Vocabularios opcionales (una llamada a Gemini por esquema, cacheada)
+VOCAB_PROMPT = """
+Para cada atributo de texto de las clases de este diagrama UML propone 20
+valores ficticios pero realistas (en español cuando aplique). Responde SOLO
+con JSON de la forma {"Clase.atributo": ["valor", ...], ...}.
+"""
+
+VOCAB_GENERATION_CONFIG = {"temperature": 0.4, "response_mime_type": "application/json"}
+
+
+def _schema(diagram: dict) -> dict:
+    # el vocabulario depende solo de clases y atributos, no de ids ni layout
+    return {
+        "classes": [
+            {"name": c.get("name"), "attributes": [f"{a}: {t}" for a, t in attributes(c)]}
+            for c in diagram.get("classes") or []
+        ]
+    }
+
+
+def gemini_vocabularies(diagram: dict) -> dict:
+    schema = _schema(diagram)
+    text = compact_json(schema)
+    key = make_key("vocab", VOCAB_PROMPT, text, VOCAB_GENERATION_CONFIG)
+    result = get_cache().get_or_compute(key, lambda: _call_vocab(text))
+    if "error" in result:
+        return {}  # sin vocabulario se usan los generadores por defecto
+    return {k: v for k, v in result.items() if isinstance(v, list) and v}
+
+
+def _call_vocab(schema_text: str) -> dict:
+    data = {
+        "contents": [{"parts": [{"text": VOCAB_PROMPT}, {"text": schema_text}]}],
+        "generationConfig": VOCAB_GENERATION_CONFIG,
+    }
+    try:
+        result = generate(data, read_timeout=60)
+        return json.loads(extract_json(candidate_text(result)))
+    except Exception as e:
+        return {"error": str(e)}
@@ -1,7 +1,9 @@
-import requests, json, re, random
-from django.conf import settings
-
-GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
+import json, re
+from .cache import get_cache, make_key
+from .client import candidate_text, generate
+from .prompt import render_diagram
+from .schema_graph import table_name
+from .sql_emitter import INSERT, iter_sql
 
 # 🔹 Prompt
 FIXTURE_PROMPT = """
@@ -48,38 +50,36 @@ def extract_json(text: str) -> str:
     return match.group(0) if match else "{}"
 
 # 🔹 Llama a Gemini
+FIXTURE_GENERATION_CONFIG = {
+    "temperature": 0.3,
+    "response_mime_type": "application/json",
+}
+
+
 def generate_test_data_with_gemini(diagram: dict, count: int = 5) -> dict:
-    api_key = getattr(settings, "GEMINI_API_KEY", None)
-    if not api_key:
-        return {"error": "Falta la API Key de Gemini"}
+    # para generar datos solo importan clases, atributos y relaciones
+    text = render_diagram(diagram)
+    key = make_key("fixtures", f"count={count}", text, FIXTURE_GENERATION_CONFIG)
+    return get_cache().get_or_compute(key, lambda: _call_gemini(text, count))
 
-    headers = {"Content-Type": "application/json"}
-    params = {"key": api_key}
 
+def _call_gemini(diagram_text: str, count: int) -> dict:
     data = {
         "contents": [
             {
                 "parts": [
                     {"text": FIXTURE_PROMPT},
                     {"text": f"Genera {count} registros de prueba por clase."},
-                    {"text": f"Diagrama actual:\n{json.dumps(diagram, indent=2)}"},
+                    {"text": f"Diagrama actual:\n{diagram_text}"},
                 ]
             }
         ],
-        "generationConfig": {
-            "temperature": 0.3,
-            "response_mime_type": "application/json",
-        },
+        "generationConfig": FIXTURE_GENERATION_CONFIG,
     }
 
     try:
-        resp = requests.post(
-            GEMINI_API_URL, headers=headers, params=params, json=data, timeout=(10, 60)
-        )
-        resp.raise_for_status()
-        result = resp.json()
-        raw = result["candidates"][0]["content"]["parts"][0]["text"]
-        clean = extract_json(raw)
+        result = generate(data, read_timeout=60)
+        clean = extract_json(candidate_text(result))
         return json.loads(clean)
     except Exception as e:
         return {"error": str(e)}
@@ -95,7 +95,7 @@ def normalize_ids(fixtures: dict) -> dict:
                 row["id"] = idx
     return fixtures
 
-# 🔹 Analiza relaciones UML
+# 🔹 Analiza relaciones UML (nombres normalizados con table_name)
 def analyze_relationships(diagram: dict):
     inheritance = {}
     aggregation = []
@@ -103,12 +103,12 @@ def analyze_relationships(diagram: dict):
     associations = []
 
     for rel in diagram.get("relationships", []):
-        src = rel["sourceName"].lower()
-        tgt = rel["targetName"].lower()
+        src = table_name(rel["sourceName"])
+        tgt = table_name(rel["targetName"])
         rel_type = rel["type"].lower()
 
         if rel_type == "generalization":
-            inheritance[src.capitalize()] = tgt.capitalize()
+            inheritance[src] = tgt
 
         elif rel_type == "aggregation":
             aggregation.append(f"{src}.{tgt}_id")
@@ -132,62 +132,16 @@ def fixtures_to_sql(
     aggregation: list[str] = None,
     composition: list[str] = None,
     associations: list[str] = None,
+    batch_size: int = 500,
+    fmt: str = INSERT,
 ) -> list[str]:
     """
-    Convierte fixtures en sentencias SQL respetando UML.
-    Si faltan FKs en los fixtures, los completa automáticamente.
+    Convierte fixtures en sentencias SQL respetando UML (INSERT multi-fila
+    o COPY), con las tablas en orden de dependencias. Si faltan FKs en los
+    fixtures, los completa automáticamente. Lanza SchemaCycle si las
+    relaciones obligatorias forman un ciclo.
+    Para sets grandes conviene iter_sql, que no arma la lista completa.
     """
-    sql_statements = []
-    inheritance = inheritance or {}
-    aggregation = aggregation or []
-    composition = composition or []
-    associations = associations or []
-
-    # Índice rápido de IDs por tabla
-    table_ids = {
-        table.lower(): [row["id"] for row in rows if "id" in row]
-        for table, rows in fixtures.get("fixtures", {}).items()
-    }
-
-    for table, rows in fixtures.get("fixtures", {}).items():
-        table_l = table.lower()
-        for row in rows:
-            # Herencia (JOINED)
-            if table in inheritance:
-                parent = inheritance[table]
-                parent_cols = [k for k in row.keys() if not k.endswith("_id")]
-                parent_vals = [
-                    "NULL" if row[c] is None else f"'{row[c]}'" if isinstance(row[c], str) else str(row[c])
-                    for c in parent_cols
-                ]
-                sql_statements.append(
-                    f"INSERT INTO {parent.lower()} ({', '.join(parent_cols)}) VALUES ({', '.join(parent_vals)});"
-                )
-                sql_statements.append(f"INSERT INTO {table_l} (id) VALUES ({row['id']});")
-                continue
-
-            # Caso normal
-            cols, vals = [], []
-            for k, v in row.items():
-                fk_path = f"{table_l}.{k}"
-
-                # Autocompletar FKs si faltan
-                if fk_path in (aggregation + composition + associations) and v is None:
-                    target_table = k.replace("_id", "")
-                    if target_table in table_ids and table_ids[target_table]:
-                        v = random.choice(table_ids[target_table])
-                    elif fk_path in aggregation:
-                        v = None
-                    else:
-                        raise ValueError(f"Falta valor para FK obligatoria: {fk_path}")
-
-                cols.append(k)
-                vals.append("NULL" if v is None else f"'{v}'" if isinstance(v, str) else str(v))
-
-            sql_statements.append(
-                f"INSERT INTO {table_l} ({', '.join(cols)}) VALUES ({', '.join(vals)});"
-            )
-
-    return sql_statements
-
-
+    return list(
+        iter_sql(fixtures, inheritance, aggregation, composition, associations, batch_size, fmt)
+    )
@@ -0,0 +1,258 @@
+# gemini_api/service/jobs.py
+# Cola de trabajos de generación de fixtures.
+#
+# POST /api/fixtures/jobs/ devuelve un jobId al instante; la generación corre
+# en un ThreadPoolExecutor acotado (FIXTURE_JOB_WORKERS) fuera del request.
+# El cliente consulta GET /api/fixtures/jobs/<id>/ o se suscribe por
+# websocket (ws/fixtures/jobs/<id>/): el progreso se difunde por el channel
+# layer al grupo del trabajo, con un mensaje cada FIXTURE_JOB_PROGRESS_INTERVAL
+# como mucho.
+#
+# - Deduplicación: el mismo (tipo, diagrama, parámetros) mientras el trabajo
+#   siga en cola, corriendo o retenido devuelve el mismo jobId.
+# - Cancelación: un trabajo en cola no llega a correr; uno en curso se corta
+#   en el próximo reporte de progreso.
+# - Retención: los terminados se guardan FIXTURE_JOB_RETENTION segundos y
+#   como mucho FIXTURE_JOB_MAX_RETAINED (se descartan los más viejos).
+#
+# El estado vive en memoria del proceso: con varios workers, nginx manda
+# /api/fixtures/jobs/ y ws/fixtures/jobs/ al mismo (ver deploy/nginx.conf);
+# el resto de /api/fixtures/ no guarda estado y se reparte entre todos.
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from .cache import make_key
+from .fixture_synth import gemini_vocabularies, iter_fixtures
+from .gemini_fixtures import analyze_relationships, fixtures_to_sql, generate_test_data_with_gemini
+from .prompt import render_diagram
+from .sql_emitter import iter_sql
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+KINDS = ("json", "sql")
+
+_PROGRESS_EVERY = 1000  # filas entre chequeos de progreso/cancelación
+
+
+class QueueFull(Exception):
+    """Demasiados trabajos en cola o corriendo."""
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def group_name(job_id: str) -> str:
+    return f"fixture-job.{job_id}"
+
+
+class Job:
+    def __init__(self, key: str, kind: str, params: dict):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.kind = kind
+        self.params = params
+        self.status = QUEUED
+        self.done = 0
+        self.total = None
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.cancel_requested = threading.Event()
+        self.future = None
+        self._published = 0.0
+
+    def to_dict(self, with_result: bool = False) -> dict:
+        data = {
+            "jobId": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": {"done": self.done, "total": self.total},
+            "created": self.created,
+            "finished": self.finished,
+        }
+        if self.error is not None:
+            data["error"] = self.error
+        if with_result and self.status == DONE:
+            data["result"] = self.result
+        return data
+
+    def progress(self, done: int, total: int = None) -> None:
+        """Lo llama el generador; corta el trabajo si se pidió cancelarlo."""
+        if self.cancel_requested.is_set():
+            raise JobCancelled()
+        self.done = done
+        if total is not None:
+            self.total = total
+        now = time.monotonic()
+        if now - self._published >= settings.FIXTURE_JOB_PROGRESS_INTERVAL:
+            self._published = now
+            _publish(self)
+
+    def start(self) -> None:
+        self.status = RUNNING
+        _publish(self)
+
+    def finish(self, status: str, error: str = None) -> None:
+        self.status = status
+        self.error = error
+        self.finished = time.time()
+        if status == DONE and self.total is not None:
+            self.done = self.total
+        _publish(self)
+
+
+def _publish(job: Job) -> None:
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    try:
+        async_to_sync(layer.group_send)(
+            group_name(job.id), {"type": "job.update", "job": job.to_dict()}
+        )
+    except Exception:
+        logger.exception("No se pudo difundir el progreso del trabajo %s", job.id)
+
+
+def _tracked(rows, job: Job, counter: list):
+    """Pasa las filas contando, y reporta cada _PROGRESS_EVERY."""
+    for row in rows:
+        counter[0] += 1
+        if counter[0] % _PROGRESS_EVERY == 0:
+            job.progress(counter[0])
+        yield row
+
+
+def run_fixture_job(job: Job, diagram: dict):
+    """Genera el resultado del trabajo: {"fixtures": ...} o {"sql": [...]}."""
+    p = job.params
+    if p["engine"] == "gemini":
+        job.progress(0, 1)
+        result = generate_test_data_with_gemini(diagram, p["count"])
+        if "error" in result:
+            raise RuntimeError(result["error"])
+        job.progress(1)
+        if job.kind == "json":
+            return result
+        return {"sql": fixtures_to_sql(result, *analyze_relationships(diagram))}
+
+    vocabularies = gemini_vocabularies(diagram) if p["vocab"] else None
+    lazy, ids = iter_fixtures(diagram, p["count"], p["seed"], vocabularies)
+    job.progress(0, sum(len(v) for v in ids.values()))
+    counter = [0]
+    tracked = {name: _tracked(rows, job, counter) for name, rows in lazy["fixtures"].items()}
+    if job.kind == "json":
+        return {"fixtures": {name: list(rows) for name, rows in tracked.items()}}
+    return {
+        "sql": list(iter_sql({"fixtures": tracked}, *analyze_relationships(diagram), table_ids=ids))
+    }
+
+
+class JobQueue:
+    def __init__(self, workers: int, max_pending: int, retention: float, max_retained: int):
+        self.max_pending = max_pending
+        self.retention = retention
+        self.max_retained = max_retained
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fixture-job")
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._by_key: dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.deduplicated = 0
+
+    def submit(self, kind: str, diagram: dict, params: dict) -> tuple[Job, bool]:
+        """(trabajo, creado); si ya hay uno igual vigente se devuelve ese."""
+        key = make_key(f"fixture-job:{kind}", "", render_diagram(diagram), params)
+        with self._lock:
+            self._evict()
+            job = self._jobs.get(self._by_key.get(key))
+            if job is not None and job.status not in (FAILED, CANCELLED):
+                self.deduplicated += 1
+                return job, False
+            active = sum(1 for j in self._jobs.values() if j.status not in FINISHED)
+            if active >= self.max_pending:
+                raise QueueFull()
+            job = Job(key, kind, params)
+            self._jobs[job.id] = job
+            self._by_key[key] = job.id
+            job.future = self._executor.submit(self._run, job, diagram)
+        return job, True
+
+    def get(self, job_id: str):
+        with self._lock:
+            self._evict()
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str):
+        job = self.get(job_id)
+        if job is None or job.status in FINISHED:
+            return job
+        job.cancel_requested.set()
+        if job.future.cancel():
+            # todavía en cola: no va a correr
+            job.finish(CANCELLED)
+        return job
+
+    def _run(self, job: Job, diagram: dict) -> None:
+        if job.cancel_requested.is_set():
+            job.finish(CANCELLED)
+            return
+        job.start()
+        try:
+            job.result = run_fixture_job(job, diagram)
+        except JobCancelled:
+            job.finish(CANCELLED)
+        except Exception as e:
+            logger.exception("Falló el trabajo de fixtures %s", job.id)
+            job.finish(FAILED, str(e))
+        else:
+            job.finish(DONE)
+
+    def _evict(self) -> None:
+        now = time.time()
+        finished = [j for j in self._jobs.values() if j.status in FINISHED]
+        expired = [j for j in finished if now - j.finished > self.retention]
+        # además de los vencidos, los más viejos que pasen del máximo
+        keep = [j for j in finished if j not in expired]
+        expired += keep[: max(0, len(keep) - self.max_retained)]
+        for job in expired:
+            del self._jobs[job.id]
+            if self._by_key.get(job.key) == job.id:
+                del self._by_key[job.key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return {"jobs": counts, "deduplicated": self.deduplicated}
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue() -> JobQueue:
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue(
+                settings.FIXTURE_JOB_WORKERS,
+                settings.FIXTURE_JOB_MAX_PENDING,
+                settings.FIXTURE_JOB_RETENTION,
+                settings.FIXTURE_JOB_MAX_RETAINED,
+            )
+        return _queue
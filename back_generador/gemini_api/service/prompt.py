@@ -0,0 +1,156 @@
+# gemini_api/service/prompt.py
+# Proyección del diagrama antes de mandarlo a Gemini.
+#
+# El snapshot trae posiciones, tamaños, vértices y otros campos que solo usa
+# el canvas. Aquí se quitan, se serializa sin indentación y, opcionalmente,
+# se renderiza como UML textual, que es bastante más corto. Los ids se
+# conservan siempre: las ops que devuelve Gemini los referencian.
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+LAYOUT_KEYS = {
+    "position", "size", "dragging", "vertices", "sourcePort", "targetPort",
+    "z", "angle", "attrs", "ports", "markup", "router", "connector",
+}
+
+DEFAULT_SIZE = {"width": 180, "height": 120}
+
+
+def compact_json(obj) -> str:
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+def _label_texts(labels) -> list:
+    # de {position, attrs: {text: {text}}} solo interesa el texto (cardinalidades)
+    texts = []
+    for label in labels or []:
+        if isinstance(label, str):
+            texts.append(label)
+        elif isinstance(label, dict):
+            text = label.get("text") or ((label.get("attrs") or {}).get("text") or {}).get("text")
+            if text:
+                texts.append(text)
+    return texts
+
+
+def project(value):
+    """Copia del diagrama sin campos de layout ni valores vacíos."""
+    if isinstance(value, dict):
+        out = {}
+        for k, v in value.items():
+            if k in LAYOUT_KEYS:
+                continue
+            v = _label_texts(v) if k == "labels" else project(v)
+            if v in (None, "", [], {}):
+                continue
+            out[k] = v
+        return out
+    if isinstance(value, list):
+        return [project(v) for v in value]
+    return value
+
+
+def _members(cls: dict) -> list[str]:
+    lines = []
+    for a in cls.get("attributes") or []:
+        if isinstance(a, dict):
+            typ = f": {a['type']}" if a.get("type") else ""
+            lines.append(f"  {a.get('name')}{typ}")
+        else:
+            lines.append(f"  {a}")
+    for m in cls.get("methods") or []:
+        if isinstance(m, dict):
+            ret = f": {m['returnType']}" if m.get("returnType") else ""
+            lines.append(f"  {m.get('name')}({m.get('parameters', '')}){ret}")
+        else:
+            lines.append(f"  {m}")
+    return lines
+
+
+def to_uml_text(diagram: dict) -> str:
+    """
+    UML textual compacto. Acepta el snapshot {nodes, links} y el formato de
+    exportación {classes, relationships}.
+    """
+    lines = []
+    if "nodes" in diagram or "links" in diagram:
+        nodes = diagram.get("nodes") or {}
+        for nid, node in nodes.items():
+            lines.append(f"class {node.get('name', '?')} #{nid} {{")
+            lines += _members(node)
+            lines.append("}")
+        for lid, link in (diagram.get("links") or {}).items():
+            kind = link.get("type") or link.get("kind") or "association"
+            card = link.get("cardinality") or {}
+            cards = f" [{card.get('source', '')}..{card.get('target', '')}]" if card else ""
+            labels = _label_texts(link.get("labels"))
+            extra = f" {labels}" if labels else ""
+            lines.append(
+                f"link #{lid}: #{link.get('sourceId')} -{kind}-> #{link.get('targetId')}{cards}{extra}"
+            )
+        return "\n".join(lines)
+
+    for cls in diagram.get("classes") or []:
+        lines.append(f"class {cls.get('name', '?')} {{")
+        lines += _members(cls)
+        lines.append("}")
+    for rel in diagram.get("relationships") or []:
+        card = rel.get("cardinality") or {}
+        cards = f" [{card.get('source', '')} : {card.get('target', '')}]" if card else ""
+        lines.append(
+            f"{rel.get('sourceName')} -{rel.get('type', 'association')}-> {rel.get('targetName')}{cards}"
+        )
+    return "\n".join(lines)
+
+
+def render_diagram(diagram: dict, fmt: str = "json") -> str:
+    """Texto del diagrama para el prompt; registra bytes y tokens ahorrados."""
+    projected = project(diagram)
+    text = to_uml_text(projected) if fmt == "uml" else compact_json(projected)
+
+    # el "antes" exige volcar el diagrama entero con indent: solo si se registra
+    if logger.isEnabledFor(logging.INFO):
+        before = len(json.dumps(diagram, indent=2).encode("utf-8"))
+        after = len(text.encode("utf-8"))
+        # ~4 bytes por token es la aproximación habitual para texto tipo JSON
+        logger.info(
+            "Prompt de diagrama (%s): %d → %d bytes, ~%d → ~%d tokens",
+            fmt, before, after, before // 4, after // 4,
+        )
+    return text
+
+
+class LayoutPlacer:
+    """
+    Gemini ya no ve posiciones: los node.add que devuelve se ubican en una
+    columna a la derecha de lo existente para que el canvas los pueda dibujar.
+    """
+
+    def __init__(self, diagram: dict):
+        nodes = (diagram or {}).get("nodes") or {}
+        xs = [
+            (n.get("position") or {}).get("x", 0)
+            + (n.get("size") or {}).get("width", DEFAULT_SIZE["width"])
+            for n in nodes.values()
+            if isinstance(n, dict)
+        ]
+        self.x = max(xs) + 60 if xs else 40
+        self.y = 40
+
+    def place(self, op) -> None:
+        if not isinstance(op, dict) or op.get("type") != "node.add":
+            return
+        data = op.setdefault("data", {})
+        if "position" not in data:
+            data["position"] = {"x": self.x, "y": self.y}
+            self.y += DEFAULT_SIZE["height"] + 40
+        data.setdefault("size", dict(DEFAULT_SIZE))
+
+
+def restore_layout(result: dict, diagram: dict) -> dict:
+    placer = LayoutPlacer(diagram)
+    for op in result.get("updates") or []:
+        placer.place(op)
+    return result
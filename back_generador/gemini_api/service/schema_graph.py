@@ -0,0 +1,210 @@
+# gemini_api/service/schema_graph.py
+# Grafo de dependencias entre tablas de los fixtures.
+#
+# Cada tabla depende de su superclase (herencia JOINED: el id de la subclase
+# es FK al padre) y de las tablas a las que apuntan sus FKs. El orden
+# topológico de ese grafo es el orden de inserción: los padres van antes que
+# los hijos y el SQL se carga de una pasada, sin constraints diferidas.
+#
+# Las FKs de agregación admiten NULL: si hay un ciclo se rompe dejando en
+# NULL una agregación del ciclo (deferred). Un ciclo de herencia, composición o
+# asociación no tiene orden posible y se reporta con SchemaCycle.
+import heapq
+import math
+
+
+class SchemaCycle(ValueError):
+    """Ciclo de dependencias obligatorias entre tablas."""
+
+    def __init__(self, cycle: list[str]):
+        self.cycle = cycle
+        super().__init__("Ciclo de dependencias entre tablas: " + " → ".join(cycle))
+
+
+def table_name(name: str) -> str:
+    """Nombre de tabla de una clase: el mismo para relaciones, fixtures y SQL."""
+    return str(name).strip().lower()
+
+
+def fk_target(col: str) -> str:
+    return col[: -len("_id")] if col.endswith("_id") else col
+
+
+def attributes(cls: dict) -> list[tuple[str, str]]:
+    """[(nombre, tipo)] aceptando {name, type} o "nombre: tipo"."""
+    out = []
+    for a in cls.get("attributes") or []:
+        if isinstance(a, dict):
+            name, typ = a.get("name"), a.get("type") or ""
+        else:
+            name, _, typ = str(a).partition(":")
+        name = (name or "").strip().lstrip("+-#~").strip()
+        if name and name.lower() != "id":
+            out.append((name, typ.strip().lower()))
+    return out
+
+
+class SchemaGraph:
+    """
+    Tablas (en minúsculas, en orden de aparición), padre de cada subclase,
+    FKs por tabla {tabla: {col: (destino, tipo)}} y el orden de inserción.
+    """
+
+    def __init__(self, tables, inheritance=None, aggregation=None, composition=None, associations=None):
+        self.tables = list(dict.fromkeys(table_name(t) for t in tables))
+        known = set(self.tables)
+        self.parent = {
+            table_name(c): table_name(p)
+            for c, p in (inheritance or {}).items()
+            if table_name(c) in known and table_name(p) in known
+        }
+        self.fks: dict[str, dict[str, tuple]] = {}
+        for kind, paths in (
+            ("composition", composition or []),
+            ("association", associations or []),
+            ("aggregation", aggregation or []),
+        ):
+            for path in paths:
+                table, col = path.split(".", 1)
+                self.fks.setdefault(table_name(table), {}).setdefault(col, (table_name(fk_target(col)), kind))
+        self.deferred: set[str] = set()  # "tabla.col" de agregación que quedan en NULL
+        self.order = self._toposort()
+
+    @classmethod
+    def from_diagram(cls, diagram: dict) -> "SchemaGraph":
+        from .gemini_fixtures import analyze_relationships
+
+        tables = [c["name"] for c in diagram.get("classes") or [] if c.get("name")]
+        return cls(tables, *analyze_relationships(diagram))
+
+    def required(self, table: str, col: str) -> bool:
+        return self.fks.get(table, {}).get(col, (None, "aggregation"))[1] != "aggregation"
+
+    def chain(self, table: str) -> list[str]:
+        """Ancestros de la tabla, de la raíz hacia ella."""
+        out = [table]
+        while out[-1] in self.parent:
+            out.append(self.parent[out[-1]])
+        return out[::-1]
+
+    def subtree(self, table: str) -> list[str]:
+        """La tabla y todas sus subclases, en orden de inserción."""
+        return [t for t in self.order if table in self.chain(t)]
+
+    # -- orden topológico
+    def _edges(self) -> dict[str, set]:
+        known = set(self.tables)
+        deps = {t: set() for t in self.tables}
+        for child, parent in self.parent.items():
+            deps[child].add(parent)
+        for table, cols in self.fks.items():
+            if table not in deps:
+                continue
+            for col, (target, kind) in cols.items():
+                # auto-referencia: se resuelve dentro de la tabla (ver IdPool.upto)
+                if target == table or target not in known:
+                    continue
+                if kind != "aggregation" or f"{table}.{col}" not in self.deferred:
+                    deps[table].add(target)
+        return deps
+
+    def _toposort(self) -> list[str]:
+        position = {t: i for i, t in enumerate(self.tables)}
+        order = []
+        while True:
+            deps = self._edges()
+            placed = set(order)
+            remaining = {t: d - placed for t, d in deps.items() if t not in placed}
+            dependents = {t: [] for t in remaining}
+            for t, d in remaining.items():
+                for dep in d:
+                    dependents[dep].append(t)
+            # Kahn; a igualdad de condiciones, orden de aparición
+            ready = [position[t] for t, d in remaining.items() if not d]
+            heapq.heapify(ready)
+            while ready:
+                t = self.tables[heapq.heappop(ready)]
+                order.append(t)
+                for dependent in dependents[t]:
+                    remaining[dependent].discard(t)
+                    if not remaining[dependent]:
+                        heapq.heappush(ready, position[dependent])
+            stuck = [t for t in self.tables if t not in set(order)]
+            if not stuck:
+                return order
+            # se suelta una agregación del ciclo; si no le queda ninguna (p. ej. el
+            # arco que lo cierra es de herencia), no hay orden posible
+            cycle = self._find_cycle(stuck)
+            loose = next(
+                (
+                    f"{t}.{col}"
+                    for t, dep in zip(cycle, cycle[1:])
+                    for col, (target, kind) in self.fks.get(t, {}).items()
+                    if target == dep and kind == "aggregation" and f"{t}.{col}" not in self.deferred
+                ),
+                None,
+            )
+            if loose is None:
+                raise SchemaCycle(cycle)
+            self.deferred.add(loose)
+
+    def _find_cycle(self, stuck: list[str]) -> list[str]:
+        deps = self._edges()
+        stuck_set = set(stuck)
+        path, on_path, seen = [], {}, set()
+
+        def visit(t):
+            on_path[t] = len(path)
+            path.append(t)
+            for dep in sorted(deps[t] & stuck_set):
+                if dep in on_path:
+                    return path[on_path[dep]:] + [dep]
+                if dep not in seen:
+                    found = visit(dep)
+                    if found:
+                        return found
+            path.pop()
+            del on_path[t]
+            seen.add(t)
+            return None
+
+        for t in stuck:
+            if t not in seen:
+                found = visit(t)
+                if found:
+                    return found
+        return stuck
+
+
+class IdPool:
+    """
+    Ids de una tabla destino para completar FKs. En vez de sortear cada celda
+    se recorre una permutación fija (j·a + b mod n, con a coprimo con n): sin
+    memoria extra aunque los ids sean un range enorme, y los padres reciben
+    hijos en partes iguales.
+    """
+
+    __slots__ = ("ids", "n", "a", "b", "j")
+
+    def __init__(self, ids, rng):
+        self.ids = ids
+        self.n = n = len(ids)
+        a = rng.randrange(1, n) if n > 1 else 1
+        while math.gcd(a, n) != 1:
+            a += 1
+        self.a, self.b, self.j = a, rng.randrange(n) if n else 0, 0
+
+    def take(self, k: int) -> list:
+        ids, n, a, b, j = self.ids, self.n, self.a, self.b, self.j
+        self.j = j + k
+        return [ids[(a * x + b) % n] for x in range(j, j + k)]
+
+    def next(self):
+        x = self.j
+        self.j = x + 1
+        return self.ids[(self.a * x + self.b) % self.n]
+
+    @staticmethod
+    def upto(ids, pos: int, rng):
+        """Auto-referencia: un id ya insertado (o la propia fila) de la misma tabla."""
+        return ids[int(rng.random() * (pos + 1))]
@@ -0,0 +1,169 @@
+# gemini_api/service/sql_emitter.py
+# Emisor de SQL para fixtures: INSERT multi-fila o COPY de Postgres.
+#
+# Todo lo que depende solo del esquema (orden de tablas, FKs por tabla,
+# orden de columnas) se calcula una vez antes de recorrer filas. Las
+# sentencias se generan de a lotes con un generador, así un set enorme se
+# puede escribir o transmitir sin tener todo el SQL en memoria.
+import json
+import random
+from typing import Iterator
+from .schema_graph import IdPool, SchemaGraph, table_name
+
+INSERT = "insert"
+COPY = "copy"
+
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def sql_literal(v) -> str:
+    if v is None:
+        return "NULL"
+    if isinstance(v, bool):
+        return "TRUE" if v else "FALSE"
+    if isinstance(v, (int, float)):
+        return str(v)
+    if isinstance(v, (dict, list)):
+        v = json.dumps(v, ensure_ascii=False)
+    return "'" + str(v).replace("'", "''") + "'"
+
+
+def _quote(v: str) -> str:
+    return "'" + v.replace("'", "''") + "'"
+
+
+# despacho por tipo exacto: evita la cadena de isinstance en los casos comunes
+_SQL_FAST = {str: _quote, int: str, float: repr, type(None): lambda v: "NULL"}
+_COPY_FAST = {str: lambda v: v.translate(_COPY_ESCAPES), int: str, float: repr, type(None): lambda v: "\\N"}
+
+
+def copy_literal(v) -> str:
+    if v is None:
+        return "\\N"
+    if isinstance(v, bool):
+        return "t" if v else "f"
+    if isinstance(v, (dict, list)):
+        v = json.dumps(v, ensure_ascii=False)
+    return str(v).translate(_COPY_ESCAPES)
+
+
+SELF = "self"  # FK a la misma tabla: se toma un id ya insertado
+DEFERRED = "deferred"  # FK que se emite en NULL para romper un ciclo
+
+
+class SqlPlan:
+    """Metadatos del esquema precalculados para emitir filas sin recalcular nada."""
+
+    def __init__(
+        self, fixtures: dict, inheritance=None, aggregation=None, composition=None,
+        associations=None, table_ids: dict = None, seed=None,
+    ):
+        self.graph = SchemaGraph(fixtures, inheritance, aggregation, composition, associations)
+        # ids existentes por tabla, para completar FKs vacías; con filas
+        # generadas de a una hay que pasarlos (p. ej. rangos) para no consumirlas
+        if table_ids is not None:
+            self.table_ids = {table_name(t): ids for t, ids in table_ids.items()}
+        else:
+            self.table_ids = {
+                table_name(table): [row["id"] for row in rows if "id" in row]
+                for table, rows in fixtures.items()
+            }
+        self.rng = random.Random(seed)
+
+    def fillers(self, table: str, cols: tuple) -> list:
+        """[(posición, columna, IdPool | SELF | DEFERRED | None)] de las FKs a completar o anular."""
+        fillers = []
+        for i, col in enumerate(cols):
+            target, kind = self.graph.fks.get(table, {}).get(col, (None, None))
+            if target is None:
+                continue
+            if f"{table}.{col}" in self.graph.deferred:
+                # agregación que cierra un ciclo: su tabla destino va después
+                fillers.append((i, col, DEFERRED))
+                continue
+            if kind == "aggregation":
+                continue  # NULL es un valor válido y se respeta
+            ids = self.table_ids.get(target)
+            pool = SELF if target == table and ids else IdPool(ids, self.rng) if ids else None
+            fillers.append((i, col, pool))
+        return fillers
+
+
+def _groups(rows, batch_size: int):
+    """Lotes consecutivos de filas con las mismas columnas."""
+    cols, batch = None, []
+    for row in rows:
+        keys = tuple(row)
+        if keys != cols or len(batch) >= batch_size:
+            if batch:
+                yield cols, batch
+            cols, batch = keys, []
+        batch.append(row)
+    if batch:
+        yield cols, batch
+
+
+def _fill(table: str, batch: list, fillers: list, plan: SqlPlan, offset: int) -> list:
+    """Valores de cada fila con las FKs vacías completadas desde los IdPool."""
+    values = [list(row.values()) for row in batch]
+    for i, col, pool in fillers:
+        if pool is DEFERRED:
+            for v in values:
+                v[i] = None
+            continue
+        missing = [v for v in values if v[i] is None]
+        if not missing:
+            continue
+        if pool is None:
+            raise ValueError(f"Falta valor para FK obligatoria: {table}.{col}")
+        if pool is SELF:
+            ids = plan.table_ids[table]
+            for pos, v in enumerate(values, start=offset):
+                if v[i] is None:
+                    v[i] = IdPool.upto(ids, pos, plan.rng)
+            continue
+        for v, fk in zip(missing, pool.take(len(missing))):
+            v[i] = fk
+    return values
+
+
+def _emit(table: str, cols: tuple, values: list, fmt: str) -> str:
+    fast, slow = (_COPY_FAST, copy_literal) if fmt == COPY else (_SQL_FAST, sql_literal)
+    out = [[(fast.get(type(v)) or slow)(v) for v in vals] for vals in values]
+    if fmt == COPY:
+        lines = "\n".join("\t".join(v) for v in out)
+        return f"COPY {table} ({', '.join(cols)}) FROM stdin;\n{lines}\n\\.\n"
+    tuples = ",\n".join("(" + ", ".join(v) + ")" for v in out)
+    return f"INSERT INTO {table} ({', '.join(cols)}) VALUES\n{tuples};"
+
+
+def iter_sql(
+    fixtures: dict,
+    inheritance: dict = None,
+    aggregation: list[str] = None,
+    composition: list[str] = None,
+    associations: list[str] = None,
+    batch_size: int = 500,
+    fmt: str = INSERT,
+    seed=None,
+    table_ids: dict = None,
+) -> Iterator[str]:
+    """
+    Genera el SQL de `fixtures` ({"fixtures": {Tabla: [filas]}}) por lotes de
+    hasta batch_size filas, tablas en orden topológico (padres primero).
+    Herencia JOINED: cada subclase va a su propia tabla con el mismo id que
+    su fila en la tabla padre. Las filas pueden ser generadores si se pasa
+    table_ids. Lanza SchemaCycle si no hay orden de inserción posible.
+    """
+    data = fixtures.get("fixtures", {})
+    plan = SqlPlan(data, inheritance, aggregation, composition, associations, table_ids, seed)
+    by_table = {table_name(t): rows for t, rows in data.items()}
+
+    for table in plan.graph.order:
+        fillers = {}  # por conjunto de columnas, calculado una vez
+        offset = 0
+        for cols, batch in _groups(by_table[table], batch_size):
+            if cols not in fillers:
+                fillers[cols] = plan.fillers(table, cols)
+            yield _emit(table, cols, _fill(table, batch, fillers[cols], plan, offset), fmt)
+            offset += len(batch)
@@ -0,0 +1,96 @@
+# gemini_api/service/stream.py
+# Parser incremental del array "updates" mientras Gemini lo va generando.
+#
+# La respuesta llega en trozos arbitrarios de texto ({"updates": [ {...}, {..).
+# En cuanto un elemento del array está completo se devuelve ya parseado, sin
+# esperar al cierre del JSON.
+import json
+import re
+
+_UPDATES_START = re.compile(r'"updates"\s*:\s*\[')
+
+
+class UpdatesStreamParser:
+    def __init__(self):
+        self.buf = ""
+        self.in_array = False
+        self.done = False
+        self._reset_element()
+
+    def _reset_element(self):
+        self.start = None  # inicio del elemento actual dentro de buf
+        self.pos = 0  # hasta dónde se escaneó buf
+        self.depth = 0
+        self.in_str = False
+        self.esc = False
+
+    def feed(self, chunk: str) -> list:
+        """Agrega texto y devuelve los elementos completados con él."""
+        out = []
+        if self.done:
+            return out
+        self.buf += chunk
+
+        if not self.in_array:
+            m = _UPDATES_START.search(self.buf)
+            if not m:
+                return out
+            self.buf = self.buf[m.end():]
+            self.in_array = True
+
+        while True:
+            if self.start is None:
+                # saltar separadores hasta el próximo elemento (o el cierre)
+                i = self.pos
+                while i < len(self.buf) and self.buf[i] in " \t\r\n,":
+                    i += 1
+                if i >= len(self.buf):
+                    self.buf, self.pos = "", 0
+                    return out
+                if self.buf[i] == "]":
+                    self.done = True
+                    return out
+                self.start = self.pos = i
+
+            end = self._scan()
+            if end is None:
+                return out
+            out.append(json.loads(self.buf[self.start:end]))
+            self.buf = self.buf[end:]
+            self._reset_element()
+
+    def _scan(self):
+        """Fin (exclusivo) del elemento actual, o None si aún no llegó entero."""
+        buf = self.buf
+        i = self.pos
+        while i < len(buf):
+            c = buf[i]
+            if self.in_str:
+                if self.esc:
+                    self.esc = False
+                elif c == "\\":
+                    self.esc = True
+                elif c == '"':
+                    self.in_str = False
+                    if self.depth == 0:
+                        self.pos = i + 1
+                        return i + 1
+            elif c == '"':
+                self.in_str = True
+            elif c in "{[":
+                self.depth += 1
+            elif c in "}]":
+                if self.depth == 0:
+                    # "]" que cierra el array tras un escalar
+                    self.pos = i
+                    return i
+                self.depth -= 1
+                if self.depth == 0:
+                    self.pos = i + 1
+                    return i + 1
+            elif c == "," and self.depth == 0:
+                self.pos = i
+                return i
+            i += 1
+        self.pos = i
+        return None
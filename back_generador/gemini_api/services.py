@@ -1,7 +1,11 @@
-import requests, json
+import copy
+import json
+import time
 from django.conf import settings
-
-GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
+from .service.cache import get_cache, make_key
+from .service.client import agenerate, astream_generate, candidate_text, generate
+from .service.prompt import LayoutPlacer, render_diagram, restore_layout
+from .service.stream import UpdatesStreamParser
 
 # 👇 Aquí definimos el system_prompt dentro del archivo
 SYSTEM_PROMPT = """
@@ -63,37 +67,92 @@ Reglas:
 
 
 
-def process_diagram_with_gemini(prompt: str, diagram: dict) -> dict:
-    api_key = getattr(settings, "GEMINI_API_KEY", None)
-    if not api_key:
-        return {"error": "Falta la API Key de Gemini"}
+GENERATION_CONFIG = {
+    "temperature": 0.2,
+    "response_mime_type": "application/json",
+}
 
-    headers = {"Content-Type": "application/json"}
-    params = {"key": api_key}
 
-    data = {
+DIAGRAM_HEADERS = {
+    "json": "Diagrama actual (JSON compacto, sin datos de layout):",
+    "uml": "Diagrama actual (UML textual; #id es el id de cada clase o relación):",
+}
+
+
+def build_diagram_request(prompt: str, diagram_text: str) -> dict:
+    fmt = settings.GEMINI_PROMPT_FORMAT
+    return {
         "contents": [
             {
                 "parts": [
                     {"text": SYSTEM_PROMPT},
                     {"text": f"Prompt del usuario:\n{prompt}"},
-                    {"text": f"Diagrama actual:\n{json.dumps(diagram, indent=2)}"},
+                    {"text": f"{DIAGRAM_HEADERS.get(fmt, DIAGRAM_HEADERS['json'])}\n{diagram_text}"},
                 ]
             }
         ],
-        "generationConfig": {
-            "temperature": 0.2,
-            "response_mime_type": "application/json",
-        },
+        "generationConfig": GENERATION_CONFIG,
     }
 
+
+def _call(prompt: str, diagram_text: str) -> dict:
     try:
-        resp = requests.post(
-            GEMINI_API_URL, headers=headers, params=params, json=data, timeout=(10, 30)
-        )
-        resp.raise_for_status()
-        result = resp.json()
-        raw = result["candidates"][0]["content"]["parts"][0]["text"]
-        return json.loads(raw)
+        result = generate(build_diagram_request(prompt, diagram_text))
+        return json.loads(candidate_text(result))
     except Exception as e:
         return {"error": str(e)}
+
+
+async def _acall(prompt: str, diagram_text: str) -> dict:
+    try:
+        result = await agenerate(build_diagram_request(prompt, diagram_text))
+        return json.loads(candidate_text(result))
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def _prepare(prompt: str, diagram: dict) -> tuple[str, str]:
+    # la clave sale del texto proyectado: mover nodos no invalida la caché
+    text = render_diagram(diagram, settings.GEMINI_PROMPT_FORMAT)
+    return text, make_key("diagram", prompt, text, GENERATION_CONFIG)
+
+
+def process_diagram_with_gemini(prompt: str, diagram: dict) -> dict:
+    text, key = _prepare(prompt, diagram)
+    result = get_cache().get_or_compute(key, lambda: _call(prompt, text))
+    return restore_layout(result, diagram)
+
+
+async def aprocess_diagram_with_gemini(prompt: str, diagram: dict) -> dict:
+    """Igual que process_diagram_with_gemini pero awaitable (sin hilos)."""
+    text, key = _prepare(prompt, diagram)
+    result = await get_cache().aget_or_compute(key, lambda: _acall(prompt, text))
+    return restore_layout(result, diagram)
+
+
+async def astream_diagram_updates(prompt: str, diagram: dict):
+    """
+    Versión streaming: va entregando cada op de "updates" apenas Gemini
+    termina de generarla. Al final la respuesta completa queda en caché.
+    """
+    text, key = _prepare(prompt, diagram)
+    cache = get_cache()
+    placer = LayoutPlacer(diagram)
+
+    start = time.perf_counter()
+    cached = await cache.aget(key)
+    if cached is not None:
+        for op in cached.get("updates") or []:
+            placer.place(op)
+            yield op
+        return
+
+    parser = UpdatesStreamParser()
+    updates = []
+    async for chunk in astream_generate(build_diagram_request(prompt, text)):
+        for op in parser.feed(chunk):
+            updates.append(copy.deepcopy(op))
+            placer.place(op)
+            yield op
+    if parser.done:
+        await cache.aset_miss(key, {"updates": updates}, start)
@@ -1,3 +1,166 @@
-from django.test import TestCase
+import re
 
-# Create your tests here.
+from django.test import SimpleTestCase, override_settings
+
+from .service.fixture_synth import iter_fixtures
+from .service.gemini_fixtures import analyze_relationships
+from .service.schema_graph import SchemaCycle, SchemaGraph
+from .service.sql_emitter import iter_sql
+from .views import _diagram_error, _flag
+
+
+def _rel(source: str, target: str, kind: str, **extra) -> dict:
+    return {"sourceName": source, "targetName": target, "type": kind, **extra}
+
+
+def _inserts(statements) -> list[tuple[str, list[str], list[list[str]]]]:
+    """[(tabla, columnas, filas)] de las sentencias INSERT multi-fila."""
+    out = []
+    for sql in statements:
+        head, _, body = sql.partition(" VALUES\n")
+        table, cols = re.match(r"INSERT INTO (\w+) \((.*)\)", head).groups()
+        rows = [r.strip("(); ").split(", ") for r in body.split(",\n")]
+        out.append((table, cols.split(", "), rows))
+    return out
+
+
+class SchemaGraphOrderTests(SimpleTestCase):
+    def test_parents_and_fk_targets_go_first(self):
+        # aparecen al revés de como hay que insertarlos
+        graph = SchemaGraph(
+            ["Perro", "Mascota", "Animal", "Dueno"],
+            inheritance={"perro": "mascota", "mascota": "animal"},
+            composition=["perro.dueno_id"],
+        )
+        order = graph.order
+        self.assertEqual(sorted(order), ["animal", "dueno", "mascota", "perro"])
+        self.assertLess(order.index("animal"), order.index("mascota"))
+        self.assertLess(order.index("mascota"), order.index("perro"))
+        self.assertLess(order.index("dueno"), order.index("perro"))
+        self.assertEqual(graph.chain("perro"), ["animal", "mascota", "perro"])
+        self.assertEqual(graph.deferred, set())
+
+    def test_independent_tables_keep_declaration_order(self):
+        graph = SchemaGraph(["C", "A", "B"])
+        self.assertEqual(graph.order, ["c", "a", "b"])
+
+    def test_cycle_is_broken_through_an_aggregation(self):
+        # pedido -(composición)-> cliente -(agregación)-> pedido
+        graph = SchemaGraph(
+            ["Pedido", "Cliente"],
+            aggregation=["cliente.pedido_id"],
+            composition=["pedido.cliente_id"],
+        )
+        self.assertEqual(graph.deferred, {"cliente.pedido_id"})
+        self.assertEqual(graph.order, ["cliente", "pedido"])
+
+        fixtures = {
+            "fixtures": {
+                "Pedido": [{"id": 1, "cliente_id": 10}],
+                "Cliente": [{"id": 10, "pedido_id": 1}],
+            }
+        }
+        tables = _inserts(iter_sql(fixtures, {}, ["cliente.pedido_id"], ["pedido.cliente_id"], []))
+        self.assertEqual([t for t, _, _ in tables], ["cliente", "pedido"])
+        _, cols, rows = tables[0]
+        self.assertEqual(rows[0][cols.index("pedido_id")], "NULL")  # se anula la que cierra el ciclo
+
+    def test_composition_only_cycle_raises(self):
+        with self.assertRaises(SchemaCycle) as ctx:
+            SchemaGraph(
+                ["A", "B", "C"],
+                composition=["a.b_id", "b.c_id", "c.a_id"],
+            )
+        cycle = ctx.exception.cycle
+        self.assertEqual(cycle[0], cycle[-1])
+        self.assertEqual(set(cycle), {"a", "b", "c"})
+
+    def test_inheritance_cycle_raises_even_with_aggregations(self):
+        with self.assertRaises(SchemaCycle):
+            SchemaGraph(["A", "B"], inheritance={"a": "b", "b": "a"}, aggregation=["a.b_id"])
+
+
+class JoinedInheritanceSqlTests(SimpleTestCase):
+    diagram = {
+        "classes": [
+            {"name": "Perro", "attributes": ["raza: String"]},
+            {"name": "Animal", "attributes": ["nombre: String", "edad: int"]},
+            {"name": "Dueno", "attributes": ["nombre: String"]},
+        ],
+        "relationships": [
+            _rel("Perro", "Animal", "generalization"),
+            _rel("Perro", "Dueno", "composition"),
+        ],
+    }
+
+    def _sql(self, count: int = 4):
+        lazy, ids = iter_fixtures(self.diagram, count, seed=3)
+        return _inserts(
+            iter_sql(lazy, *analyze_relationships(self.diagram), table_ids=ids, seed=3)
+        )
+
+    def test_subclass_rows_reuse_the_parent_id(self):
+        tables = {t: (cols, rows) for t, cols, rows in self._sql()}
+        order = [t for t, _, _ in self._sql()]
+        self.assertLess(order.index("animal"), order.index("perro"))
+        self.assertLess(order.index("dueno"), order.index("perro"))
+
+        animal_cols, animal_rows = tables["animal"]
+        perro_cols, perro_rows = tables["perro"]
+        # cada tabla solo con sus columnas propias (+ FKs)
+        self.assertEqual(animal_cols, ["id", "nombre", "edad"])
+        self.assertEqual(perro_cols, ["id", "raza", "dueno_id"])
+
+        animal_ids = {r[0] for r in animal_rows}
+        perro_ids = [r[0] for r in perro_rows]
+        self.assertEqual(len(perro_ids), 4)
+        self.assertTrue(set(perro_ids) <= animal_ids)  # mismo id que su fila padre
+        self.assertEqual(len(animal_ids), 8)  # 4 animales propios + 4 perros
+
+        dueno_ids = {r[0] for r in tables["dueno"][1]}
+        self.assertTrue({r[-1] for r in perro_rows} <= dueno_ids)
+
+
+class FlagParsingTests(SimpleTestCase):
+    def test_accepts_json_and_form_booleans(self):
+        for value in (True, 1, "1", "true", "True", "yes", "on"):
+            self.assertIs(_flag(value), True, value)
+        for value in (False, 0, "0", "false", "FALSE", "no", "off", ""):
+            self.assertIs(_flag(value), False, value)
+
+    def test_rejects_anything_else(self):
+        for value in ("si", "2", 2, None, [], {}):
+            with self.assertRaises(ValueError):
+                _flag(value)
+
+
+class DiagramShapeTests(SimpleTestCase):
+    def test_well_formed_diagram_passes(self):
+        self.assertIsNone(_diagram_error(JoinedInheritanceSqlTests.diagram))
+        self.assertIsNone(_diagram_error({"classes": [{"name": "A"}]}))
+
+    def test_malformed_diagrams_are_described(self):
+        for diagram in (
+            ["x"],
+            {"classes": "A"},
+            {"classes": ["A"]},
+            {"classes": [{"name": "A", "attributes": "id: int"}]},
+            {"relationships": {"a": 1}},
+            {"relationships": [{"targetName": "A", "type": "composition"}]},
+            {"relationships": [_rel("A", "B", "association", cardinality="1..*")]},
+        ):
+            with self.subTest(diagram=diagram):
+                self.assertIsInstance(_diagram_error(diagram), str)
+
+    @override_settings(FIXTURE_ENGINE="local")
+    def test_local_engine_answers_400(self):
+        bad_rel = {"classes": [{"name": "A"}], "relationships": [{"targetName": "A", "type": "composition"}]}
+        for url in (
+            "/api/fixtures/generate/",
+            "/api/fixtures/generate-sql/",
+            "/api/fixtures/generate-sql/stream/",
+        ):
+            for diagram in (["x"], bad_rel):
+                with self.subTest(url=url, diagram=diagram):
+                    res = self.client.post(url, {"diagram": diagram}, content_type="application/json")
+                    self.assertEqual(res.status_code, 400)
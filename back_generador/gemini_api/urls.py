@@ -1,7 +1,18 @@
 from django.urls import path
-from .views import FixtureGeneratorJSONView, FixtureGeneratorSQLView
+from .views import (
+    FixtureGeneratorJSONView,
+    FixtureGeneratorSQLView,
+    FixtureJobDetailView,
+    FixtureJobListView,
+    FixtureSQLStreamView,
+    GeminiCacheStatsView,
+)
 
 urlpatterns = [
     path("generate/", FixtureGeneratorJSONView.as_view(), name="fixture-generate-json"),
     path("generate-sql/", FixtureGeneratorSQLView.as_view(), name="fixture-generate-sql"),
+    path("generate-sql/stream/", FixtureSQLStreamView.as_view(), name="fixture-generate-sql-stream"),
+    path("jobs/", FixtureJobListView.as_view(), name="fixture-jobs"),
+    path("jobs/<str:job_id>/", FixtureJobDetailView.as_view(), name="fixture-job-detail"),
+    path("cache/stats/", GeminiCacheStatsView.as_view(), name="gemini-cache-stats"),
 ]
@@ -1,21 +1,117 @@
+import json
+import zlib
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .service.gemini_fixtures import generate_test_data_with_gemini, fixtures_to_sql
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from .service.cache import get_cache
+from .service.jobs import KINDS, QueueFull, get_queue
+from .service.fixture_synth import gemini_vocabularies, iter_fixtures, synthesize
+from .service.gemini_fixtures import analyze_relationships, generate_test_data_with_gemini, fixtures_to_sql
+from .service.schema_graph import SchemaCycle
+from .service.sql_emitter import COPY, INSERT, iter_sql
+
+
+_TRUE = ("1", "true", "yes", "on")
+_FALSE = ("0", "false", "no", "off", "")
+
+
+def _flag(value) -> bool:
+    """Booleano del body (JSON o form): "false" y "0" son False; otro valor raro, ValueError."""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in _TRUE + _FALSE:
+        return value.strip().lower() in _TRUE
+    raise ValueError(value)
+
+
+def _diagram_error(diagram):
+    """
+    Motivo por el que el diagrama no tiene la forma que esperan el sintetizador
+    y analyze_relationships, o None si está bien.
+    """
+    if not isinstance(diagram, dict):
+        return "El diagrama debe ser un objeto"
+    classes = diagram.get("classes") or []
+    if not isinstance(classes, list) or not all(isinstance(c, dict) for c in classes):
+        return "classes debe ser una lista de objetos"
+    if any(not isinstance(c.get("attributes") or [], list) for c in classes):
+        return "attributes debe ser una lista"
+    relationships = diagram.get("relationships") or []
+    if not isinstance(relationships, list):
+        return "relationships debe ser una lista"
+    for i, rel in enumerate(relationships):
+        if not isinstance(rel, dict) or not all(
+            isinstance(rel.get(k), str) for k in ("sourceName", "targetName", "type")
+        ):
+            return f"relationships[{i}] necesita sourceName, targetName y type"
+        if not isinstance(rel.get("cardinality") or {}, dict):
+            return f"relationships[{i}].cardinality debe ser un objeto"
+    return None
+
+
+def _diagram_param(request):
+    """El diagrama del body, o un Response 400 si falta o está mal formado."""
+    diagram = request.data.get("diagram")
+    if not diagram:
+        return Response({"error": "Falta el diagrama UML"}, status=status.HTTP_400_BAD_REQUEST)
+    error = _diagram_error(diagram)
+    if error:
+        return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+    return diagram
+
+
+def _fixture_params(request, max_count: int = None):
+    """(engine, count, seed, vocab) del body, o un Response 400 si no son válidos."""
+    max_count = max_count or settings.FIXTURE_MAX_COUNT
+    engine = request.data.get("engine", settings.FIXTURE_ENGINE)
+    if engine not in ("local", "gemini"):
+        return Response({"error": "engine debe ser 'local' o 'gemini'"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        count = int(request.data.get("count", 5))
+        seed = int(request.data.get("seed", 0))
+    except (TypeError, ValueError):
+        return Response({"error": "count y seed deben ser enteros"}, status=status.HTTP_400_BAD_REQUEST)
+    if not 0 < count <= max_count:
+        return Response(
+            {"error": f"count debe estar entre 1 y {max_count}"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    try:
+        vocab = _flag(request.data.get("vocab", False))
+    except ValueError:
+        return Response({"error": "vocab debe ser booleano"}, status=status.HTTP_400_BAD_REQUEST)
+    return engine, count, seed, vocab
+
+
+def _fixtures(diagram, engine, count, seed, vocab):
+    if engine == "gemini":
+        return generate_test_data_with_gemini(diagram, count)
+    return synthesize(diagram, count, seed=seed, vocab=vocab)
 
 
 class FixtureGeneratorJSONView(APIView):
     """
     Genera datos de prueba en formato JSON (fixtures).
+    engine "local" (por defecto) es reproducible con seed; "gemini" pide los registros al modelo.
     """
     def post(self, request):
-        diagram = request.data.get("diagram")
-        count = request.data.get("count", 5)
+        diagram = _diagram_param(request)
+        if isinstance(diagram, Response):
+            return diagram
 
-        if not diagram:
-            return Response({"error": "Falta el diagrama UML"}, status=status.HTTP_400_BAD_REQUEST)
+        params = _fixture_params(request)
+        if isinstance(params, Response):
+            return params
 
-        result = generate_test_data_with_gemini(diagram, count)
+        try:
+            result = _fixtures(diagram, *params)
+        except SchemaCycle as e:
+            return Response({"error": str(e), "cycle": e.cycle}, status=status.HTTP_400_BAD_REQUEST)
         return Response(result, status=status.HTTP_200_OK)
 
 
@@ -24,16 +120,183 @@ class FixtureGeneratorSQLView(APIView):
     Genera datos de prueba en formato SQL (INSERT statements).
     """
     def post(self, request):
-        diagram = request.data.get("diagram")
-        count = request.data.get("count", 5)
+        diagram = _diagram_param(request)
+        if isinstance(diagram, Response):
+            return diagram
 
-        if not diagram:
-            return Response({"error": "Falta el diagrama UML"}, status=status.HTTP_400_BAD_REQUEST)
+        params = _fixture_params(request)
+        if isinstance(params, Response):
+            return params
 
-        result = generate_test_data_with_gemini(diagram, count)
+        try:
+            result = _fixtures(diagram, *params)
+            if "error" in result:
+                return Response(result, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            sql_statements = fixtures_to_sql(result, *analyze_relationships(diagram))
+        except SchemaCycle as e:
+            return Response({"error": str(e), "cycle": e.cycle}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"sql": sql_statements}, status=status.HTTP_200_OK)
 
-        if "error" in result:
-            return Response(result, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        sql_statements = fixtures_to_sql(result)
-        return Response({"sql": sql_statements}, status=status.HTTP_200_OK)
+async def _aiter_chunks(chunks):
+    # Bajo ASGI Django junta en una lista los iteradores síncronos antes de
+    # mandarlos; así se consume de a un trozo en un hilo del pool y la
+    # memoria no depende del tamaño total
+    next_chunk = sync_to_async(next, thread_sensitive=False)
+    while True:
+        chunk = await next_chunk(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def _ndjson(statements):
+    for sql in statements:
+        yield json.dumps({"sql": sql}, ensure_ascii=False) + "\n"
+
+
+def _text(statements):
+    for sql in statements:
+        yield sql + "\n\n"
+
+
+def _chain(first, rest):
+    if first is not None:
+        yield first
+        yield from rest
+
+
+def _gzip(chunks):
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: formato gzip
+    for chunk in chunks:
+        out = z.compress(chunk.encode("utf-8"))
+        if out:
+            yield out
+    yield z.flush()
+
+
+class FixtureSQLStreamView(APIView):
+    """
+    Genera el SQL de los fixtures y lo va mandando por lotes a medida que se
+    produce (text/plain o NDJSON, opcionalmente gzip), con memoria constante
+    sin importar count. Con engine "local" las filas también se generan de a
+    una; con "gemini" el tamaño lo limita la respuesta del modelo.
+    """
+    def post(self, request):
+        diagram = _diagram_param(request)
+        if isinstance(diagram, Response):
+            return diagram
+        out_format = request.data.get("format", "text")
+        sql_format = request.data.get("sqlFormat", INSERT)
+        if out_format not in ("text", "ndjson"):
+            return Response({"error": "format debe ser 'text' o 'ndjson'"}, status=status.HTTP_400_BAD_REQUEST)
+        if sql_format not in (INSERT, COPY):
+            return Response({"error": "sqlFormat debe ser 'insert' o 'copy'"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            gzip = _flag(request.data.get("gzip", False))
+        except ValueError:
+            return Response({"error": "gzip debe ser booleano"}, status=status.HTTP_400_BAD_REQUEST)
+
+        params = _fixture_params(request, settings.FIXTURE_STREAM_MAX_COUNT)
+        if isinstance(params, Response):
+            return params
+        engine, count, seed, vocab = params
+
+        try:
+            relationships = analyze_relationships(diagram)
+            if engine == "gemini":
+                result = generate_test_data_with_gemini(diagram, count)
+                if "error" in result:
+                    return Response(result, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                statements = iter_sql(result, *relationships, fmt=sql_format)
+            else:
+                vocabularies = gemini_vocabularies(diagram) if vocab else None
+                lazy, ids = iter_fixtures(diagram, count, seed, vocabularies)
+                statements = iter_sql(lazy, *relationships, fmt=sql_format, seed=seed, table_ids=ids)
+            # el primer lote se arma acá: los errores de esquema (ciclos, FKs
+            # sin tabla destino, relaciones mal formadas) salen como 400 y no
+            # a mitad del stream
+            first = next(statements, None)
+        except (SchemaCycle, ValueError, KeyError, TypeError, AttributeError) as e:
+            body = {"error": str(e)}
+            if isinstance(e, SchemaCycle):
+                body["cycle"] = e.cycle
+            return Response(body, status=status.HTTP_400_BAD_REQUEST)
+
+        statements = _chain(first, statements)
+        chunks = _ndjson(statements) if out_format == "ndjson" else _text(statements)
+        gzip = gzip and "gzip" in request.headers.get("Accept-Encoding", "")
+        if gzip:
+            chunks = _gzip(chunks)
+
+        response = StreamingHttpResponse(
+            _aiter_chunks(chunks),
+            content_type=(
+                "application/x-ndjson; charset=utf-8" if out_format == "ndjson" else "text/plain; charset=utf-8"
+            ),
+        )
+        if gzip:
+            response["Content-Encoding"] = "gzip"
+        response["Vary"] = "Accept-Encoding"
+        response["X-Accel-Buffering"] = "no"  # que nginx no junte la respuesta
+        response["Content-Disposition"] = 'inline; filename="fixtures.sql"'
+        return response
+
+
+class FixtureJobListView(APIView):
+    """
+    Encola la generación de fixtures y responde de inmediato con el jobId.
+    El progreso se consulta en jobs/<id>/ o por ws/fixtures/jobs/<id>/.
+    """
+    def post(self, request):
+        diagram = _diagram_param(request)
+        if isinstance(diagram, Response):
+            return diagram
+        kind = request.data.get("format", "json")
+        if kind not in KINDS:
+            return Response({"error": "format debe ser 'json' o 'sql'"}, status=status.HTTP_400_BAD_REQUEST)
+
+        params = _fixture_params(request)
+        if isinstance(params, Response):
+            return params
+        engine, count, seed, vocab = params
+
+        try:
+            job, created = get_queue().submit(
+                kind, diagram, {"engine": engine, "count": count, "seed": seed, "vocab": vocab}
+            )
+        except QueueFull:
+            return Response(
+                {"error": "Demasiados trabajos en curso, intenta en unos segundos"},
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={"Retry-After": "5"},
+            )
+        return Response({**job.to_dict(), "deduplicated": not created}, status=status.HTTP_202_ACCEPTED)
+
+    def get(self, request):
+        return Response(get_queue().stats(), status=status.HTTP_200_OK)
+
+
+class FixtureJobDetailView(APIView):
+    """
+    Estado de un trabajo (con el resultado cuando terminó) y cancelación.
+    """
+    def get(self, request, job_id):
+        job = get_queue().get(job_id)
+        if job is None:
+            return Response({"error": "Trabajo no encontrado"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(job.to_dict(with_result=True), status=status.HTTP_200_OK)
+
+    def delete(self, request, job_id):
+        job = get_queue().cancel(job_id)
+        if job is None:
+            return Response({"error": "Trabajo no encontrado"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(job.to_dict(), status=status.HTTP_200_OK)
+
+
+class GeminiCacheStatsView(APIView):
+    """
+    Contadores de la caché de respuestas de Gemini (hits, misses, latencias).
+    """
+    def get(self, request):
+        return Response(get_cache().stats(), status=status.HTTP_200_OK)
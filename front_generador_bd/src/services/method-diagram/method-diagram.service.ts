@@ -2,7 +2,7 @@ import { HttpClient } from '@angular/common/http';
 import { inject, Injectable } from '@angular/core';
 import { environment } from '../../environments/environment';
 import { diagramaCreate, diagramaResponse } from '../../models/diagrama.model';
-import { Observable } from 'rxjs';
+import { EMPTY, Observable, expand, map, reduce } from 'rxjs';
 import { DiagramWsService } from '../realtime/diagram-ws.service';
 import { DiagramService } from '../diagram.service';
 
@@ -36,7 +36,17 @@ export class MethodDiagramService {
   }
 
 
+  // El backend pagina (next = cursor de la página siguiente): se siguen
+  // todas las páginas y se devuelve la lista completa
   listDiagrams(): Observable<{ data: diagramaResponse[] }> {
-    return this.http.get<{ data: diagramaResponse[] }>(`${this.API}/api/rooms/listar/`);
+    const url = `${this.API}/api/rooms/listar/`;
+    type Page = { data: diagramaResponse[]; next: string | null };
+    return this.http.get<Page>(url).pipe(
+      expand(page => page.next
+        ? this.http.get<Page>(url, { params: { cursor: page.next } })
+        : EMPTY),
+      reduce((all, page) => all.concat(page.data), [] as diagramaResponse[]),
+      map(data => ({ data }))
+    );
   }
 }
@@ -1,5 +1,5 @@
 import { Injectable } from '@angular/core';
-import { Subject } from 'rxjs';
+import { BehaviorSubject, Subject } from 'rxjs';
 
 type XY = { x: number; y: number };
 type Size = { width: number; height: number };
@@ -48,6 +48,10 @@ export type DiagramOp =
 
 type Snapshot = { nodes: Record<string, NodeData>; links: Record<string, LinkData> };
 
+export type PresenceMember = { id: string; userId?: number | null; cursor?: XY; selection?: string[] };
+
+const HEARTBEAT_MS = 10000;
+
 function genCid(): string {
   // suficiente para correlacionar acks
   return Math.random().toString(36).slice(2) + Date.now().toString(36);
@@ -60,6 +64,8 @@ export class DiagramWsService {
   private version = 0;
   private inFlight = false;
   private queue: DiagramOp[] = [];
+  // la op en vuelo quedó en duda (sala sin dueño): se hace sync antes de reenviarla
+  private resyncing = false;
 
   // Eventos de diagramas
   snapshot$ = new Subject<{ version: number; snapshot: Snapshot }>();
@@ -67,6 +73,10 @@ export class DiagramWsService {
   drag$ = new Subject<{ id: string; pos: XY; userId: number | null }>();
   dragEnd$ = new Subject<{ id: string; pos: XY; userId: number | null }>();
   presence$ = new Subject<{ userId: number | null; state: 'join' | 'leave' }>();
+  // roster completo de la sala (memberId -> estado), se actualiza con cada diff
+  roster$ = new BehaviorSubject<Record<string, PresenceMember>>({});
+  memberId: string | null = null;
+  private heartbeat?: ReturnType<typeof setInterval>;
 
   // Eventos de rooms (chat)
   message$ = new Subject<{ userId: number | null; content: string }>();
@@ -81,7 +91,11 @@ export class DiagramWsService {
     }
     this.ws = undefined;
     this.inFlight = false;
+    this.resyncing = false;
     this.queue = [];
+    if (this.heartbeat) clearInterval(this.heartbeat);
+    this.heartbeat = undefined;
+    this.roster$.next({});
   }
 
   // ====== Conectar a un diagrama ======
@@ -102,7 +116,10 @@ export class DiagramWsService {
     try {
       console.log("🌐 Conectando a:", url);
       this.ws = new WebSocket(url);
-      this.ws.onopen = () => this.sendRaw({ cmd: 'init' });
+      this.ws.onopen = () => {
+        this.sendRaw({ cmd: 'init' });
+        this.heartbeat = setInterval(() => this.sendRaw({ cmd: 'heartbeat' }), HEARTBEAT_MS);
+      };
       this.setupListeners();
     } catch (error) {
       console.log('Error');
@@ -148,7 +165,12 @@ export class DiagramWsService {
           this.version = msg.version ?? 0;
           const snapshot: Snapshot = msg.snapshot ?? { nodes: {}, links: {} };
           this.snapshot$.next({ version: this.version, snapshot });
+          if (Array.isArray(msg.roster)) {
+            this.memberId = msg.memberId ?? this.memberId;
+            this.roster$.next(Object.fromEntries(msg.roster.map((m: PresenceMember) => [m.id, m])));
+          }
           this.inFlight = false;
+          this.resyncing = false;
           this.kick();
           break;
         }
@@ -169,17 +191,55 @@ export class DiagramWsService {
           break;
         }
         case 'conflict': {
+          if (Array.isArray(msg.ops)) {
+            // solo llegan las ops que nos faltaban
+            this.applyMissingOps(msg.ops);
+          } else {
+            const snapshot: Snapshot = msg.snapshot ?? { nodes: {}, links: {} };
+            this.snapshot$.next({ version: msg.currentVersion ?? this.version, snapshot });
+          }
           this.version = msg.currentVersion ?? this.version;
-          const snapshot: Snapshot = msg.snapshot ?? { nodes: {}, links: {} };
-          this.snapshot$.next({ version: this.version, snapshot });
           this.inFlight = false;
           this.kick();
           break;
         }
+        case 'ops': {
+          // respuesta a { cmd: 'sync', sinceVersion }
+          const ops: { version: number; op: DiagramOp; userId: number | null }[] = msg.ops ?? [];
+          // si la op en duda ya está en el log, se toma como confirmada (ya está aplicada local)
+          const reply = this.resyncing && msg.sync === true;  // no un lote difundido por otro
+          const cid = reply ? this.queue[0]?.cid : undefined;
+          const mine = cid ? ops.some(o => o.op?.cid === cid) : false;
+          this.applyMissingOps(mine ? ops.filter(o => o.op?.cid !== cid) : ops);
+          this.version = msg.version ?? this.version;
+          if (reply) {
+            if (mine) this.queue.shift();
+            this.resyncing = false;
+            this.inFlight = false;
+            this.kick();
+          }
+          break;
+        }
+        case 'error': {
+          if (msg.sync && this.inFlight && !this.resyncing) {
+            // el servidor no sabe si aplicó la op: primero ponerse al día
+            this.resyncing = true;
+            this.sync();
+          }
+          this.error$.next({ type: 'server', message: msg.message });
+          break;
+        }
         case 'drag': {
           this.drag$.next({ id: msg.id, pos: msg.pos, userId: msg.userId ?? null });
           break;
         }
+        case 'drag_batch': {
+          // posiciones coalescidas por el servidor (una por node)
+          for (const it of msg.items ?? []) {
+            this.drag$.next({ id: it.id, pos: it.pos, userId: msg.userId ?? null });
+          }
+          break;
+        }
         case 'drag_end': {
           this.dragEnd$.next({ id: msg.id, pos: msg.pos, userId: msg.userId ?? null });
           break;
@@ -188,6 +248,10 @@ export class DiagramWsService {
           this.presence$.next({ userId: msg.userId ?? null, state: msg.state });
           break;
         }
+        case 'presence_diff': {
+          this.applyPresenceDiff(msg.upsert ?? [], msg.remove ?? []);
+          break;
+        }
 
         // === Rooms ===
         case 'message': {
@@ -201,6 +265,37 @@ export class DiagramWsService {
     }
   }
 
+  private applyMissingOps(ops: { version: number; op: DiagramOp; userId: number | null }[]) {
+    for (const o of ops) {
+      this.version = o.version;
+      this.op$.next({ version: o.version, op: o.op, userId: o.userId ?? null });
+    }
+  }
+
+  private applyPresenceDiff(upsert: PresenceMember[], remove: string[]) {
+    const roster = { ...this.roster$.value };
+    for (const m of upsert) {
+      if (!roster[m.id]) this.presence$.next({ userId: m.userId ?? null, state: 'join' });
+      roster[m.id] = m;
+    }
+    for (const id of remove) {
+      const gone = roster[id];
+      if (gone) this.presence$.next({ userId: gone.userId ?? null, state: 'leave' });
+      delete roster[id];
+    }
+    this.roster$.next(roster);
+  }
+
+  // Cursor y/o selección propios; el servidor los agrupa y difunde por ticks
+  sendPresence(state: { cursor?: XY; selection?: string[] }) {
+    this.sendRaw({ cmd: 'presence', ...state });
+  }
+
+  // Reanudar desde la versión local sin pedir el snapshot completo
+  sync() {
+    this.sendRaw({ cmd: 'sync', sinceVersion: this.version });
+  }
+
   //para mensajes
   sendMessage(content: string) {
     this.sendRaw({ cmd: 'message', content });